@@ -0,0 +1,29 @@
+"""Simulate an hour of a device rotating through its apps and count the
+upstream calls of tasks on their fixed intervals vs demand-driven refreshes
+(demand.RotationTracker), with and without the device's loop topic. Run from
+the repository root:
+
+    python -m benchmarks.bench_demand
+"""
+
+from tests.support import ROTATION, ROTATION_TASKS, compare_refreshes
+
+
+def main():
+    for send_loop in (True, False):
+        (fixed, _), (demand, demand_age) = compare_refreshes(send_loop)
+        saved = sum(fixed.values()) - sum(demand.values())
+        print(
+            f"loop topic {'on' if send_loop else 'off'}: "
+            f"{sum(fixed.values())} -> {sum(demand.values())} calls/h, {saved} saved"
+        )
+        shown = dict(ROTATION)
+        for name in ROTATION_TASKS:
+            age = (
+                f"oldest data shown {demand_age[name]} s" if name in shown else "hidden"
+            )
+            print(f"  {name:<10} {fixed[name]:4} -> {demand[name]:4} calls/h, {age}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Payload size of draw frames sent as one raw bitmap (db) vs the commands of
+helpers.optimize_draw_commands, for contribution heatmaps of a few activity
+levels and edge cases. Run from the repository root:
+
+    python -m benchmarks.bench_draw
+"""
+
+import random
+
+from helpers import optimize_draw_commands
+from tasks.task_github_contributions import generate_packed_pixels
+from tests.support import (
+    FRAME_HEIGHT,
+    FRAME_WIDTH,
+    contributions,
+    draw_size,
+    raw_commands,
+)
+
+
+def frames():
+    """label -> packed pixels of a 32x8 frame"""
+    rng = random.Random(3)
+    result = {
+        f"heatmap {ratio:.0%} active": generate_packed_pixels(
+            contributions(365, ratio, seed=1)
+        )
+        for ratio in (0.05, 0.3, 0.8)
+    }
+    result["heatmap split by month"] = generate_packed_pixels(
+        contributions(365, 0.2, seed=2), split_by_month=True
+    )
+    result["no contributions"] = generate_packed_pixels([])
+    result["solid"] = [0] * (FRAME_WIDTH * FRAME_HEIGHT)
+    result["noise"] = [
+        rng.randrange(1 << 24) for _ in range(FRAME_WIDTH * FRAME_HEIGHT)
+    ]
+    return result
+
+
+def main():
+    for label, pixels in frames().items():
+        raw = draw_size(raw_commands(pixels))
+        optimized = draw_size(
+            optimize_draw_commands(0, 0, FRAME_WIDTH, FRAME_HEIGHT, pixels)
+        )
+        print(f"{label:<24} {raw:5} -> {optimized:5} bytes ({optimized / raw:.0%})")
+
+
+if __name__ == "__main__":
+    main()
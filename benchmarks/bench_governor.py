@@ -0,0 +1,31 @@
+"""Run many short tasks (one GET each to a local upstream) through the
+governor: throughput, worker threads, concurrent requests (capped by
+host_concurrency of the config) and how evenly completions spread over time.
+Run from the repository root:
+
+    python -m benchmarks.bench_governor [tasks] [max_workers]
+"""
+
+import statistics
+import sys
+
+from config import get_app_config
+from tests.support import run_governor_workload
+
+
+def main():
+    tasks = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    stats = run_governor_workload(tasks, max_workers)
+    steady = stats["steady"]
+    print(
+        f"{tasks} tasks in {stats['elapsed']:.2f}s ({tasks / stats['elapsed']:.0f}/s), "
+        f"max {stats['max_threads']} governor threads, "
+        f"max {stats['max_in_flight']} concurrent requests "
+        f"(host_concurrency {get_app_config()['host_concurrency']}), "
+        f"per 100 ms: min {min(steady)} / median {statistics.median(steady)}"
+    )
+
+
+if __name__ == "__main__":
+    main()
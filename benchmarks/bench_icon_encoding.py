@@ -0,0 +1,67 @@
+"""Payload size and color error of every icon encoding (see helpers.icon_candidates)
+for a few kinds of source images, and the encoding picked for icons. Run from
+the repository root:
+
+    python -m benchmarks.bench_icon_encoding [max_error]
+"""
+
+import sys
+
+import cv2
+import numpy as np
+
+import helpers
+from tests.support import make_image
+
+TARGET_SIZE = (8, 8)
+
+
+def make_identicon(size):
+    """GitHub-style default avatar: 5x5 symmetric blocks of one color on grey"""
+    rng = np.random.default_rng(7)
+    cells = rng.integers(0, 2, (5, 3))
+    cells = np.hstack([cells, cells[:, 1::-1]])
+    image = np.full((5, 5, 3), 240, np.uint8)
+    image[cells == 1] = (80, 170, 40)
+    image = cv2.resize(image, (size, size), interpolation=cv2.INTER_NEAREST)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+def make_logo(size):
+    """Flat logo: a few solid shapes on white"""
+    image = np.full((size, size, 3), 255, np.uint8)
+    cv2.circle(image, (size // 2, size // 2), size * 2 // 5, (96, 215, 30), -1)
+    cv2.rectangle(image, (size // 4, size // 3), (size * 3 // 4, size // 2), 0, -1)
+    return cv2.imencode(".png", image)[1].tobytes()
+
+
+SOURCES = {
+    "photo (album art)": make_image(640, ".jpg"),
+    "identicon (avatar)": make_identicon(420),
+    "logo": make_logo(256),
+}
+
+
+def main():
+    max_error = float(sys.argv[1]) if len(sys.argv) > 1 else 6
+    for label, data in SOURCES.items():
+        image = helpers.decode_image(data, TARGET_SIZE)
+        candidates = helpers.icon_candidates(image)
+        chosen = helpers.encode_icon(image, max_error)
+        print(f"{label}:")
+        for candidate in sorted(candidates, key=lambda c: c["size"]):
+            marker = " <- icon" if candidate["name"] == chosen["name"] else ""
+            print(
+                f"  {candidate['name']:<16} {candidate['size']:>5} bytes"
+                f"  error {candidate['error']:5.2f}{marker}"
+            )
+        default = candidates[0]
+        print(
+            f"  icon: {default['size']} -> {chosen['size']} bytes "
+            f"({chosen['size'] / default['size']:.0%}), "
+            f"error {default['error']:.2f} -> {chosen['error']:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Compare the icon pipeline (streamed, size-capped download of the smallest
+source, reduced-resolution decode, area resize) with a full download and
+full decode, against a local image server. Run from the repository root:
+
+    python -m benchmarks.bench_icons [repeats]
+"""
+
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+import requests
+
+import helpers
+from tests.support import ImageServer
+
+TARGET_SIZE = (8, 8)
+
+
+def old_pipeline(url):
+    data = requests.get(url).content
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    cv2.resize(image, TARGET_SIZE)
+    return len(data), time.perf_counter() - start
+
+
+def new_pipeline(url):
+    data = helpers.download_image(url)
+    start = time.perf_counter()
+    helpers.decode_image(data, TARGET_SIZE)
+    return len(data), time.perf_counter() - start
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    icons = {
+        "github avatar 460px jpg": ("avatar.jpg", 460, ".jpg", True),
+        "album art 640px jpg": ("album640.jpg", 640, ".jpg", False),
+        "album art 300px jpg": ("album300.jpg", 300, ".jpg", False),
+        "album art 64px jpg": ("album64.jpg", 64, ".jpg", False),
+        "avatar 400px png": ("avatar.png", 400, ".png", False),
+    }
+    server = ImageServer({name: (size, ext) for name, size, ext, _ in icons.values()})
+
+    print(
+        f"{'icon':<26} {'bytes before':>13} {'bytes after':>12}"
+        f" {'decode before':>14} {'decode after':>13}"
+    )
+    for label, (name, _, _, github) in icons.items():
+        url = f"{server.base}/{name}"
+        before = [old_pipeline(url) for _ in range(repeats)]
+        if github:
+            # What sized_image_url asks avatars.githubusercontent.com for
+            url += f"?s={max(TARGET_SIZE) * helpers.IMAGE_OVERSAMPLE}"
+        after = [new_pipeline(url) for _ in range(repeats)]
+        print(
+            f"{label:<26} {before[0][0]:>13} {after[0][0]:>12}"
+            f" {statistics.median(t for _, t in before) * 1000:>11.3f} ms"
+            f" {statistics.median(t for _, t in after) * 1000:>10.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
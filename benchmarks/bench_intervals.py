@@ -0,0 +1,94 @@
+"""Simulate a month of polling with fixed and learned intervals (adaptive_interval)
+for values that change like a fuel price, a follower count, the AQI and the
+players on a game server, and report upstream calls and staleness (time from a
+change until a poll sees it). Run from the repository root:
+
+    python -m benchmarks.bench_intervals [days]
+"""
+
+import random
+import statistics
+import sys
+
+from tasks.base import BaseTask
+
+DAY = 86400
+
+# name: (mean seconds between changes, interval, min_interval, max_interval)
+SERIES = {
+    "gas_price": (10 * DAY, 1200, 1200, 6 * 3600),
+    "followers": (DAY / 4, 3600, 1800, 4 * 3600),
+    "air_quality": (3600, 1200, 600, 3600),
+    "players_online": (300, 600, 120, 1800),
+}
+
+
+class SimulatedTask(BaseTask):
+    def fetch_data(self):
+        pass
+
+    def create_mqtt_message(self, data):
+        pass
+
+
+def change_times(mean, days, rng):
+    """Random (Poisson) change times of a value"""
+    times = []
+    t = rng.expovariate(1 / mean)
+    while t < days * DAY:
+        times.append(t)
+        t += rng.expovariate(1 / mean)
+    return times
+
+
+def simulate(changes, days, next_interval):
+    """Poll until the end, return the number of polls and the staleness of each change"""
+    polls = []
+    t = 0.0
+    seen = 0
+    while t < days * DAY:
+        polls.append(t)
+        version = sum(1 for c in changes if c <= t)
+        t += next_interval(t, version != seen)
+        seen = version
+    staleness = []
+    for change in changes:
+        first_poll = next((p for p in polls if p >= change), None)
+        if first_poll is not None:
+            staleness.append(first_poll - change)
+    return len(polls), staleness
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    rng = random.Random(1)
+    print(f"{days} days, staleness in minutes (mean / max)")
+    for name, (mean, interval, min_interval, max_interval) in SERIES.items():
+        changes = change_times(mean, days, rng)
+        task = SimulatedTask(f"simulated_{name}")
+        task.configure(
+            {
+                "interval": interval,
+                "adaptive_interval": True,
+                "min_interval": min_interval,
+                "max_interval": max_interval,
+            }
+        )
+        results = {
+            "fixed": simulate(changes, days, lambda t, changed: interval),
+            "learned": simulate(
+                changes, days, lambda t, changed: task.learn_interval(changed, now=t)
+            ),
+        }
+        print(f"{name} ({len(changes)} changes):")
+        for label, (calls, staleness) in results.items():
+            print(
+                f"  {label:<8} {calls:6d} calls, staleness "
+                f"{statistics.mean(staleness) / 60:6.1f} / {max(staleness) / 60:6.1f}"
+            )
+        saved = results["fixed"][0] - results["learned"][0]
+        print(f"  calls saved: {saved} ({saved / results['fixed'][0]:.0%})")
+
+
+if __name__ == "__main__":
+    main()
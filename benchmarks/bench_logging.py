@@ -0,0 +1,118 @@
+"""Time the main loop spends logging the apps it sends each cycle: synchronous
+print of full payloads (before) vs the queued, truncated log pipeline (after),
+written to a slow stdout (e.g. journald on an SD card). Run from the
+repository root:
+
+    python -m benchmarks.bench_logging [cycles] [write latency in ms]
+"""
+
+import json
+import logging
+import random
+import statistics
+import sys
+import time
+
+import helpers
+import log
+from config import get_app_config
+from tests.support import make_image
+
+
+class SlowStream:
+    """stdout stand-in: every write takes `latency`, plus 1 ms per 100 KB"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.written = 0
+
+    def write(self, text):
+        time.sleep(self.latency + len(text) / 100_000_000)
+        self.written += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def make_payloads():
+    """Results of one cycle, like the apps of the example config"""
+    rng = random.Random(1)
+    palette = [0x161B22, 0x0E4429, 0x006D32, 0x26A641, 0x39D353]
+    contributions = [rng.choice(palette) for _ in range(32 * 8)]
+    icon = helpers.encode_icon(helpers.decode_image(make_image(640, ".jpg"), (8, 8)), 6)
+    results = {
+        "github_contributions": {
+            "draw": helpers.optimize_draw_commands(0, 0, 32, 8, contributions)
+        },
+        "github_followers": {"text": "1.2K", "icon": icon["payload"]},
+        "spotify_current_playback": {
+            "text": "Song - Artist",
+            "icon": icon["payload"],
+            "progress": 40,
+        },
+        "year_progress": {"text": "79.6%", "progress": 80},
+        "air_quality": {"text": "AQI 42", "icon": "2718"},
+        "network_speed": {"text": "1.2M/340K", "icon": "54591"},
+    }
+    return {name: json.dumps(r, ensure_ascii=False) for name, r in results.items()}
+
+
+def cycle_print(payloads):
+    for name, payload in payloads.items():
+        print(f"sending {name}:", payload)
+
+
+def cycle_log(payloads):
+    for name, payload in payloads.items():
+        if log.logger.isEnabledFor(logging.INFO):
+            log.logger.info(
+                "sending %s: %s",
+                name,
+                log.summarize_payload(payload),
+                extra={"rate_key": f"{name}.send"},
+            )
+
+
+def measure(cycle, payloads, cycles, stream):
+    times = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        cycle(payloads)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), max(times), stream.written / cycles
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.002
+    payloads = make_payloads()
+    print(
+        f"{len(payloads)} apps, {sum(map(len, payloads.values()))} payload chars "
+        f"per cycle, {latency * 1000:g} ms per stdout write"
+    )
+
+    stdout = sys.stdout
+    results = {}
+    try:
+        stream = sys.stdout = SlowStream(latency)
+        results["print (before)"] = measure(cycle_print, payloads, cycles, stream)
+
+        stream = sys.stdout = SlowStream(latency)
+        # Cycles are normally main_loop_interval apart, within the rate limit
+        log.configure(dict(get_app_config(), log_rate_limit=0))
+        median, worst, _ = measure(cycle_log, payloads, cycles, stream)
+        log.shutdown()  # Wait for the writer, to count what it wrote
+        results["log (after)"] = (median, worst, stream.written / cycles)
+    finally:
+        sys.stdout = stdout
+
+    for label, (median, worst, written) in results.items():
+        print(
+            f"{label:<15} median {median * 1000:7.3f} ms/cycle, "
+            f"max {worst * 1000:7.3f} ms, {written:7.0f} chars written/cycle"
+        )
+
+
+if __name__ == "__main__":
+    main()
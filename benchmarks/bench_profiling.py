@@ -0,0 +1,27 @@
+"""Cost of the profiling hooks on runs that are not profiled: profiling.start
+when profiling is off, on for other targets, and on but not sampled. Run from
+the repository root:
+
+    python -m benchmarks.bench_profiling [calls]
+"""
+
+import sys
+
+from tests.support import profiling_overhead
+
+SETTINGS = {
+    "off": (None, None),
+    "other target": ({"cycle"}, 1),
+    "not sampled": (set(), 0),
+}
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for label, (targets, ratio) in SETTINGS.items():
+        per_call = profiling_overhead(calls, targets, ratio)
+        print(f"{label:<13} {per_call * 1e6:6.3f} us/run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""When each result of a cycle is sent by main.run_and_publish: tasks sleep
+instead of fetching (a fast and a slow one), cached results need no run. A
+due result is sent as soon as every higher priority result is ready. Run from
+the repository root:
+
+    python -m benchmarks.bench_publish_order
+"""
+
+from tests.support import publish_cycle
+
+
+def main():
+    sent, _ = publish_cycle(["clock", "fast", "slow", "cached"], ["clock", "cached"])
+    for name, seconds in sent:
+        print(f"{name:<7} sent after {seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Throughput of the sharded runtime with 1, 2 and 4 worker processes: many
+CPU-bound tenants (render a 32x8 frame to draw commands, encode it to JSON)
+are split over the workers by shards.shard_of, and this process reads their
+results from the shared result table like the publisher does. Run from the
+repository root:
+
+    python -m benchmarks.bench_shards [tenants] [seconds]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import helpers
+from shards import SLOT_HEADER, SharedResultTable, shard_of
+
+PALETTE = [0x161B22, 0x0E4429, 0x006D32, 0x26A641, 0x39D353]
+
+
+def render(name, i):
+    rng = random.Random(f"{name}-{i}")
+    pixels = [rng.choice(PALETTE) for _ in range(32 * 8)]
+    return {"draw": helpers.optimize_draw_commands(0, 0, 32, 8, pixels)}
+
+
+def run_worker(shard, shards, table_spec, ready, seconds):
+    table = SharedResultTable(*table_spec)
+    names = [name for name in table.names if shard_of(name, shards) == shard]
+    ready.wait()  # Start together, once every worker has imported everything
+    stop_at = time.time() + seconds
+    i = 0
+    try:
+        while time.time() < stop_at:
+            for name in names:
+                table.put(name, render(name, i))
+            i += 1
+    finally:
+        table.close()
+
+
+def measure(shards, names, seconds):
+    context = multiprocessing.get_context("spawn")
+    table = SharedResultTable.create(names, 16384, context)
+    ready = context.Barrier(shards + 1)
+    workers = [
+        context.Process(
+            target=run_worker, args=(shard, shards, table.spec(), ready, seconds)
+        )
+        for shard in range(shards)
+    ]
+    for worker in workers:
+        worker.start()
+    published = 0
+    try:
+        ready.wait()
+        stop_at = time.time() + seconds
+        while time.time() < stop_at:
+            published += len(table.wait_changes(timeout=0.1))
+        for worker in workers:
+            worker.join()
+        written = sum(
+            SLOT_HEADER.unpack_from(table.shm.buf, slot * table.stride)[0]
+            for slot in range(len(names))
+        )
+    finally:
+        table.close()
+    return written / seconds, published / seconds
+
+
+def main():
+    tenants = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    names = [f"tenant{i}" for i in range(tenants)]
+    print(f"{tenants} tenants, {seconds:g} s per run, {os.cpu_count()} CPUs")
+    if (os.cpu_count() or 1) < 4:
+        # Workers beyond the CPU count only share the same cores
+        print("fewer CPUs than shards: the numbers do not show multi-core scaling")
+    baseline = None
+    for shards in (1, 2, 4):
+        written, published = measure(shards, names, seconds)
+        baseline = baseline or written
+        print(
+            f"{shards} shard(s): {written:8.1f} results/s ({written / baseline:.2f}x), "
+            f"{published:8.1f} read by the publisher/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Simulate an hour of Spotify playback (back-to-back tracks, then nothing
+playing) and compare polling every 10 s with the adaptive schedule of the
+Spotify task: API calls per hour and how long a track change takes to show.
+Run from the repository root:
+
+    python -m benchmarks.bench_spotify_polling
+"""
+
+from tests.support import (
+    FIXED_POLL_INTERVAL,
+    adaptive_polls,
+    build_timeline,
+    fixed_polls,
+    measure_polls,
+)
+
+
+def main():
+    timeline = build_timeline()
+    for label, polls in (
+        (f"fixed {FIXED_POLL_INTERVAL} s", fixed_polls()),
+        ("adaptive", adaptive_polls(timeline)),
+    ):
+        calls, latency = measure_polls(polls, timeline)
+        print(f"{label:<10} {calls:4} calls/h, {latency:5.2f} s track change latency")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Run every enabled task against the recorded fixture archive (no network)
+and report how long its runs take. Record the archive first with
+`fixtures_mode: record` in the config, then run from the repository root:
+
+    python -m benchmarks.bench_tasks [runs]
+
+Replayed latency follows fixtures_latency_scale of the config.
+"""
+
+import statistics
+import sys
+import time
+
+import deadline
+import fixtures
+from config import get_app_config
+from tasks import load_tasks
+from tasks.base import ClockTask
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    fixtures.set_mode(fixtures.REPLAY)
+    task_timeout = get_app_config()["task_timeout"]
+
+    print(f"{'task':<28} {'mean':>10} {'p95':>10} {'max':>10}  failures")
+    for task in load_tasks():
+        if not task.enabled or isinstance(task, ClockTask):
+            continue
+        durations = []
+        failures = 0
+        for _ in range(runs):
+            start = time.perf_counter()
+            try:
+                with deadline.within(task_timeout):
+                    task.fetch_data()
+            except Exception as e:
+                failures += 1
+                last_error = e
+            durations.append(time.perf_counter() - start)
+        p95 = statistics.quantiles(durations, n=20)[-1] if runs > 1 else durations[0]
+        print(
+            f"{task.name:<28} {statistics.mean(durations) * 1000:>8.1f}ms"
+            f" {p95 * 1000:>8.1f}ms {max(durations) * 1000:>8.1f}ms  {failures}"
+            + (f" ({last_error})" if failures else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
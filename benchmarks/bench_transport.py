@@ -0,0 +1,136 @@
+"""Compare publish latency and throughput of the MQTT and HTTP transports
+against local stand-ins. Run from the repository root:
+
+    python -m benchmarks.bench_transport [messages] [device delay in ms]
+"""
+
+import json
+import statistics
+import sys
+import time
+
+import paho.mqtt.client as mqtt
+import requests
+
+from tests.support import HttpStandIn, MqttStandIn, wait_received
+from transport import HttpTransport, MqttTransport
+
+
+def mqtt_connect_per_message(port):
+    """Previous sender: a new broker connection for every message"""
+
+    def send(app_name, payload):
+        client = mqtt.Client()
+        client.connect("127.0.0.1", port, 60)
+        client.publish(f"awtrix/custom/{app_name}", payload)
+        client.disconnect()
+
+    return send
+
+
+def http_connect_per_request(host):
+    def send(app_name, payload):
+        requests.post(
+            f"http://{host}/api/custom", params={"name": app_name}, data=payload
+        )
+
+    return send
+
+
+def send_all(send, messages, paced, standin):
+    """Send messages, one at a time (waiting for each) when paced
+    Returns:
+        dict: seq -> monotonic send time
+    """
+    sent_at = {}
+    for i in range(messages):
+        payload = json.dumps({"text": f"{i}", "seq": i, "padding": "x" * 200})
+        sent_at[i] = time.monotonic()
+        send(f"app{i}", payload)
+        if paced:
+            wait_received(standin, i + 1)
+    return sent_at
+
+
+def run(label, create_standin, create_sender, messages):
+    """Measure one transport
+    - latency: messages sent one at a time, from send call to arrival
+    - throughput: all messages sent at once, until the last one arrived
+    """
+    results = []
+    for paced in (True, False):
+        standin = create_standin()
+        send, close = create_sender(standin)
+        start = time.monotonic()
+        sent_at = send_all(send, messages, paced, standin)
+        caller_time = time.monotonic() - start
+        complete = wait_received(standin, messages)
+        close()
+        received = standin.received
+        latencies = [
+            arrived - sent_at[json.loads(payload)["seq"]]
+            for arrived, _, payload in received
+        ]
+        elapsed = max(arrived for arrived, _, _ in received) - start
+        results.append(
+            (latencies, messages / elapsed, caller_time / messages, complete)
+        )
+        connections = standin.connections
+        standin.close()
+    (latencies, _, _, paced_complete), (_, throughput, caller, complete) = results
+    print(
+        f"{label:<34}"
+        f" {statistics.mean(latencies) * 1000:>8.2f} ms"
+        f" {statistics.quantiles(latencies, n=20)[-1] * 1000:>8.2f} ms"
+        f" {throughput:>8.0f} msg/s"
+        f" {caller * 1000:>8.3f} ms"
+        f" {connections:>6}"
+        + ("" if paced_complete and complete else "  (messages lost)")
+    )
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    delay = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0
+    print(f"{messages} messages, device delay {delay * 1000:.0f} ms")
+    print(
+        f"{'transport':<34} {'mean lat.':>11} {'p95 lat.':>11}"
+        f" {'throughput':>14} {'caller':>11} {'conns':>6}"
+    )
+
+    def unmanaged(send):
+        return send, lambda: None
+
+    run(
+        "mqtt, connect per message",
+        MqttStandIn,
+        lambda broker: unmanaged(mqtt_connect_per_message(broker.port)),
+        messages,
+    )
+
+    def mqtt_transport(broker):
+        transport = MqttTransport("bench", "127.0.0.1", broker.port, "awtrix/custom/")
+        return transport.send, transport.close
+
+    run("mqtt, persistent (MqttTransport)", MqttStandIn, mqtt_transport, messages)
+    run(
+        "http, connect per request",
+        lambda: HttpStandIn(delay),
+        lambda device: unmanaged(http_connect_per_request(device.host)),
+        messages,
+    )
+
+    def http_transport(device):
+        transport = HttpTransport("bench", device.host)
+        return transport.send, transport.close
+
+    run(
+        "http, keep-alive (HttpTransport)",
+        lambda: HttpStandIn(delay),
+        http_transport,
+        messages,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import deadline
+import metrics
+from config import get_app_config
+from log import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Circuit breaker of one upstream host.
+    - closed: calls go through, consecutive failures are counted
+    - open: calls fail immediately until `recovery_timeout` has passed
+    - half_open: one probe call goes through, its result closes or re-opens the breaker
+    """
+
+    def __init__(self, name, failure_threshold=3, recovery_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.probing = False
+
+    def _set_state(self, state):
+        if state == self.state:
+            return
+        logger.warning("Circuit breaker %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        metrics.incr(f"breaker.{self.name}.{state}")
+        metrics.set_gauge(f"breaker.{self.name}", state)
+
+    def allow(self):
+        """Whether a call may go through now"""
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # Only one probe at a time
+                if self.probing:
+                    return False
+                self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            self._set_state(CLOSED)
+
+    def release(self):
+        """End a call without a verdict on the host (e.g. the caller gave up)"""
+        with self.lock:
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._set_state(OPEN)
+
+
+_breakers = {}
+_lock = threading.Lock()
+
+
+def get_breaker(host):
+    """Get the circuit breaker of an upstream host (shared by all tasks)"""
+    with _lock:
+        breaker = _breakers.get(host)
+        if breaker is None:
+            app_config = get_app_config()
+            breaker = CircuitBreaker(
+                host,
+                failure_threshold=app_config["breaker_failure_threshold"],
+                recovery_timeout=app_config["breaker_recovery_timeout"],
+            )
+            _breakers[host] = breaker
+        return breaker
+
+
+@contextmanager
+def guard(host):
+    """Run a call to an upstream host through its circuit breaker
+    Raises:
+        CircuitOpenError: If the breaker is open
+    """
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        metrics.incr(f"breaker.{host}.rejected")
+        raise CircuitOpenError(f"Circuit breaker open for {host}")
+    verdict = False
+    try:
+        yield breaker
+    except Exception:
+        # Cut short by the caller's time budget (e.g. a timeout shortened
+        # to what was left of it) is not a failure of the host
+        if not deadline.expired():
+            breaker.record_failure()
+            verdict = True
+        raise
+    else:
+        breaker.record_success()
+        verdict = True
+    finally:
+        if not verdict:
+            # Also on BaseException (e.g. KeyboardInterrupt), a probe must not
+            # stay in flight forever
+            breaker.release()
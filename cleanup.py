@@ -1,12 +1,16 @@
-from mqtt_sender import send_message
+from log import logger
 from tasks import load_tasks
+from transport import send_message
 
 
 def cleanup():
     tasks = load_tasks()
     for task in tasks:
-        send_message(task.name, "")
-    print("Cleanup done.")
+        try:
+            send_message(task.name, "")
+        except Exception as e:
+            logger.error("Failed to remove %s: %s", task.name, e)
+    logger.info("Cleanup done.")
 
 
 if __name__ == "__main__":
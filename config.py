@@ -1,9 +1,11 @@
+import os
 from pathlib import Path
 
 import yaml
 
 CONFIG_FILE = "config.yaml"
 _config_cache = None
+_config_stat = None
 
 
 def load_config(config_path=CONFIG_FILE):
@@ -18,12 +20,27 @@ def load_config(config_path=CONFIG_FILE):
 
 
 def get_config():
-    """Get current configuration (with hot reload support)"""
-    global _config_cache
-    _config_cache = load_config(CONFIG_FILE)
+    """Get current configuration (with hot reload support)
+    The file is only parsed again when its modification time or size changes."""
+    global _config_cache, _config_stat
+    try:
+        stat = os.stat(CONFIG_FILE)
+        config_stat = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        config_stat = None
+
+    if _config_cache is None or config_stat != _config_stat:
+        _config_cache = load_config(CONFIG_FILE)
+        _config_stat = config_stat
     return _config_cache
 
 
+def get_task_config(task_name):
+    """Get configuration section of a task"""
+    config = get_config()
+    return config.get("tasks", {}).get(task_name, {})
+
+
 def get_mqtt_config():
     """Get MQTT configuration"""
     config = get_config()
@@ -33,9 +50,34 @@ def get_mqtt_config():
         "topic_prefix": config.get("mqtt", {}).get("topic_prefix", "awtrix/custom/"),
         "username": config.get("mqtt", {}).get("username", ""),
         "password": config.get("mqtt", {}).get("password", ""),
+        "device_prefix": config.get("mqtt", {}).get("device_prefix", ""),
     }
 
 
+def get_devices_config():
+    """Get the devices results are sent to (default: one device over MQTT).
+    MQTT devices use the broker of the mqtt section, HTTP devices are
+    reached at their own host."""
+    config = get_config()
+    mqtt_config = get_mqtt_config()
+    devices = []
+    for i, device in enumerate(config.get("devices") or [{"transport": "mqtt"}]):
+        transport = device.get("transport", "mqtt")
+        defaults = mqtt_config if transport == "mqtt" else {}
+        devices.append(
+            {
+                "name": device.get("name", f"device{i}"),
+                "transport": transport,
+                "host": device.get("host", defaults.get("host", "")),
+                "port": device.get("port", defaults.get("port", 0)),
+                "topic_prefix": device.get("topic_prefix", mqtt_config["topic_prefix"]),
+                "username": device.get("username", defaults.get("username", "")),
+                "password": device.get("password", defaults.get("password", "")),
+            }
+        )
+    return devices
+
+
 def get_app_config():
     """Get app configuration"""
     config = get_config()
@@ -43,10 +85,32 @@ def get_app_config():
     return {
         "allowed_hours": app_config.get("allowed_hours", [[0, 1], [8, 24]]),
         "main_loop_interval": app_config.get("main_loop_interval", 20),
+        "mode": app_config.get("mode", "cycle"),
         "task_timeout": app_config.get("task_timeout", 5),
         "send_interval": app_config.get("send_interval", 0.5),
         "behavior_on_failure": app_config.get("behavior_on_failure", 0),
         "store_dir": app_config.get("store_dir", "data"),
+        "metrics_interval": app_config.get("metrics_interval", 300),
+        "dns_cache": app_config.get("dns_cache", True),
+        "prefetch_lead": app_config.get("prefetch_lead", 60),
+        "demand_driven": app_config.get("demand_driven", False),
+        "demand_lead": app_config.get("demand_lead", 5),
+        "profile_sample_ratio": app_config.get("profile_sample_ratio", 0.01),
+        "profile_top": app_config.get("profile_top", 20),
+        "fixtures_mode": app_config.get("fixtures_mode", "off"),
+        "fixtures_file": app_config.get("fixtures_file", "data/fixtures.json"),
+        "fixtures_latency_scale": app_config.get("fixtures_latency_scale", 1),
+        "shards": app_config.get("shards", 1),
+        "shard_slot_size": app_config.get("shard_slot_size", 16384),
+        "max_workers": app_config.get("max_workers", 8),
+        "host_concurrency": app_config.get("host_concurrency", 2),
+        "host_limits": app_config.get("host_limits", {}) or {},
+        "icon_max_error": app_config.get("icon_max_error", 6),
+        "log_level": app_config.get("log_level", "INFO"),
+        "log_payload_limit": app_config.get("log_payload_limit", 120),
+        "log_rate_limit": app_config.get("log_rate_limit", 10),
+        "breaker_failure_threshold": app_config.get("breaker_failure_threshold", 3),
+        "breaker_recovery_timeout": app_config.get("breaker_recovery_timeout", 60),
     }
 
 
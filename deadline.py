@@ -0,0 +1,48 @@
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when the time budget of the current run is spent"""
+
+
+@contextmanager
+def within(seconds):
+    """Give the code in this block (in the current thread) a time budget.
+    Nested budgets can only shorten the outer one."""
+    previous = getattr(_local, "deadline", None)
+    deadline = time.monotonic() + seconds
+    if previous is not None:
+        deadline = min(deadline, previous)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining(default):
+    """Get the timeout for the next blocking call
+    Args:
+        default (float): Timeout to use without a deadline (and upper bound with one)
+    Returns:
+        float: Seconds left, at most `default`
+    Raises:
+        DeadlineExceeded: If the budget is already spent
+    """
+    deadline = getattr(_local, "deadline", None)
+    if deadline is None:
+        return default
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Task time budget exceeded")
+    return min(default, left)
+
+
+def expired():
+    """Whether the time budget of the current thread is spent (False without one)"""
+    deadline = getattr(_local, "deadline", None)
+    return deadline is not None and time.monotonic() >= deadline
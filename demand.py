@@ -0,0 +1,262 @@
+import json
+import queue
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+import metrics
+from config import get_mqtt_config
+
+DEFAULT_DWELL = 7  # AWTRIX default app duration (s)
+DWELL_ALPHA = 0.3  # EWMA weight of the newest observed dwell time
+STALE_CYCLES = 3  # Rotation model is stale after this many cycles without updates
+MIN_STALE_TIME = 300
+MAX_HISTORY = 100
+FORWARD_POLL = 1  # Seconds between stop checks of QueuedStatsListener
+
+
+def is_app_page(app, shown):
+    """Whether `shown` (as reported by the device) is the app or one of its pages.
+    Apps sending a list of pages appear as <app>0, <app>1, ..."""
+    if shown == app:
+        return True
+    return shown.startswith(app) and shown[len(app) :].isdigit()
+
+
+class RotationTracker:
+    """Learns the app rotation of the device from its stats topics.
+    - stats/currentApp: name of the app on screen, gives order and dwell times
+    - stats/loop: apps in the loop, apps missing from it are hidden / disabled
+    Without a loop message, the order is learned from the last complete rotation.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.current = None
+        self.current_since = 0
+        self.dwell = {}  # app -> EWMA of its time on screen
+        self.history = []  # recently shown apps
+        self.order = []  # one rotation, in display order
+        self.loop = None  # apps in the loop as reported by the device
+        self.updated_at = 0
+
+    def handle(self, topic, payload, now=None):
+        """Handle a message from the device's stats topics"""
+        now = time.time() if now is None else now
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="replace")
+        if topic.endswith("/currentApp"):
+            self.on_current_app(payload.strip(), now)
+        elif topic.endswith("/loop"):
+            try:
+                apps = json.loads(payload)
+            except ValueError:
+                return
+            if isinstance(apps, dict):
+                # {"app": position, ...}
+                apps = sorted(apps, key=apps.get)
+            if isinstance(apps, list):
+                with self.lock:
+                    self.loop = [str(app) for app in apps]
+                    self.updated_at = now
+
+    def on_current_app(self, app, now):
+        with self.lock:
+            if app == self.current:
+                return
+            if self.current is not None:
+                observed = now - self.current_since
+                previous = self.dwell.get(self.current)
+                self.dwell[self.current] = (
+                    observed
+                    if previous is None
+                    else DWELL_ALPHA * observed + (1 - DWELL_ALPHA) * previous
+                )
+            # One rotation = everything shown since this app was last on screen
+            if app in self.history:
+                start = len(self.history) - 1 - self.history[::-1].index(app)
+                self.order = self.history[start:]
+            self.history.append(app)
+            del self.history[:-MAX_HISTORY]
+            self.current = app
+            self.current_since = now
+            self.updated_at = now
+
+    def _dwell(self, app):
+        if app in self.dwell:
+            return self.dwell[app]
+        if self.dwell:
+            return sum(self.dwell.values()) / len(self.dwell)
+        return DEFAULT_DWELL
+
+    def _rotation(self):
+        if self.loop is not None:
+            return self.loop
+        return self.order
+
+    def cycle_length(self):
+        """Seconds of one full rotation (0 if unknown)"""
+        with self.lock:
+            return sum(self._dwell(app) for app in self._rotation())
+
+    def is_tracking(self, now=None):
+        """Whether the rotation model is known and up to date"""
+        now = time.time() if now is None else now
+        cycle = self.cycle_length()
+        with self.lock:
+            if not cycle or self.current is None:
+                return False
+            return now - self.updated_at <= max(MIN_STALE_TIME, STALE_CYCLES * cycle)
+
+    def is_hidden(self, app):
+        """Whether the device leaves the app out of its rotation"""
+        with self.lock:
+            rotation = self._rotation()
+            return bool(rotation) and not any(
+                is_app_page(app, shown) for shown in rotation
+            )
+
+    def next_show_time(self, app, now=None):
+        """Estimate when the app is on screen next (epoch seconds).
+        Returns the start of the current turn if it is on screen now,
+        None if unknown."""
+        now = time.time() if now is None else now
+        with self.lock:
+            rotation = self._rotation()
+            if self.current not in rotation:
+                return None
+            if is_app_page(app, self.current):
+                return self.current_since
+            # Current app may already be past its usual dwell time
+            t = max(now, self.current_since + self._dwell(self.current))
+            index = rotation.index(self.current)
+            for step in range(1, len(rotation)):
+                candidate = rotation[(index + step) % len(rotation)]
+                if is_app_page(app, candidate):
+                    return t
+                t += self._dwell(candidate)
+            return None
+
+    def adjust_due_time(self, app, due_time, lead, has_content=True, now=None):
+        """Move a task's due time to just before its next turn on screen.
+        Args:
+            app (str): App (task) name
+            due_time (float): Due time of the task's own schedule, the data is
+                stale from then on
+            lead (float): Seconds to refresh before the turn
+            has_content (bool): Whether the app currently has something to show.
+                Apps without content are not in the rotation by their own choice
+                and keep their schedule
+        Returns:
+            float: Due time (inf while the device hides the app)
+        """
+        now = time.time() if now is None else now
+        if not self.is_tracking(now):
+            return due_time
+        if self.is_hidden(app):
+            return float("inf") if has_content else due_time
+        show_time = self.next_show_time(app, now)
+        if show_time is None:
+            return due_time
+        cycle = self.cycle_length()
+        if show_time <= now:
+            # On screen right now
+            if due_time <= now:
+                return due_time
+            show_time += cycle
+        # First turn at which the data would be stale
+        while show_time < due_time:
+            show_time += cycle
+        return show_time - lead
+
+
+def get_device_prefix(mqtt_config):
+    """Topic prefix of the device itself, e.g. awtrix for awtrix/custom/"""
+    if mqtt_config["device_prefix"]:
+        return mqtt_config["device_prefix"].rstrip("/")
+    return mqtt_config["topic_prefix"].rstrip("/").removesuffix("/custom")
+
+
+class DeviceStatsListener:
+    """Feeds the device's stats topics into a RotationTracker"""
+
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.client = None
+
+    def start(self):
+        mqtt_config = get_mqtt_config()
+        prefix = get_device_prefix(mqtt_config)
+        client = mqtt.Client()
+        if mqtt_config["username"] and mqtt_config["password"]:
+            client.username_pw_set(mqtt_config["username"], mqtt_config["password"])
+
+        def on_connect(client, userdata, flags, rc):
+            # (Re)subscribe on every connect
+            client.subscribe(f"{prefix}/stats/currentApp")
+            client.subscribe(f"{prefix}/stats/loop")
+
+        def on_message(client, userdata, msg):
+            self.tracker.handle(msg.topic, msg.payload)
+
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.connect_async(mqtt_config["host"], mqtt_config["port"], 60)
+        client.loop_start()
+        self.client = client
+
+    def stop(self):
+        if self.client is not None:
+            self.client.loop_stop()
+            self.client.disconnect()
+            self.client = None
+
+
+class StatsFanout:
+    """Takes the place of the RotationTracker of a DeviceStatsListener in the
+    main process of the sharded runtime: passes the stats messages on to each
+    worker, so the device is followed over one broker connection"""
+
+    def __init__(self, queues):
+        self.queues = queues  # multiprocessing queues, one per worker
+
+    def handle(self, topic, payload, now=None):
+        now = time.time() if now is None else now
+        for stats_queue in self.queues:
+            try:
+                stats_queue.put_nowait((topic, payload, now))
+            except queue.Full:
+                # Worker is not reading (e.g. restarting)
+                metrics.incr("demand.dropped")
+
+
+class QueuedStatsListener:
+    """Feeds the stats messages forwarded by a StatsFanout into a
+    RotationTracker, in a worker of the sharded runtime"""
+
+    def __init__(self, tracker, stats_queue):
+        self.tracker = tracker
+        self.queue = stats_queue
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="stats-listener", daemon=True
+        )
+        self.thread.start()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                topic, payload, now = self.queue.get(timeout=FORWARD_POLL)
+            except queue.Empty:
+                continue
+            self.tracker.handle(topic, payload, now=now)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
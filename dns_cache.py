@@ -0,0 +1,214 @@
+import ipaddress
+import os
+import socket
+import threading
+import time
+
+import dns.exception
+import dns.resolver
+from dns.rdatatype import RdataType
+
+import deadline
+import metrics
+
+DNS_TIMEOUT = 2  # Seconds for a single lookup
+MIN_TTL = 30  # Cache records at least this long, even if upstream TTL is lower
+DEFAULT_TTL = 300  # TTL for records without one (system resolver, missing SRV)
+MAX_STALE = 86400  # Serve expired records up to this long when lookups fail
+MINECRAFT_SRV_PREFIX = "_minecraft._tcp."
+HOSTS_FILE = "/etc/hosts"
+
+_original_getaddrinfo = socket.getaddrinfo
+_lock = threading.Lock()
+_cache = {}  # key -> (expires_at, value)
+_hosts = (None, {})  # (mtime, name -> IP addresses) of HOSTS_FILE
+
+
+def _cached(key, resolve):
+    """Get value from cache or resolve it, serving stale entries on failure
+    Args:
+        key (tuple): Cache key
+        resolve (callable): Returns (value, ttl)
+    Returns:
+        Any: Cached or resolved value
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(key)
+    if entry and entry[0] > now:
+        metrics.incr("dns.hits")
+        return entry[1]
+
+    metrics.incr("dns.misses")
+    try:
+        value, ttl = resolve()
+    except Exception:
+        if entry and now - entry[0] < MAX_STALE:
+            metrics.incr("dns.stale")
+            return entry[1]
+        raise
+
+    with _lock:
+        _cache[key] = (now + max(MIN_TTL, ttl), value)
+    return value
+
+
+def is_ip_address(host):
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+
+def split_host_port(address, default_port):
+    """Split `host[:port]` address, IPv6 addresses need brackets for a port"""
+    address = address.strip()
+    if address.startswith("["):
+        host, _, rest = address[1:].partition("]")
+        port = rest.lstrip(":")
+        return host, int(port) if port else default_port
+    if address.count(":") == 1:
+        host, port = address.split(":")
+        return host, int(port)
+    return address, default_port
+
+
+def _hosts_entries():
+    """Get the names of the system hosts file, re-read when it changes
+    Returns:
+        dict: name -> list of IP addresses
+    """
+    global _hosts
+    try:
+        mtime = os.stat(HOSTS_FILE).st_mtime
+    except OSError:
+        return {}
+    if mtime != _hosts[0]:
+        entries = {}
+        with open(HOSTS_FILE, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                fields = line.split("#", 1)[0].split()
+                if len(fields) < 2 or not is_ip_address(fields[0]):
+                    continue
+                for name in fields[1:]:
+                    entries.setdefault(name.lower(), []).append(fields[0])
+        _hosts = (mtime, entries)
+    return _hosts[1]
+
+
+def _resolve_host(host):
+    """Resolve host to IP addresses with TTL. Like the system resolver, the
+    hosts file comes before DNS, names DNS does not know (e.g. mDNS) are left
+    to the system resolver."""
+    ips = _hosts_entries().get(host.lower().rstrip("."))
+    if ips:
+        return ips, DEFAULT_TTL
+    try:
+        try:
+            answer = dns.resolver.resolve(
+                host, RdataType.A, lifetime=deadline.remaining(DNS_TIMEOUT), search=True
+            )
+        except dns.resolver.NoAnswer:
+            answer = dns.resolver.resolve(
+                host,
+                RdataType.AAAA,
+                lifetime=deadline.remaining(DNS_TIMEOUT),
+                search=True,
+            )
+        return [rdata.to_text() for rdata in answer], answer.rrset.ttl
+    except (
+        dns.resolver.NXDOMAIN,
+        dns.resolver.NoAnswer,
+        dns.resolver.NoResolverConfiguration,
+    ):
+        infos = _original_getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        ips = list(dict.fromkeys(info[4][0] for info in infos))
+        return ips, DEFAULT_TTL
+
+
+def resolve_host(host):
+    """Resolve host to a list of IP addresses (cached)"""
+    if is_ip_address(host):
+        return [host]
+    return _cached(("host", host.lower()), lambda: _resolve_host(host))
+
+
+def _resolve_minecraft_srv(host, default_port):
+    try:
+        answer = dns.resolver.resolve(
+            MINECRAFT_SRV_PREFIX + host,
+            RdataType.SRV,
+            lifetime=deadline.remaining(DNS_TIMEOUT),
+            search=True,
+        )
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return (host, default_port), DEFAULT_TTL
+    record = answer[0]
+    return (str(record.target).rstrip("."), int(record.port)), answer.rrset.ttl
+
+
+def resolve_minecraft_srv(address, default_port):
+    """Resolve Minecraft server address like the game does (cached)
+    Args:
+        address (str): `host`, `host:port`, or IP address
+        default_port (int): Port to use if there is no port and no SRV record
+    Returns:
+        tuple: (host, port)
+    """
+    host, port = split_host_port(address, None)
+    if port is not None:
+        return host, port
+    if is_ip_address(host):
+        return host, default_port
+    return _cached(
+        ("srv", host.lower(), default_port),
+        lambda: _resolve_minecraft_srv(host, default_port),
+    )
+
+
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    if (
+        not isinstance(host, str)
+        or is_ip_address(host)
+        or flags & socket.AI_NUMERICHOST
+    ):
+        return _original_getaddrinfo(host, port, family, type, proto, flags)
+
+    try:
+        ips = resolve_host(host)
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception:
+        return _original_getaddrinfo(host, port, family, type, proto, flags)
+
+    results = []
+    for ip in ips:
+        try:
+            results.extend(
+                _original_getaddrinfo(
+                    ip, port, family, type, proto, flags | socket.AI_NUMERICHOST
+                )
+            )
+        except socket.gaierror:
+            # Address family not wanted by the caller
+            continue
+    if not results:
+        return _original_getaddrinfo(host, port, family, type, proto, flags)
+    return results
+
+
+def install():
+    """Route all hostname lookups of this process (requests, mcstatus, ...) through the cache"""
+    socket.getaddrinfo = _cached_getaddrinfo
+
+
+def uninstall():
+    socket.getaddrinfo = _original_getaddrinfo
+
+
+def clear():
+    global _hosts
+    with _lock:
+        _cache.clear()
+    _hosts = (None, {})
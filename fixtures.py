@@ -0,0 +1,250 @@
+import base64
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+import deadline
+from config import get_app_config
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+ARCHIVE_VERSION = 1
+# Query / form fields left out of fixture keys, so archives hold no secrets
+# and replay does not depend on the credentials of the machine
+SECRET_FIELDS = {"key", "apikey", "api_key", "appkey", "token", "access_token"}
+BODY_CHUNK_SIZE = 16 * 1024
+
+
+class FixtureMissing(LookupError):
+    """Raised in replay mode when the archive has no response for a call"""
+
+
+class ReplayedError(requests.RequestException):
+    """An upstream error that was recorded, raised again on replay"""
+
+
+def get_fixtures_path():
+    app_config = get_app_config()
+    return str((Path(__file__).parent / app_config["fixtures_file"]).resolve())
+
+
+_mode = None  # Overrides fixtures_mode of the config (e.g. for benchmarks)
+
+
+def set_mode(mode):
+    """Force a mode (off / record / replay), None to follow the config"""
+    global _mode
+    _mode = mode
+
+
+def get_mode():
+    if _mode is not None:
+        return _mode
+    return get_app_config()["fixtures_mode"]
+
+
+class Archive:
+    """Recorded upstream responses, key -> list of entries (replayed in turn)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.positions = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f).get("entries", {})
+
+    def add(self, key, entry):
+        with self.lock:
+            self.entries.setdefault(key, []).append(entry)
+            # Written through, so a recording survives a crash
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": ARCHIVE_VERSION, "entries": self.entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def next(self, key):
+        """Get the next recorded entry of a key, cycling through all of them"""
+        with self.lock:
+            entries = self.entries.get(key)
+            if not entries:
+                raise FixtureMissing(f"No recorded response for {key}")
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            return entries[position % len(entries)]
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """Get the archive of the configured fixtures file"""
+    global _archive
+    path = get_fixtures_path()
+    with _archive_lock:
+        if _archive is None or _archive.path != path:
+            _archive = Archive(path)
+        return _archive
+
+
+def _without_secrets(pairs):
+    return sorted((k, v) for k, v in pairs if k.lower() not in SECRET_FIELDS)
+
+
+def redact_url(url, params=None):
+    """URL with the params merged into its query, without secret fields"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query)
+    if isinstance(params, dict):
+        query += [(k, str(v)) for k, v in params.items() if v is not None]
+    elif params:
+        query += list(params)
+    return urlunsplit(
+        parts._replace(query=urlencode(_without_secrets(query)), fragment="")
+    )
+
+
+def request_key(method, url, params=None, data=None):
+    """Key of an HTTP request: method, URL and query / form fields without secrets"""
+    key = f"{method.upper()} {redact_url(url, params)}"
+    if isinstance(data, dict):
+        key += " " + urlencode(_without_secrets(data.items()))
+    elif data:
+        key += f" {data}"
+    return key
+
+
+def _replay_delay(entry):
+    """Wait the recorded (scaled) latency, within the time budget of the task"""
+    delay = entry["elapsed"] * get_app_config()["fixtures_latency_scale"]
+    if delay <= 0:
+        return
+    available = deadline.remaining(delay)
+    time.sleep(available)
+    if available < delay:
+        # The original call would have timed out
+        raise deadline.DeadlineExceeded("Replayed latency exceeds the time budget")
+
+
+def _encode_response(response):
+    return {
+        "status": response.status_code,
+        "reason": response.reason,
+        "url": redact_url(response.url),
+        "headers": {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() != "set-cookie"
+        },
+        "body": base64.b64encode(response.content).decode("ascii"),
+    }
+
+
+def _decode_response(recorded):
+    response = requests.Response()
+    response.status_code = recorded["status"]
+    response.reason = recorded["reason"]
+    response.url = recorded["url"]
+    response.headers = CaseInsensitiveDict(recorded["headers"])
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = base64.b64decode(recorded["body"])
+    response._content_consumed = True
+    return response
+
+
+def _read_body(response, max_body):
+    """Read a streamed body to record it, stopping after max_body bytes. The
+    response then serves what was read to the caller."""
+    data = bytearray()
+    try:
+        for chunk in response.iter_content(BODY_CHUNK_SIZE):
+            data += chunk
+            if len(data) >= max_body:
+                break
+    finally:
+        response.close()
+    response._content = bytes(data[:max_body])
+    response._content_consumed = True
+
+
+def request(method, url, max_body=None, **kwargs):
+    """requests.request, recorded into / served from the fixture archive
+    Args:
+        max_body (int): Bytes of a streamed body recorded at most (None for
+            all). The caller reads no more than that in record mode either.
+    """
+    mode = get_mode()
+    if mode == OFF:
+        return requests.request(method, url, **kwargs)
+
+    key = request_key(method, url, kwargs.get("params"), kwargs.get("data"))
+    if mode == REPLAY:
+        entry = get_archive().next(key)
+        _replay_delay(entry)
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        response = _decode_response(entry["response"])
+        response.elapsed = timedelta(seconds=entry["elapsed"])
+        return response
+
+    start = time.monotonic()
+    try:
+        response = requests.request(method, url, **kwargs)
+    except requests.RequestException as e:
+        get_archive().add(
+            key,
+            {"elapsed": time.monotonic() - start, "error": f"{type(e).__name__}: {e}"},
+        )
+        raise
+    if kwargs.get("stream") and max_body is not None:
+        _read_body(response, max_body)
+    get_archive().add(
+        key,
+        {"elapsed": time.monotonic() - start, "response": _encode_response(response)},
+    )
+    return response
+
+
+def call(key, func):
+    """Run a non-HTTP upstream call (e.g. a client library), recording or
+    replaying its JSON-serializable result
+    Args:
+        key (str): Key of the call in the archive, without secrets
+        func (callable): Makes the call, only run when not replaying
+    """
+    mode = get_mode()
+    if mode == OFF:
+        return func()
+
+    if mode == REPLAY:
+        entry = get_archive().next(key)
+        _replay_delay(entry)
+        if "error" in entry:
+            raise ReplayedError(entry["error"])
+        return entry["result"]
+
+    start = time.monotonic()
+    try:
+        result = func()
+    except deadline.DeadlineExceeded:
+        raise
+    except Exception as e:
+        get_archive().add(
+            key,
+            {"elapsed": time.monotonic() - start, "error": f"{type(e).__name__}: {e}"},
+        )
+        raise
+    get_archive().add(key, {"elapsed": time.monotonic() - start, "result": result})
+    return result
@@ -0,0 +1,283 @@
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from concurrent.futures import Future, InvalidStateError
+from contextlib import contextmanager
+
+import deadline
+import metrics
+from config import get_app_config
+
+HOST_WAIT = 60  # Longest wait for a host slot without a time budget
+IDLE_TIMEOUT = 60  # Idle workers above zero exit after this many seconds
+
+_local = threading.local()  # Host slots of the job running in this thread
+_governors = weakref.WeakSet()  # Woken when a host slot is released
+
+
+class Governor:
+    """Runs task jobs on a capped set of worker threads.
+    Queued jobs run by priority (lower first), then by deadline (earlier first).
+    Jobs submitted with a key remember the upstream hosts of their last run: a worker
+    only picks a job once all of them have a free slot, and holds those slots
+    for the run, so a saturated host does not park workers other jobs could use.
+    A job's future gets the fallback result if the job runs longer than its timeout,
+    the worker itself is only freed once the job returns."""
+
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        lock = threading.Lock()
+        self.cond = threading.Condition(lock)  # Workers wait on this
+        self.watch_cond = threading.Condition(lock)  # The watchdog waits on this
+        self.queue = []  # heap of (priority, deadline, seq, job)
+        self.seq = itertools.count()
+        self.workers = 0
+        self.idle = 0
+        self.expiries = []  # heap of (expires_at, seq, job)
+        self.watchdog = None
+        self.hosts = {}  # key -> hosts used by the last run
+        _governors.add(self)
+
+    def submit(
+        self, fn, priority=0, deadline=0, timeout=None, on_timeout=None, key=None
+    ):
+        """Queue fn()
+        Args:
+            priority (int): Lower runs first
+            deadline (float): Among equal priorities, earlier runs first
+            timeout (float): Seconds after start to resolve with on_timeout()
+            on_timeout (callable): Fallback result
+            key (str): Jobs with the same key (same task) use the same hosts
+        Returns:
+            Future: Result of fn() (or of on_timeout())
+        """
+        job = {
+            "fn": fn,
+            "key": key,
+            "future": Future(),
+            "timeout": timeout,
+            "on_timeout": on_timeout,
+            "queued_at": time.monotonic(),
+        }
+        with self.cond:
+            heapq.heappush(self.queue, (priority, deadline, next(self.seq), job))
+            metrics.set_gauge("governor.queued", len(self.queue))
+            if self.idle:
+                self.cond.notify()
+            # More queued jobs than idle workers to pick them up
+            if len(self.queue) > self.idle and self.workers < self.max_workers:
+                self.workers += 1
+                threading.Thread(
+                    target=self.work, name=f"governor-{self.workers}", daemon=True
+                ).start()
+        return job["future"]
+
+    def work(self):
+        while True:
+            with self.cond:
+                self.idle += 1
+                job = None
+                while self.workers <= self.max_workers:
+                    job, slots = self.take()
+                    if job is not None:
+                        break
+                    if not self.cond.wait(IDLE_TIMEOUT) and not self.queue:
+                        break
+                self.idle -= 1
+                if job is None:
+                    # Idle, or the cap was lowered
+                    self.workers -= 1
+                    metrics.set_gauge("governor.workers", self.workers)
+                    return
+                metrics.set_gauge("governor.queued", len(self.queue))
+                metrics.set_gauge("governor.workers", self.workers)
+            self.run(job, slots)
+
+    def take(self):
+        """Remove the first queued job whose hosts all have a free slot
+        Returns:
+            tuple: (job, {host: semaphore} of the slots taken for it),
+                (None, None) if there is none
+        """
+        if not self.queue:
+            return None, None
+        slots = self.reserve(self.queue[0][3])
+        if slots is not None:
+            return heapq.heappop(self.queue)[3], slots
+        for entry in sorted(self.queue)[1:]:
+            slots = self.reserve(entry[3])
+            if slots is not None:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                metrics.incr("governor.skipped_full_host")
+                return entry[3], slots
+        return None, None
+
+    def reserve(self, job):
+        """Take a slot of each host the job used last time, without waiting
+        Returns:
+            dict: {host: semaphore}, None if a host is full
+        """
+        slots = {}
+        for host in self.hosts.get(job["key"], ()):
+            semaphore = get_host_limit(host).semaphore
+            if not semaphore.acquire(blocking=False):
+                for taken in slots.values():
+                    taken.release()
+                return None
+            slots[host] = semaphore
+        return slots
+
+    def slot_released(self):
+        """Wake idle workers to pick up jobs that wait for a host slot"""
+        with self.cond:
+            if self.idle and self.queue:
+                self.cond.notify_all()
+
+    def run(self, job, slots):
+        metrics.observe("governor.queue_wait", time.monotonic() - job["queued_at"])
+        if job["timeout"] is not None:
+            self.watch(job)
+        _local.slots = slots
+        _local.hosts = set()
+        try:
+            result = job["fn"]()
+        except BaseException as e:
+            self.resolve(job, exception=e)
+        else:
+            self.resolve(job, result)
+        finally:
+            if job["key"] is not None:
+                with self.cond:
+                    self.hosts[job["key"]] = _local.hosts
+            _local.slots = _local.hosts = None
+            for semaphore in slots.values():
+                semaphore.release()
+            if slots:
+                self.slot_released()
+
+    def resolve(self, job, result=None, exception=None):
+        """Complete the job's future, unless the watchdog already did"""
+        try:
+            if exception is not None:
+                job["future"].set_exception(exception)
+            else:
+                job["future"].set_result(result)
+        except InvalidStateError:
+            pass
+
+    def watch(self, job):
+        with self.cond:
+            expires_at = time.monotonic() + job["timeout"]
+            heapq.heappush(self.expiries, (expires_at, next(self.seq), job))
+            if self.watchdog is None:
+                self.watchdog = threading.Thread(
+                    target=self.watch_expiries, name="governor-watchdog", daemon=True
+                )
+                self.watchdog.start()
+            self.watch_cond.notify()
+
+    def watch_expiries(self):
+        """One thread for the timeouts of all running jobs"""
+        while True:
+            with self.cond:
+                while True:
+                    while self.expiries and self.expiries[0][2]["future"].done():
+                        heapq.heappop(self.expiries)
+                    if not self.expiries:
+                        self.watch_cond.wait()
+                        continue
+                    wait = self.expiries[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self.watch_cond.wait(wait)
+                _, _, job = heapq.heappop(self.expiries)
+            on_timeout = job["on_timeout"]
+            self.resolve(job, on_timeout() if on_timeout else None)
+
+    def set_max_workers(self, max_workers):
+        with self.cond:
+            self.max_workers = max_workers
+            # Let surplus idle workers exit
+            self.cond.notify_all()
+
+
+_lock = threading.Lock()
+_governor = None
+_shards = 1  # Worker processes splitting the limits of the config
+
+
+def set_shards(shards):
+    """Split max_workers and the host limits between `shards` worker processes
+    (sharded runtime), each process gets an equal share of at least 1"""
+    global _shards
+    _shards = shards
+
+
+def _share(limit):
+    return max(1, limit // _shards)
+
+
+def get_governor():
+    """Get the shared governor, its cap follows max_workers of the config"""
+    global _governor
+    max_workers = _share(get_app_config()["max_workers"])
+    with _lock:
+        if _governor is None:
+            _governor = Governor(max_workers)
+        elif _governor.max_workers != max_workers:
+            _governor.set_max_workers(max_workers)
+        return _governor
+
+
+class HostLimit:
+    def __init__(self, limit):
+        self.limit = limit
+        self.semaphore = threading.Semaphore(limit)
+
+
+_host_limits = {}
+_host_lock = threading.Lock()  # Workers look up host limits holding the governor lock
+
+
+def get_host_limit(host):
+    """Get the concurrency limit of an upstream host (host_limits / host_concurrency)"""
+    app_config = get_app_config()
+    limit = _share(app_config["host_limits"].get(host, app_config["host_concurrency"]))
+    with _host_lock:
+        host_limit = _host_limits.get(host)
+        if host_limit is None or host_limit.limit != limit:
+            # Calls holding the old semaphore release it, new calls use the new one
+            host_limit = HostLimit(limit)
+            _host_limits[host] = host_limit
+        return host_limit
+
+
+@contextmanager
+def host_slot(host):
+    """Wait for a free connection slot of an upstream host
+    (a slot the governor took for the running job is used as is)
+    Raises:
+        DeadlineExceeded: If no slot frees up within the time budget
+    """
+    hosts = getattr(_local, "hosts", None)
+    if hosts is not None:
+        hosts.add(host)
+    slots = getattr(_local, "slots", None)
+    if slots and host in slots:
+        yield
+        return
+    semaphore = get_host_limit(host).semaphore
+    start = time.monotonic()
+    if not semaphore.acquire(timeout=deadline.remaining(HOST_WAIT)):
+        metrics.incr(f"governor.{host}.slot_timeout")
+        raise deadline.DeadlineExceeded(f"No free connection slot for {host}")
+    metrics.observe(f"governor.{host}.slot_wait", time.monotonic() - start)
+    try:
+        yield
+    finally:
+        semaphore.release()
+        for governor in list(_governors):
+            governor.slot_released()
@@ -1,20 +1,45 @@
 import base64
 import json
 import os
+import threading
+from collections import Counter
 from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlparse, urlsplit, urlunsplit
 
 import cv2
 import numpy as np
 import pykakasi
-import requests
 from colour import Color
 from korean_romanizer.romanizer import Romanizer as KoreanRomanizer
 from pypinyin import Style, lazy_pinyin
 
+import deadline
+import fixtures
+import metrics
+from circuit_breaker import guard
 from config import get_app_config
+from governor import host_slot
+from log import logger
 
 USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/142.0.0.0 Safari/537.36"
 REQUEST_TIMEOUT = 10
+MAX_IMAGE_BYTES = 1024 * 1024  # Icons never need more, larger downloads are aborted
+IMAGE_CHUNK_SIZE = 16 * 1024
+IMAGE_OVERSAMPLE = 4  # Source size requested from scaling hosts, times the icon size
+IMREAD_REDUCED_MODES = (
+    cv2.IMREAD_REDUCED_COLOR_8,
+    cv2.IMREAD_REDUCED_COLOR_4,
+    cv2.IMREAD_REDUCED_COLOR_2,
+    cv2.IMREAD_COLOR,
+)
+JPEG_SOI = b"\xff\xd8"  # Start of image marker, the first bytes of a JPEG
+ICON_JPEG_QUALITIES = (95, 90, 80, 70, 50)
+ICON_PALETTE_COLORS = 16
+ICON_ENCODINGS = ("jpg", "png", "draw")
+# The device only decodes base64 icons that are (baseline) JPG
+ICON_FORMATS = ("jpg",)
+# Guards the image cache, album art is also fetched by background prefetches
+_image_cache_lock = threading.Lock()
 
 
 def get_image_cache_path():
@@ -57,17 +82,54 @@ def format_number(num):
         return str(int(original_num))
 
 
+def format_bytes(num):
+    """Format bytes with unit suffix (B, KB, MB, etc.), 1 KB = 1024 B"""
+    units = ["B", "KB", "MB", "GB", "TB"]
+    divisor = 1024
+    unit_index = 0
+    value = int(num)
+
+    # Switch to the next unit from 1000 on, to keep at most 3 digits
+    while value >= 1000 and unit_index < len(units) - 1:
+        value = value // divisor
+        unit_index += 1
+
+    unit = units[unit_index]
+
+    if unit_index == 0:
+        return f"{value} {unit}"
+    actual_value = num / (divisor**unit_index)
+    if value < 10:
+        # 1.0 KB
+        return f"{actual_value:.1f} {unit}"
+    # 10 KB
+    return f"{actual_value:.0f} {unit}"
+
+
+def _request(method, url, **kwargs):
+    """Send request through the concurrency limit and circuit breaker of the
+    upstream host. Connection errors and 5xx / 429 responses count as failures."""
+    host = urlparse(url).hostname
+    with host_slot(host), guard(host):
+        # Never wait longer than the time budget left after waiting for the slot
+        timeout = deadline.remaining(REQUEST_TIMEOUT)
+        response = fixtures.request(method, url, **kwargs, timeout=timeout)
+        if response.status_code >= 500 or response.status_code == 429:
+            response.raise_for_status()
+        return response
+
+
 def requests_get(url, **kwargs):
     headers = kwargs.pop("headers", {}) or {}
     headers.setdefault("User-Agent", USER_AGENT)
-    return requests.get(url, headers=headers, **kwargs, timeout=REQUEST_TIMEOUT)
+    return _request("GET", url, headers=headers, **kwargs)
 
 
 def requests_post(url, **kwargs):
     headers = kwargs.pop("headers", {}) or {}
     headers.setdefault("User-Agent", USER_AGENT)
     headers.setdefault("Content-Type", "application/x-www-form-urlencoded")
-    return requests.post(url, headers=headers, **kwargs, timeout=REQUEST_TIMEOUT)
+    return _request("POST", url, headers=headers, **kwargs)
 
 
 def cjk_to_initials(text: str, separator: str = "") -> str:
@@ -113,6 +175,204 @@ def cjk_to_initials(text: str, separator: str = "") -> str:
     return separator.join(char_to_initial(c) for c in text)
 
 
+def smallest_image_url(images, target_size):
+    """Pick the smallest image that still covers target_size
+    Args:
+        images (list): [{"url", "width", "height"}, ...] (e.g. Spotify album.images)
+        target_size (tuple): (width, height)
+    Returns:
+        str: Image URL, "" if there is none
+    """
+    images = [image for image in images or [] if image.get("url")]
+    if not images:
+        return ""
+
+    def size(image):
+        return (image.get("width") or 0) * (image.get("height") or 0)
+
+    covering = [
+        image
+        for image in images
+        if (image.get("width") or 0) >= target_size[0]
+        and (image.get("height") or 0) >= target_size[1]
+    ]
+    if covering:
+        return min(covering, key=size)["url"]
+    return max(images, key=size)["url"]
+
+
+def sized_image_url(url, target_size):
+    """Ask hosts that can scale images for a small version (GitHub avatars: s=)"""
+    parts = urlsplit(url)
+    if parts.hostname == "avatars.githubusercontent.com":
+        query = [(k, v) for k, v in parse_qsl(parts.query) if k != "s"]
+        query.append(("s", str(max(target_size) * IMAGE_OVERSAMPLE)))
+        return urlunsplit(parts._replace(query=urlencode(query)))
+    return url
+
+
+def download_image(url, max_bytes=MAX_IMAGE_BYTES):
+    """Stream an image, giving up once it is larger than max_bytes
+    Returns:
+        bytes: Image data
+    """
+    # One byte more than accepted is enough to tell the image is too large
+    response = requests_get(url, stream=True, max_body=max_bytes + 1)
+    try:
+        response.raise_for_status()
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > max_bytes:
+            raise ValueError(f"Image too large ({length} bytes)")
+        data = bytearray()
+        for chunk in response.iter_content(IMAGE_CHUNK_SIZE):
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError(f"Image larger than {max_bytes} bytes")
+        metrics.incr("images.bytes_fetched", len(data))
+        return bytes(data)
+    finally:
+        response.close()
+
+
+def decode_image(data, target_size):
+    """Decode an image and resize it to target_size (BGR).
+    JPEG is decoded at the strongest reduction (1/8, 1/4, 1/2) that still
+    covers target_size, so only partially, then area-averaged the rest of
+    the way."""
+    image_array = np.frombuffer(data, np.uint8)
+    # Other formats are fully decoded in every reduced mode (and then
+    # subsampled), so they are decoded once at full size
+    modes = IMREAD_REDUCED_MODES if data[:2] == JPEG_SOI else (cv2.IMREAD_COLOR,)
+    image = None
+    for mode in modes:
+        image = cv2.imdecode(image_array, mode)
+        if image is None:
+            raise ValueError("Failed to decode image")
+        height, width = image.shape[:2]
+        if width >= target_size[0] and height >= target_size[1]:
+            break
+    if (image.shape[1], image.shape[0]) == tuple(target_size):
+        return image
+    return cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
+
+
+def fetch_image(url, target_size):
+    """Fetch an image at the smallest source size and decode it to target_size (BGR)"""
+    return decode_image(download_image(sized_image_url(url, target_size)), target_size)
+
+
+def pack_rgb(image):
+    """Convert a BGR image to packed RGB integers (0xRRGGBB), row by row"""
+    image = image.astype(np.uint32)
+    packed = (image[:, :, 2] << 16) | (image[:, :, 1] << 8) | image[:, :, 0]
+    return packed.ravel().tolist()
+
+
+def color_error(image, other):
+    """Mean absolute difference per channel (0-255) of two images of the same size"""
+    return float(np.mean(cv2.absdiff(image, other)))
+
+
+def quantize_colors(image, colors):
+    """Reduce a BGR image to at most `colors` colors (k-means)"""
+    pixels = image.reshape(-1, 3).astype(np.float32)
+    colors = min(colors, len(np.unique(pixels, axis=0)))
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10, 1.0)
+    _, labels, centers = cv2.kmeans(
+        pixels, colors, None, criteria, 1, cv2.KMEANS_PP_CENTERS
+    )
+    centers = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+    return centers[labels.ravel()].reshape(image.shape)
+
+
+def _encoded_icon(name, image, source, extension, params=()):
+    success, buffer = cv2.imencode(extension, image, list(params))
+    if not success:
+        raise ValueError(f"Failed to encode image as {name}")
+    payload = base64.b64encode(buffer).decode("utf-8")
+    decoded = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    return {
+        "name": name,
+        "format": extension.lstrip("."),
+        "payload": payload,
+        "size": len(payload),
+        "error": color_error(source, decoded),
+    }
+
+
+def icon_candidates(image, formats=ICON_ENCODINGS):
+    """Encode an icon every way the pipeline knows
+    Args:
+        image (numpy.ndarray): BGR icon, already at its display size
+        formats (tuple): Formats to build (jpg / png / draw), others are skipped
+    Returns:
+        list: Dicts of name, format (jpg / png / draw), payload (base64 string,
+            or draw commands), size (bytes on the wire) and error (see color_error)
+    """
+    candidates = []
+    if "jpg" in formats:
+        candidates.append(_encoded_icon("jpg-default", image, image, ".jpg"))
+        # Full-resolution chroma (4:2:0 smears an 8x8 icon) and Huffman tables
+        # built for the image, which are a large part of a tiny JPG
+        for quality in ICON_JPEG_QUALITIES:
+            params = [
+                cv2.IMWRITE_JPEG_QUALITY,
+                quality,
+                cv2.IMWRITE_JPEG_OPTIMIZE,
+                1,
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR,
+                cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444,
+            ]
+            candidates.append(
+                _encoded_icon(f"jpg-{quality}", image, image, ".jpg", params)
+            )
+    if "png" in formats:
+        png_params = [cv2.IMWRITE_PNG_COMPRESSION, 9]
+        candidates.append(_encoded_icon("png", image, image, ".png", png_params))
+        quantized = quantize_colors(image, ICON_PALETTE_COLORS)
+        candidates.append(
+            _encoded_icon(
+                f"png-{ICON_PALETTE_COLORS}-colors",
+                quantized,
+                image,
+                ".png",
+                png_params,
+            )
+        )
+    if "draw" in formats:
+        height, width = image.shape[:2]
+        commands = optimize_draw_commands(0, 0, width, height, pack_rgb(image))
+        candidates.append(
+            {
+                "name": "draw",
+                "format": "draw",
+                "payload": commands,
+                "size": _payload_size(commands),
+                "error": 0.0,
+            }
+        )
+    return candidates
+
+
+def encode_icon(image, max_error, formats=ICON_FORMATS):
+    """Pick the smallest encoding of an icon within a color error
+    Args:
+        image (numpy.ndarray): BGR icon, already at its display size
+        max_error (float): Largest acceptable color_error
+        formats (tuple): Formats the consumer accepts
+    Returns:
+        dict: Candidate (see icon_candidates), the most accurate one if none
+            is within max_error
+    """
+    candidates = icon_candidates(image, formats)
+    if not candidates:
+        raise ValueError(f"No icon encoding in {formats}")
+    within = [c for c in candidates if c["error"] <= max_error]
+    if within:
+        return min(within, key=lambda c: (c["size"], c["error"]))
+    return min(candidates, key=lambda c: (c["error"], c["size"]))
+
+
 def fetch_image_and_convert_to_packed_rgb(url, target_size):
     """Fetch image from URL, resize, convert to packed RGB format
     Args:
@@ -122,30 +382,15 @@ def fetch_image_and_convert_to_packed_rgb(url, target_size):
         list: List of packed RGB integers
     """
     try:
-        response = requests_get(url)
-        response.raise_for_status()
-
-        image_array = np.frombuffer(response.content, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        resized_image = cv2.resize(image_rgb, target_size)
-        height, width = resized_image.shape[:2]
-        packed_pixels = []
-
-        for y in range(height):
-            for x in range(width):
-                r, g, b = map(int, resized_image[y, x])
-                packed = (r << 16) | (g << 8) | b
-                packed_pixels.append(packed)
-
-        return packed_pixels
+        return pack_rgb(fetch_image(url, target_size))
     except Exception as e:
-        print(f"Error fetching or processing image from {url}: {e}")
+        logger.error("Error fetching or processing image from %s: %s", url, e)
         return None
 
 
 def fetch_image_and_convert_to_base64(url, target_size, image_format="JPG"):
     """Fetch image from URL, resize, convert to base64 string. Uses persistent cache.
+    JPG icons use the smallest encoding within icon_max_error (see encode_icon).
     Args:
         url (str): Image URL
         target_size (tuple): (width, height)
@@ -153,55 +398,58 @@ def fetch_image_and_convert_to_base64(url, target_size, image_format="JPG"):
     Returns:
         str: Base64-encoded image (no prefix)
     """
+    is_icon = image_format.upper() == "JPG"
+    max_error = get_app_config()["icon_max_error"]
     key = f"{url}|{target_size[0]}x{target_size[1]}|{image_format.upper()}"
+    if is_icon:
+        key += f"|{max_error}"
 
     global _image_cache_dict
-    if "_image_cache_dict" not in globals():
-        # Load persistent cache from disk
-        image_cache_path = get_image_cache_path()
-        if os.path.exists(image_cache_path):
-            try:
-                with open(image_cache_path, "r", encoding="utf-8") as f:
-                    _image_cache_dict = json.load(f)
-            except Exception:
+    with _image_cache_lock:
+        if "_image_cache_dict" not in globals():
+            # Load persistent cache from disk
+            image_cache_path = get_image_cache_path()
+            if os.path.exists(image_cache_path):
+                try:
+                    with open(image_cache_path, "r", encoding="utf-8") as f:
+                        _image_cache_dict = json.load(f)
+                except Exception:
+                    _image_cache_dict = {}
+            else:
                 _image_cache_dict = {}
-        else:
-            _image_cache_dict = {}
 
-    cache = _image_cache_dict
+        cache = _image_cache_dict
 
-    if key in cache:
-        return cache[key]
+        if key in cache:
+            return cache[key]
 
     # Cache miss, process the image
     try:
-        response = requests_get(url)
-        response.raise_for_status()
-
-        image_array = np.frombuffer(response.content, np.uint8)
-        image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-        if image is None:
-            raise ValueError("Failed to decode image")
-        resized_image = cv2.resize(image, target_size)
+        resized_image = fetch_image(url, target_size)
 
         # Encode to specified format
-        success, buffer = cv2.imencode(f".{image_format.lower()}", resized_image)
-        if not success:
-            raise ValueError("Failed to encode image")
-        base64_str = base64.b64encode(buffer).decode("utf-8")
+        if is_icon:
+            base64_str = encode_icon(resized_image, max_error)["payload"]
+        else:
+            success, buffer = cv2.imencode(f".{image_format.lower()}", resized_image)
+            if not success:
+                raise ValueError("Failed to encode image")
+            base64_str = base64.b64encode(buffer).decode("utf-8")
+        metrics.observe("images.icon_bytes", len(base64_str))
 
         # Write to cache (update both memory and disk)
-        cache[key] = base64_str
-        try:
-            image_cache_path = get_image_cache_path()
-            with open(image_cache_path, "w", encoding="utf-8") as f:
-                json.dump(cache, f, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error writing image cache: {e}")
+        with _image_cache_lock:
+            cache[key] = base64_str
+            try:
+                image_cache_path = get_image_cache_path()
+                with open(image_cache_path, "w", encoding="utf-8") as f:
+                    json.dump(cache, f, ensure_ascii=False)
+            except Exception as e:
+                logger.error("Error writing image cache: %s", e)
 
         return base64_str
     except Exception as e:
-        print(f"Error fetching or processing image from {url}: {e}")
+        logger.error("Error fetching or processing image from %s: %s", url, e)
         return None
 
 
@@ -217,3 +465,128 @@ def color_to_packed_rgb(color_value):
     g = int(color.green * 255)
     b = int(color.blue * 255)
     return r << 16 | g << 8 | b
+
+
+def packed_rgb_to_hex(packed):
+    """Convert packed RGB integer to hex color string"""
+    return f"#{packed:06x}"
+
+
+def _cover_with_rectangles(grid, color, paintable, vertical_first=False):
+    """Greedily cover all pixels of `color` with rectangles. Rectangles may also
+    cover pixels of `paintable` colors, which are drawn over afterwards.
+    Returns:
+        list: (x, y, w, h) tuples
+    """
+    height, width = len(grid), len(grid[0])
+    covered = [[False] * width for _ in range(height)]
+    rects = []
+
+    def can_paint(cx, cy):
+        return grid[cy][cx] == color or grid[cy][cx] in paintable
+
+    cells = (
+        [(cx, cy) for cx in range(width) for cy in range(height)]
+        if vertical_first
+        else [(cx, cy) for cy in range(height) for cx in range(width)]
+    )
+    for cx, cy in cells:
+        if grid[cy][cx] != color or covered[cy][cx]:
+            continue
+        w = h = 1
+        if vertical_first:
+            while cy + h < height and can_paint(cx, cy + h):
+                h += 1
+            while cx + w < width and all(can_paint(cx + w, cy + i) for i in range(h)):
+                w += 1
+        else:
+            while cx + w < width and can_paint(cx + w, cy):
+                w += 1
+            while cy + h < height and all(can_paint(cx + i, cy + h) for i in range(w)):
+                h += 1
+        for i in range(h):
+            for j in range(w):
+                covered[cy + i][cx + j] = True
+        rects.append((cx, cy, w, h))
+    return rects
+
+
+def _rectangle_command(x, y, w, h, color):
+    """Smallest draw command for a filled rectangle"""
+    if w == 1 and h == 1:
+        return {"dp": [x, y, color]}
+    if w == 1 or h == 1:
+        return {"dl": [x, y, x + w - 1, y + h - 1, color]}
+    return {"df": [x, y, w, h, color]}
+
+
+def _payload_size(commands):
+    return len(json.dumps(commands, ensure_ascii=False))
+
+
+def optimize_draw_commands(x, y, width, height, packed_pixels, max_backgrounds=3):
+    """Encode a packed-pixel frame as the smallest equivalent list of AWTRIX draw commands.
+    Candidates are the raw bitmap (`db`), and a background fill (`df`) with the other
+    colors drawn as rectangles, lines and pixels (`df`, `dl`, `dp`) or as a bitmap of
+    their bounding box.
+    Args:
+        x (int): Left of the frame on the display
+        y (int): Top of the frame on the display
+        width (int): Frame width
+        height (int): Frame height
+        packed_pixels (list): Packed RGB integers, row by row
+        max_backgrounds (int): How many of the most common colors to try as background
+    Returns:
+        list: Draw commands
+    """
+    grid = [packed_pixels[row * width : (row + 1) * width] for row in range(height)]
+    candidates = [[{"db": [x, y, width, height, list(packed_pixels)]}]]
+
+    for bg, _ in Counter(packed_pixels).most_common(max_backgrounds):
+        background = [{"df": [x, y, width, height, packed_rgb_to_hex(bg)]}]
+
+        # Other colors as shapes, most common first. Shapes may extend over
+        # pixels of less common colors, those are drawn over later.
+        colors = [c for c, _ in Counter(packed_pixels).most_common() if c != bg]
+        shapes = []
+        for i, color in enumerate(colors):
+            hex_color = packed_rgb_to_hex(color)
+            paintable = set(colors[i + 1 :])
+            options = [
+                [
+                    _rectangle_command(x + rx, y + ry, w, h, hex_color)
+                    for rx, ry, w, h in _cover_with_rectangles(
+                        grid, color, paintable, vertical_first
+                    )
+                ]
+                for vertical_first in (False, True)
+            ]
+            shapes.extend(min(options, key=_payload_size))
+        candidates.append(background + shapes)
+
+        # Other colors as bitmap of their bounding box
+        rows = [r for r in range(height) if any(p != bg for p in grid[r])]
+        cols = [c for c in range(width) if any(grid[r][c] != bg for r in rows)]
+        if rows and cols:
+            top, bottom, left, right = rows[0], rows[-1], cols[0], cols[-1]
+            bitmap = [
+                p for row in grid[top : bottom + 1] for p in row[left : right + 1]
+            ]
+            candidates.append(
+                background
+                + [
+                    {
+                        "db": [
+                            x + left,
+                            y + top,
+                            right - left + 1,
+                            bottom - top + 1,
+                            bitmap,
+                        ]
+                    }
+                ]
+            )
+        else:
+            candidates.append(background)
+
+    return min(candidates, key=_payload_size)
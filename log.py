@@ -0,0 +1,134 @@
+import atexit
+import hashlib
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+import metrics
+from config import get_app_config
+
+LOGGER_NAME = "awtrix"
+FORMAT = "%(asctime)s %(levelname)s %(message)s"
+QUEUE_SIZE = 10000  # Records beyond this are dropped rather than blocking callers
+RATE_WINDOW = 60  # Seconds of the per-key rate limit
+DEFAULT_PAYLOAD_LIMIT = 120
+
+logger = logging.getLogger(LOGGER_NAME)
+_payload_limit = DEFAULT_PAYLOAD_LIMIT  # log_payload_limit, set by configure
+
+
+def summarize_payload(payload, limit=None):
+    """Shorten a payload for the log: its start, size and hash
+    Args:
+        payload (str): Payload (e.g. JSON of an app)
+        limit (int): Characters kept, 0 for only size and hash, -1 for all,
+            None for log_payload_limit
+    """
+    if limit is None:
+        limit = _payload_limit
+    if limit < 0 or len(payload) <= limit:
+        return payload
+    digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:8]
+    return f"{payload[:limit]}... ({len(payload)} chars, sha1 {digest})"
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most `limit` records of each rate_key through per RATE_WINDOW,
+    the next record let through tells how many were suppressed.
+    Records without rate_key are not limited."""
+
+    def __init__(self, limit=0):
+        super().__init__()
+        self.limit = limit  # 0: unlimited
+        self.lock = threading.Lock()
+        self.windows = {}  # key -> [window start, records, suppressed]
+
+    def filter(self, record):
+        key = getattr(record, "rate_key", None)
+        if key is None or not self.limit:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= RATE_WINDOW:
+                suppressed = window[2] if window else 0
+                window = self.windows[key] = [now, 0, suppressed]
+            if window[1] >= self.limit:
+                window[2] += 1
+                metrics.incr("log.suppressed")
+                return False
+            window[1] += 1
+            suppressed, window[2] = window[2], 0
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar suppressed)"
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full (e.g. stdout is
+    blocked) instead of blocking or raising in the caller"""
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log.dropped")
+
+
+_lock = threading.Lock()
+_listener = None
+_handler = None
+_rate_filter = RateLimitFilter()
+
+
+def configure(app_config=None):
+    """Set up (or update from the config) the logging pipeline: records are
+    queued by the caller and written to stdout by a background thread
+    Args:
+        app_config (dict): Settings to apply, defaults to get_app_config()
+    """
+    global _listener, _handler, _payload_limit
+    if app_config is None:
+        app_config = get_app_config()
+    level = str(app_config["log_level"]).upper()
+    # Numeric for known level names (getLevelNamesMapping needs Python 3.11)
+    known_level = isinstance(logging.getLevelName(level), int)
+    with _lock:
+        _payload_limit = app_config["log_payload_limit"]
+        if known_level:
+            logger.setLevel(level)
+        _rate_filter.limit = app_config["log_rate_limit"]
+        if _listener is None:
+            stream_handler = logging.StreamHandler(sys.stdout)
+            stream_handler.setFormatter(logging.Formatter(FORMAT))
+            log_queue = queue.Queue(QUEUE_SIZE)
+            _handler = DroppingQueueHandler(log_queue)
+            _handler.addFilter(_rate_filter)
+            logger.addHandler(_handler)
+            logger.propagate = False
+            _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+            _listener.start()
+    if not known_level:
+        # A typo in a reloaded config keeps the running level
+        logger.warning(
+            "Unknown log_level %r, keeping %s",
+            app_config["log_level"],
+            logging.getLevelName(logger.getEffectiveLevel()),
+        )
+
+
+@atexit.register
+def shutdown():
+    """Write out what is still queued and stop the writer thread"""
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            return
+        logger.removeHandler(_handler)
+        logger.propagate = True
+        _listener.stop()
+        _listener = None
+        _handler = None
@@ -1,16 +1,35 @@
+import argparse
 import datetime
 import json
+import logging
+import multiprocessing
 import os
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import as_completed
 from pathlib import Path
 
+import deadline
+import dns_cache
+import log
+import metrics
+import profiling
 from cleanup import cleanup
 from config import get_app_config, get_config
-from mqtt_sender import send_message
-from storage import load
+from demand import (
+    DeviceStatsListener,
+    QueuedStatsListener,
+    RotationTracker,
+    StatsFanout,
+)
+from governor import get_governor, set_shards
+from log import logger
+from shards import SharedResultTable, shard_of
+from storage import load, preload
+from swr import Publisher, ResultStore, ensure_running
 from tasks import load_tasks
+from tasks.base import ClockTask
+from transport import send_message
 
 
 def get_store_dir():
@@ -22,29 +41,70 @@ def get_store_dir():
 
 LAST_RUN_PATH_BASE = "last_run.json"
 ENABLED_TASKS_FILE = "enabled_tasks.json"
+METRICS_FILE = "metrics.json"
+MIN_SLEEP = 0.1  # Minimum seconds to sleep between cycles
+SUPERVISE_INTERVAL = 1  # How often the sharded runtime checks its workers (seconds)
+WORKER_JOIN_TIMEOUT = 5
+STATS_QUEUE_SIZE = 1000  # Device stats messages queued per shard worker
+
+_shard = None  # (shard, shards) in a worker process of the sharded runtime
+_stats_queue = None  # Device stats forwarded by the main process to a worker
+
+
+def get_state_file(filename):
+    """Name of a state file of this process, each shard worker keeps its own"""
+    if _shard is None:
+        return filename
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}-shard{_shard[0]}{ext}"
 
 
 def get_last_run_path():
     """Get last_run.json path from current config"""
-    return str(Path(get_store_dir()) / LAST_RUN_PATH_BASE)
+    return str(Path(get_store_dir()) / get_state_file(LAST_RUN_PATH_BASE))
 
 
 def get_enabled_tasks_path():
     """Get enabled_tasks.json path from current config"""
-    return str(Path(get_store_dir()) / ENABLED_TASKS_FILE)
+    return str(Path(get_store_dir()) / get_state_file(ENABLED_TASKS_FILE))
 
 
-def is_allowed_time():
-    app_config = get_app_config()
-    allowed_hours = app_config["allowed_hours"]
-    now = datetime.datetime.now()
-    hour = now.hour
+def get_metrics_path():
+    """Get metrics.json path from current config"""
+    return str(Path(get_store_dir()) / get_state_file(METRICS_FILE))
+
+
+def is_allowed_hour(hour, allowed_hours):
     for start, end in allowed_hours:
         if start <= hour < end:
             return True
     return False
 
 
+def is_allowed_time():
+    app_config = get_app_config()
+    allowed_hours = app_config["allowed_hours"]
+    now = datetime.datetime.now()
+    return is_allowed_hour(now.hour, allowed_hours)
+
+
+def get_next_window_change(now, allowed_hours):
+    """Get the next time `allowed_hours` switches between allowed and not allowed
+    Args:
+        now (datetime): Current time
+        allowed_hours (list): [[start, end], ...] in hours
+    Returns:
+        datetime: Time of the next switch, None if it never switches
+    """
+    allowed = is_allowed_hour(now.hour, allowed_hours)
+    boundary = now.replace(minute=0, second=0, microsecond=0)
+    for _ in range(24):
+        boundary += datetime.timedelta(hours=1)
+        if is_allowed_hour(boundary.hour, allowed_hours) != allowed:
+            return boundary
+    return None
+
+
 def load_last_run():
     last_run_path = get_last_run_path()
     if os.path.exists(last_run_path):
@@ -75,71 +135,293 @@ def save_enabled_tasks(enabled_tasks):
         json.dump(enabled_tasks, f)
 
 
-def sort_results_by_priority(tasks, results):
-    """Sort results by task priority"""
-    # Map task name to priority
-    task_priority_map = {task.name: task.priority for task in tasks}
+def get_priority_index(tasks):
+    """Map task name to its rank (tasks are kept sorted by priority)"""
+    return {task.name: rank for rank, task in enumerate(tasks)}
 
-    # Sort by priority (lower value = higher priority)
-    sorted_items = sorted(
-        results.items(), key=lambda x: task_priority_map.get(x[0], 999)
-    )
-
-    # Return ordered dict
-    from collections import OrderedDict
 
-    return OrderedDict(sorted_items)
+def send_result(task_name, result, send_interval):
+    payload = json.dumps(result, ensure_ascii=False)
+    # Summarizing hashes the payload, skipped when INFO is not logged
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "sending %s: %s",
+            task_name,
+            log.summarize_payload(payload),
+            extra={"rate_key": f"{task_name}.send"},
+        )
+    try:
+        send_message(task_name, payload)
+    except Exception as e:
+        # Results are sent again every cycle
+        logger.error(
+            "Failed to send %s: %s",
+            task_name,
+            e,
+            extra={"rate_key": f"{task_name}.send_error"},
+        )
+        metrics.incr("publisher.errors")
+    time.sleep(send_interval)
+
+
+def get_due_time(task, last_run, tracker=None):
+    """Get the time a task is due, following the device's rotation when tracked"""
+    last_time = last_run.get(task.name, 0)
+    due_time = task.get_next_run_time(last_time)
+    if tracker is None or isinstance(task, ClockTask) or not last_time:
+        return due_time
+    return tracker.adjust_due_time(
+        task.name,
+        due_time,
+        get_app_config()["demand_lead"],
+        has_content=bool(load(task.name)),
+    )
 
 
-def run_single_task(task):
-    """Run a single task with timeout"""
-    app_config = get_app_config()
-    task_timeout = app_config["task_timeout"]
-    finished = [False]
-    output = [None]
+def submit_task(task, due_time=0):
+    """Queue a task run on the governor (by priority, then due time)
+    Returns:
+        Future: (task name, result), with the old data if the run takes
+            longer than task_timeout
+    """
+    task_timeout = get_app_config()["task_timeout"]
 
-    def worker():
+    def run():
         try:
-            output[0] = task.run()
+            # HTTP / socket calls of the task take their timeouts from this budget
+            with deadline.within(task_timeout), profiling.profiled(task.name):
+                return task.name, task.run()
         except Exception as e:
-            print(task.name, "error:", e)
-        finally:
-            finished[0] = True
-
-    thread = threading.Thread(target=worker)
-    thread.start()
-    thread.join(task_timeout)
-
-    if finished[0]:
-        return task.name, output[0]
-    else:
-        print(task.name, "timeout using old data")
+            logger.error(
+                "%s error: %s", task.name, e, extra={"rate_key": f"{task.name}.error"}
+            )
+            return task.name, None
+
+    def on_timeout():
+        logger.warning(
+            "%s timeout using old data",
+            task.name,
+            extra={"rate_key": f"{task.name}.error"},
+        )
         return task.name, load(task.name)
 
+    return get_governor().submit(
+        run,
+        priority=task.priority,
+        deadline=due_time,
+        timeout=task_timeout,
+        on_timeout=on_timeout,
+        key=task.name,
+    )
+
 
-def main_loop():
+def apply_config(tasks, config):
+    """Reconfigure only the tasks whose config section changed,
+    other tasks keep their clients, caches and schedule
+    Returns:
+        list: Names of reconfigured tasks
+    """
+    changed = []
+    for task in tasks:
+        task_config = config.get("tasks", {}).get(task.name, {})
+        if task_config != task.task_config:
+            task.reconfigure(task_config)
+            changed.append(task.name)
+    if changed:
+        # Keep tasks ordered by priority
+        tasks.sort(key=lambda t: t.priority)
+    return changed
+
+
+def run_tasks(tasks_to_run, results, last_run, now):
+    """Run tasks in parallel, collect results and update last_run time"""
+    futures = [
+        submit_task(task, task.get_next_run_time(last_run.get(task.name, 0)))
+        for task in tasks_to_run
+    ]
+    for future in as_completed(futures):
+        task_name, result = future.result()
+        results[task_name] = result
+        # Update last_run time
+        last_run[task_name] = now
+    save_last_run(last_run)
+
+
+def run_and_publish(tasks_to_run, results, last_run, now, priority_index):
+    """Run due tasks in parallel and send all results of the cycle by priority.
+    A result is sent as soon as it and every higher priority result are ready,
+    so a fast important task does not wait for a slow unimportant one."""
+    send_interval = get_app_config()["send_interval"]
+    slots = [None] * len(priority_index)  # (name, result) by priority rank
+    pending = [False] * len(priority_index)
+    for task_name, result in results.items():
+        slots[priority_index[task_name]] = (task_name, result)
+    for task in tasks_to_run:
+        pending[priority_index[task.name]] = True
+    next_rank = 0
+
+    def flush():
+        nonlocal next_rank
+        while next_rank < len(slots) and not pending[next_rank]:
+            item = slots[next_rank]
+            next_rank += 1
+            if item is not None:
+                send_result(*item, send_interval)
+
+    flush()
+    if not tasks_to_run:
+        return
+    futures = [
+        submit_task(task, task.get_next_run_time(last_run.get(task.name, 0)))
+        for task in tasks_to_run
+    ]
+    for future in as_completed(futures):
+        task_name, result = future.result()
+        results[task_name] = result
+        last_run[task_name] = now
+        rank = priority_index[task_name]
+        slots[rank] = (task_name, result)
+        pending[rank] = False
+        flush()
+    save_last_run(last_run)
+
+
+def submit_refresh(task, store, in_flight):
+    """Refresh a task in the background, its result goes to the result store
+    Returns:
+        bool: Whether it was submitted (False if it is still running)
+    """
+    if task.name in in_flight:
+        return False
+    in_flight.add(task.name)
+
+    def done(future):
+        task_name, result = future.result()
+        store.put(task_name, result, completed_at=time.monotonic())
+        in_flight.discard(task_name)
+
+    submit_task(task).add_done_callback(done)
+    return True
+
+
+def prefetch_tasks(tasks, last_run, window_open_time):
+    """Run tasks that would be due when the window opens, so the first frame is fresh"""
+    now = time.time()
+    tasks_to_run = [
+        task
+        for task in tasks
+        if not isinstance(task, ClockTask)
+        and task.enabled
+        and task.get_next_run_time(last_run.get(task.name, 0)) <= window_open_time
+    ]
+    if tasks_to_run:
+        logger.info("Prefetching %d tasks...", len(tasks_to_run))
+        run_tasks(tasks_to_run, {}, last_run, now)
+
+
+def main_loop(store=None):
+    """Run the tasks and publish their results
+    Args:
+        store (SharedResultTable): In a shard worker, the table results go to
+            (they are published by the main process)
+    """
+    log.configure()
+    if get_app_config()["dns_cache"]:
+        dns_cache.install()
+    os.makedirs(get_store_dir(), exist_ok=True)
     tasks = load_tasks()
+    if _shard is not None:
+        tasks = [task for task in tasks if shard_of(task.name, _shard[1]) == _shard[0]]
+    # Fill in-memory result table, later reads do not touch the disk
+    preload([task.name for task in tasks])
     # Load last_run time from persistent storage
     last_run = load_last_run()
     # Load previously enabled tasks state
     enabled_tasks = load_enabled_tasks()
-    config_check_interval = 10  # Check config every 10 seconds
-    last_config_check = time.time()
+    applied_config = get_config()
+    priority_index = get_priority_index(tasks)
+    last_metrics_dump = time.time()
+    in_window = True
+    prefetched = False
+
+    # Demand-driven mode: refresh apps just before the device shows them
+    tracker = None
+    if get_app_config()["demand_driven"]:
+        tracker = RotationTracker()
+        if _stats_queue is not None:
+            # The main process follows the device for all shards
+            QueuedStatsListener(tracker, _stats_queue).start()
+        else:
+            DeviceStatsListener(tracker).start()
+
+    # Stale-while-revalidate mode: tasks refresh in the background and
+    # a publisher thread sends each result as soon as it changes
+    swr_mode = store is not None or get_app_config()["mode"] == "swr"
+    publisher = None
+    if swr_mode:
+        if store is None:
+            store = ResultStore()
+            publisher = Publisher(
+                store,
+                get_priorities=lambda: priority_index,
+                get_send_interval=lambda: get_app_config()["send_interval"],
+            )
+            publisher.start()
+        in_flight = set()
 
     try:
         while True:
-            # Reload config periodically
-            current_time = time.time()
-            if current_time - last_config_check >= config_check_interval:
-                config = get_app_config()
-                last_config_check = current_time
+            # Apply config changes (the file is only parsed again when it changed)
+            config = get_config()
+            if config is not applied_config:
+                changed = apply_config(tasks, config)
+                applied_config = config
+                log.configure()
+                if changed:
+                    logger.info("Config changed: %s", ", ".join(changed))
+                    priority_index = get_priority_index(tasks)
 
             if not is_allowed_time():
-                print("Sleeping...")
-                cleanup()
-                time.sleep(1800)  # Sleep for 30 minutes
+                # Clean up once when leaving the window
+                if in_window:
+                    logger.info("Sleeping...")
+                    if publisher is not None:
+                        publisher.pause()
+                    if _shard is None:
+                        # Shard workers leave the display to the main process
+                        cleanup()
+                    in_window = False
+                    prefetched = False
+
+                # Sleep until the window opens, prefetch a bit before that
+                app_config = get_app_config()
+                window_open = get_next_window_change(
+                    datetime.datetime.now(), app_config["allowed_hours"]
+                )
+                if window_open is None:
+                    # Never allowed
+                    time.sleep(app_config["main_loop_interval"])
+                    continue
+                window_open_time = window_open.timestamp()
+                prefetch_time = window_open_time - app_config["prefetch_lead"]
+                if not prefetched and time.time() < prefetch_time:
+                    time.sleep(prefetch_time - time.time())
+                    continue
+                if not prefetched:
+                    prefetch_tasks(tasks, last_run, window_open_time)
+                    prefetched = True
+                time.sleep(max(0, window_open_time - time.time()))
                 continue
 
+            if not in_window and publisher is not None:
+                # Display was cleaned up, publish everything again
+                store.mark_all_changed()
+                publisher.resume()
+            in_window = True
+            if publisher is not None:
+                publisher = ensure_running(publisher)
+            profile = profiling.start("cycle")
+
             now = time.time()
             results = {}
             tasks_to_run = []
@@ -148,9 +430,7 @@ def main_loop():
 
             for task in tasks:
                 # Get current enabled state from config
-                config = get_config()
-                task_config = config.get("tasks", {}).get(task.name, {})
-                enabled = task_config.get("enabled", True)
+                enabled = task.enabled
                 current_enabled_state[task.name] = enabled
 
                 # Check if task was previously enabled but now disabled
@@ -158,55 +438,217 @@ def main_loop():
                     if enabled_tasks.get(task.name, True):
                         # Task was enabled before, now disabled -> send empty message
                         results[task.name] = {}
-                        print(f"Task {task.name} disabled, sending empty message")
+                        logger.info(
+                            "Task %s disabled, sending empty message", task.name
+                        )
                     disabled_tasks.append(task)
                     continue
 
-                last_time = last_run.get(task.name, 0)
-                if now - last_time >= task.interval:
-                    tasks_to_run.append(task)
+                due_time = get_due_time(task, last_run, tracker)
+                if now >= due_time:
+                    if tracker is not None and task.interval:
+                        # Runs the fixed schedule would have made meanwhile
+                        skipped = (now - last_run.get(task.name, now)) // task.interval
+                        if skipped > 1:
+                            metrics.incr("demand.calls_saved", int(skipped) - 1)
+                    if isinstance(task, ClockTask):
+                        # Pure computation, run inline
+                        results[task.name] = task.run()
+                        last_run[task.name] = now
+                    else:
+                        tasks_to_run.append(task)
                 else:
-                    # Use old data
-                    prev = load(task.name)
+                    # Use old data (tasks may refresh it locally)
+                    prev = task.get_latest_message()
+                    if prev is None:
+                        prev = load(task.name)
                     results[task.name] = prev
 
-            # Run all tasks that need to be executed in parallel
-            if tasks_to_run:
-                with ThreadPoolExecutor(max_workers=len(tasks_to_run)) as executor:
-                    future_to_task = {
-                        executor.submit(run_single_task, task): task
-                        for task in tasks_to_run
-                    }
-                    for future in as_completed(future_to_task):
-                        task_name, result = future.result()
-                        results[task_name] = result
-                        # Update last_run time
-                        last_run[task_name] = now
-                save_last_run(last_run)
-
             # Update enabled tasks state
-            enabled_tasks = current_enabled_state
-            save_enabled_tasks(enabled_tasks)
-
-            # Sort results by priority and send one by one
-            sorted_results = sort_results_by_priority(tasks, results)
+            if current_enabled_state != enabled_tasks:
+                enabled_tasks = current_enabled_state
+                save_enabled_tasks(enabled_tasks)
+
+            if swr_mode:
+                # Refresh due tasks in the background, publish what changed
+                for task in tasks_to_run:
+                    if submit_refresh(task, store, in_flight):
+                        last_run[task.name] = now
+                if tasks_to_run:
+                    save_last_run(last_run)
+                for task_name, result in results.items():
+                    store.put(task_name, result)
+            else:
+                # Send results by priority while the due tasks finish
+                run_and_publish(tasks_to_run, results, last_run, now, priority_index)
+
+            if profile is not None:
+                profile.stop()
 
             app_config = get_app_config()
-            send_interval = app_config["send_interval"]
-
-            for task_name, result in sorted_results.items():
-                payload = json.dumps(result, ensure_ascii=False)
-                print(f"sending {task_name}:", payload)
-                send_message(task_name, payload)
-                time.sleep(send_interval)
+            if time.time() - last_metrics_dump >= app_config["metrics_interval"]:
+                os.makedirs(get_store_dir(), exist_ok=True)
+                metrics.dump(get_metrics_path())
+                last_metrics_dump = time.time()
 
-            app_config = get_app_config()
+            # Sleep until the next cycle, or earlier if a task is due before that
             main_loop_interval = app_config["main_loop_interval"]
-            time.sleep(main_loop_interval)
+            next_due = min(
+                (
+                    get_due_time(task, last_run, tracker)
+                    for task in tasks
+                    if current_enabled_state.get(task.name)
+                ),
+                default=time.time() + main_loop_interval,
+            )
+            sleep_time = min(main_loop_interval, next_due - time.time())
+            time.sleep(max(MIN_SLEEP, sleep_time))
+    except KeyboardInterrupt:
+        if _shard is None:
+            logger.info("Program interrupted. Cleaning up...")
+            cleanup()
+
+
+def run_shard(shard, shards, table_spec, profile=None, stats_queue=None):
+    """Worker process of the sharded runtime: runs the tasks of one shard.
+    max_workers and the host limits are split between the workers.
+    Args:
+        shard (int): Index of this worker's shard
+        shards (int): Number of shards
+        table_spec (tuple): SharedResultTable.spec() of the result table
+        profile (tuple): Arguments of profiling.enable, None for no profiling
+        stats_queue: Queue of device stats messages from the main process
+            (demand_driven), None to subscribe to them itself
+    """
+    global _shard, _stats_queue
+    _shard = (shard, shards)
+    _stats_queue = stats_queue
+    set_shards(shards)
+    if profile is not None:
+        profiling.enable(*profile)
+    table = SharedResultTable(*table_spec)
+    try:
+        main_loop(store=table)
+    finally:
+        table.close()
+
+
+def run_sharded(shards, profile=None):
+    """Run the tasks in worker processes, each owning the tasks whose name hashes
+    to its shard. Their results go through a shared-memory result table to the
+    publisher of this process.
+    Args:
+        shards (int): Number of worker processes
+        profile (tuple): Arguments of profiling.enable for the workers
+    """
+    log.configure()
+    tasks = load_tasks()
+    priority_index = get_priority_index(tasks)
+    applied_config = get_config()
+    context = multiprocessing.get_context("spawn")
+    table = SharedResultTable.create(
+        sorted(task.name for task in tasks),
+        get_app_config()["shard_slot_size"],
+        context,
+    )
+    workers = {}
+    # Demand-driven mode: one connection to the device's stats for all workers
+    stats_queues = []
+    if get_app_config()["demand_driven"]:
+        stats_queues = [context.Queue(STATS_QUEUE_SIZE) for _ in range(shards)]
+        DeviceStatsListener(StatsFanout(stats_queues)).start()
+
+    def start_worker(shard):
+        stats_queue = stats_queues[shard] if stats_queues else None
+        worker = context.Process(
+            target=run_shard,
+            args=(shard, shards, table.spec(), profile, stats_queue),
+            name=f"shard-{shard}",
+            daemon=True,
+        )
+        worker.start()
+        workers[shard] = worker
+
+    for shard in range(shards):
+        start_worker(shard)
+    publisher = Publisher(
+        table,
+        get_priorities=lambda: priority_index,
+        get_send_interval=lambda: get_app_config()["send_interval"],
+    )
+    publisher.start()
+    last_metrics_dump = time.time()
+    in_window = True
+
+    try:
+        while True:
+            # Workers apply task changes themselves, only priorities matter here
+            config = get_config()
+            if config is not applied_config:
+                if apply_config(tasks, config):
+                    priority_index = get_priority_index(tasks)
+                applied_config = config
+                log.configure()
+
+            if not is_allowed_time():
+                if in_window:
+                    logger.info("Sleeping...")
+                    publisher.pause()
+                    cleanup()
+                    in_window = False
+            elif not in_window:
+                # Display was cleaned up, publish everything again
+                table.mark_all_changed()
+                publisher.resume()
+                in_window = True
+
+            publisher = ensure_running(publisher)
+            for shard, worker in list(workers.items()):
+                if not worker.is_alive():
+                    logger.error(
+                        "Shard %d exited (code %s), restarting", shard, worker.exitcode
+                    )
+                    metrics.incr("shards.restarts")
+                    start_worker(shard)
+
+            if time.time() - last_metrics_dump >= get_app_config()["metrics_interval"]:
+                os.makedirs(get_store_dir(), exist_ok=True)
+                metrics.dump(get_metrics_path())
+                last_metrics_dump = time.time()
+            time.sleep(SUPERVISE_INTERVAL)
     except KeyboardInterrupt:
-        print("Program interrupted. Cleaning up...")
+        logger.info("Program interrupted. Cleaning up...")
+        publisher.stop()
+        for worker in workers.values():
+            worker.join(WORKER_JOIN_TIMEOUT)
+            if worker.is_alive():
+                worker.terminate()
         cleanup()
+    finally:
+        table.close()
 
 
 if __name__ == "__main__":
-    main_loop()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--profile",
+        nargs="*",
+        metavar="TARGET",
+        help='profile sampled cycles and task runs ("cycle" and / or task names, '
+        "default: all), reports go to store_dir/profiles",
+    )
+    parser.add_argument(
+        "--profile-ratio",
+        type=float,
+        help="share of runs to profile (default: profile_sample_ratio of the config)",
+    )
+    args = parser.parse_args()
+    profile = None
+    if args.profile is not None:
+        profile = (args.profile, args.profile_ratio)
+        profiling.enable(*profile)
+    shards = get_app_config()["shards"]
+    if shards > 1:
+        run_sharded(shards, profile)
+    else:
+        main_loop()
@@ -0,0 +1,61 @@
+import json
+import threading
+import time
+
+_lock = threading.Lock()
+_counters = {}
+_observations = {}
+_gauges = {}
+
+
+def incr(name, value=1):
+    """Increase a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def observe(name, value):
+    """Record one observation (e.g. a latency) for a summary"""
+    with _lock:
+        summary = _observations.setdefault(
+            name, {"count": 0, "total": 0.0, "min": None, "max": None}
+        )
+        summary["count"] += 1
+        summary["total"] += value
+        summary["min"] = value if summary["min"] is None else min(summary["min"], value)
+        summary["max"] = value if summary["max"] is None else max(summary["max"], value)
+
+
+def set_gauge(name, value):
+    """Set a gauge to the latest value"""
+    with _lock:
+        _gauges[name] = value
+
+
+def snapshot():
+    """Get a copy of all metrics"""
+    with _lock:
+        observations = {}
+        for name, summary in _observations.items():
+            observations[name] = dict(summary)
+            observations[name]["avg"] = summary["total"] / summary["count"]
+        return {
+            "time": time.time(),
+            "counters": dict(_counters),
+            "observations": observations,
+            "gauges": dict(_gauges),
+        }
+
+
+def dump(path):
+    """Write metrics snapshot to a JSON file"""
+    with open(path, "w") as f:
+        json.dump(snapshot(), f, ensure_ascii=False)
+
+
+def reset():
+    """Clear all metrics"""
+    with _lock:
+        _counters.clear()
+        _observations.clear()
+        _gauges.clear()
@@ -0,0 +1,202 @@
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from config import get_app_config
+from log import logger
+from storage import get_store_dir
+
+PROFILES_DIR = "profiles"
+TRACE_FRAMES = 1
+CYCLE = "cycle"
+
+_targets = None  # None: profiling off, empty: everything, else cycle / task names
+_ratio = None  # Overrides profile_sample_ratio of the config
+_lock = threading.Lock()
+_cycle = None  # Profile of the running cycle, task runs on worker threads add to it
+# tracemalloc is process wide: started by the first recording profile, stopped by
+# the last one
+_tracers = 0
+_own_tracing = False
+
+
+def enable(targets=(), ratio=None):
+    """Turn on profiling
+    Args:
+        targets (iterable): "cycle" and / or task names, empty for everything
+        ratio (float): Share of runs to profile, None for profile_sample_ratio
+    """
+    global _targets, _ratio
+    _targets = set(targets)
+    _ratio = ratio
+
+
+def get_profiles_dir():
+    return str(Path(get_store_dir()) / PROFILES_DIR)
+
+
+def _start_tracing():
+    global _tracers, _own_tracing
+    with _lock:
+        if _tracers == 0:
+            _own_tracing = not tracemalloc.is_tracing()
+            if _own_tracing:
+                tracemalloc.start(TRACE_FRAMES)
+            tracemalloc.reset_peak()
+        _tracers += 1
+        return tracemalloc.take_snapshot()
+
+
+def _stop_tracing():
+    """Take the final snapshot of a profile
+    Returns:
+        tuple: (snapshot, peak bytes since the first running profile started)
+    """
+    global _tracers
+    with _lock:
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        _tracers -= 1
+        if _tracers == 0 and _own_tracing:
+            tracemalloc.stop()
+        return snapshot, peak
+
+
+class Profile:
+    """cProfile + tracemalloc recording of one cycle or task run.
+    cProfile only sees its own thread: the profile of a cycle also gets the
+    task runs that worker threads finish while it runs."""
+
+    def __init__(self, label, record=True, cycle=None):
+        """
+        Args:
+            label (str): Name used in the file names
+            record (bool): Whether to write this run's files (False: only
+                added to the cycle)
+            cycle (Profile): Running cycle profile to add this run to
+        """
+        self.label = label
+        self.record = record
+        self.cycle = cycle
+        self.profiler = cProfile.Profile()
+        self.runs = []  # Profilers of the task runs of this cycle
+        self.snapshot = None
+        self.start_time = 0
+
+    def start(self):
+        if self.record:
+            self.snapshot = _start_tracing()
+        self.start_time = time.perf_counter()
+        self.profiler.enable()
+
+    def stop(self):
+        """Stop recording, add to the cycle and write <label>-<time>.pstats
+        and -alloc.txt
+        Returns:
+            str: Path of the .pstats file, None if not recorded
+        """
+        global _cycle
+        self.profiler.disable()
+        elapsed = time.perf_counter() - self.start_time
+        with _lock:
+            if _cycle is self:
+                _cycle = None
+            elif self.cycle is not None and _cycle is self.cycle:
+                # Runs finishing after the cycle was written are left out
+                self.cycle.runs.append(self.profiler)
+        if not self.record:
+            return None
+        snapshot, peak = _stop_tracing()
+
+        profiles_dir = get_profiles_dir()
+        os.makedirs(profiles_dir, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        base = str(Path(profiles_dir) / f"{self.label}-{stamp}")
+        stats = pstats.Stats(self.profiler)
+        with _lock:
+            runs = list(self.runs)
+        if runs:
+            stats.add(*runs)
+        stats.dump_stats(f"{base}.pstats")
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+        stats = snapshot.filter_traces(filters).compare_to(
+            self.snapshot.filter_traces(filters), "lineno"
+        )
+        top = get_app_config()["profile_top"]
+        with open(f"{base}-alloc.txt", "w", encoding="utf-8") as f:
+            f.write(
+                f"{self.label}: {elapsed * 1000:.1f} ms, peak {peak / 1024:.1f} KiB\n"
+            )
+            if runs:
+                f.write(f"Includes {len(runs)} task runs on worker threads\n")
+            f.write(f"Top {top} allocations (all threads) by size:\n")
+            for stat in stats[:top]:
+                f.write(f"{stat}\n")
+        logger.info("Profile of %s written to %s.pstats", self.label, base)
+        return f"{base}.pstats"
+
+
+def start(label, target=None):
+    """Start profiling a run if it is a target and sampled. A task run during a
+    profiled cycle is always profiled, to be added to the cycle.
+    Args:
+        label (str): Name used in the file names
+        target (str): Target name to match (defaults to label)
+    Returns:
+        Profile: Started profile to stop() after the run, or None
+    """
+    global _cycle
+    if _targets is None:
+        return None
+    target = target or label
+    record = not _targets or target in _targets
+    if record:
+        ratio = (
+            _ratio if _ratio is not None else get_app_config()["profile_sample_ratio"]
+        )
+        record = random.random() < ratio
+    if target == CYCLE:
+        if not record:
+            return None
+        profile = Profile(label)
+        with _lock:
+            if _cycle is not None:
+                # Another cycle is being profiled
+                return None
+            _cycle = profile
+    else:
+        cycle = _cycle
+        if not record and cycle is None:
+            return None
+        profile = Profile(label, record, cycle)
+    try:
+        profile.start()
+    except BaseException:
+        with _lock:
+            if _cycle is profile:
+                _cycle = None
+        raise
+    return profile
+
+
+@contextmanager
+def profiled(label, target=None):
+    """Profile the code in this block (see start)"""
+    profile = start(label, target)
+    try:
+        yield profile
+    finally:
+        if profile is not None:
+            profile.stop()
@@ -0,0 +1,134 @@
+import json
+import struct
+import time
+import zlib
+from multiprocessing import shared_memory
+
+import metrics
+from log import logger
+
+# Per slot: version (bumped on every write), monotonic time the result was
+# completed at, payload length. The payload (UTF-8 JSON) follows.
+SLOT_HEADER = struct.Struct("QdI")
+
+
+def shard_of(name, shards):
+    """Shard that owns a task, the same in every process (unlike hash())"""
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+class SharedResultTable:
+    """Newest payload of each app in shared memory, one fixed-size slot per app.
+    A slot is only written by the process whose shard owns the app, the
+    publisher process reads all of them. Has the interface of swr.ResultStore
+    (put / wait_changes / mark_all_changed), results are read back as encoded
+    JSON payloads."""
+
+    def __init__(self, names, slot_size, lock, event, shm_name=None):
+        """Create the table, or attach to the one of shm_name
+        Args:
+            names (list): App names, in the same order in every process
+            slot_size (int): Largest payload (bytes)
+            lock: multiprocessing Lock guarding the slots
+            event: multiprocessing Event set after every write
+            shm_name (str): Shared memory to attach to, None to create it
+        """
+        self.names = list(names)
+        self.slots = {name: i for i, name in enumerate(self.names)}
+        self.slot_size = slot_size
+        self.stride = SLOT_HEADER.size + slot_size
+        self.lock = lock
+        self.event = event
+        self.owner = shm_name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(
+                create=True, size=max(1, self.stride * len(self.names))
+            )
+        else:
+            # Workers share the resource tracker of the creating process,
+            # which unlinks the memory (also if it dies)
+            self.shm = shared_memory.SharedMemory(name=shm_name)
+        self.written = {}  # name -> payload last written by this process
+        self.seen = {}  # name -> version last read by this process
+
+    @classmethod
+    def create(cls, names, slot_size, context):
+        """Create a table (in the publisher process)
+        Args:
+            context: multiprocessing context the workers are started with
+        """
+        return cls(names, slot_size, context.Lock(), context.Event())
+
+    def spec(self):
+        """Arguments that attach a worker process to this table"""
+        return self.names, self.slot_size, self.lock, self.event, self.shm.name
+
+    def put(self, name, result, completed_at=None):
+        """Store a result of an app this process owns
+        Returns:
+            bool: Whether the result changed
+        """
+        payload = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        if self.written.get(name) == payload:
+            return False
+        if len(payload) > self.slot_size:
+            logger.error(
+                "Result of %s is %d bytes, larger than shard_slot_size",
+                name,
+                len(payload),
+                extra={"rate_key": f"{name}.error"},
+            )
+            metrics.incr("shards.oversized")
+            return False
+        offset = self.slots[name] * self.stride
+        start = offset + SLOT_HEADER.size
+        buf = self.shm.buf
+        with self.lock:
+            version = SLOT_HEADER.unpack_from(buf, offset)[0]
+            buf[start : start + len(payload)] = payload
+            SLOT_HEADER.pack_into(
+                buf,
+                offset,
+                version + 1,
+                completed_at or time.monotonic(),
+                len(payload),
+            )
+        self.written[name] = payload
+        self.event.set()
+        return True
+
+    def wait_changes(self, timeout=None):
+        """Wait for results written since the last call
+        Returns:
+            dict: name -> (JSON payload, completed_at)
+        """
+        self.event.wait(timeout)
+        # Cleared before reading, a write from now on wakes up the next call
+        self.event.clear()
+        changes = {}
+        buf = self.shm.buf
+        with self.lock:
+            for name, slot in self.slots.items():
+                offset = slot * self.stride
+                version, completed_at, length = SLOT_HEADER.unpack_from(buf, offset)
+                if version == self.seen.get(name, 0):
+                    continue
+                self.seen[name] = version
+                start = offset + SLOT_HEADER.size
+                payload = bytes(buf[start : start + length]).decode("utf-8")
+                changes[name] = (payload, completed_at)
+        return changes
+
+    def mark_all_changed(self):
+        """Read all results again (e.g. after the display was cleaned up)"""
+        self.seen.clear()
+        self.event.set()
+
+    def wake(self):
+        """Return from wait_changes early"""
+        self.event.set()
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -1,9 +1,16 @@
 import json
 import os
+import threading
 from pathlib import Path
 
+import metrics
 from config import get_app_config
 
+# Write-through result table: all reads are served from memory,
+# disk is only written when a result changes
+_results = {}
+_lock = threading.Lock()
+
 
 def get_store_dir():
     """Get store directory from current config"""
@@ -18,18 +25,48 @@ def _ensure_store_dir():
         os.makedirs(store_dir)
 
 
+def _read(task_name):
+    store_dir = get_store_dir()
+    path = str(Path(store_dir) / f"{task_name}.json")
+    if not os.path.exists(path):
+        return None
+    metrics.incr("storage.disk_reads")
+    with open(path) as f:
+        return json.load(f)
+
+
+def preload(task_names):
+    """Fill the result table from disk, once at startup"""
+    for task_name in task_names:
+        data = _read(task_name)
+        with _lock:
+            _results.setdefault(task_name, data)
+
+
 def save(task_name, data):
+    with _lock:
+        if task_name in _results and _results[task_name] == data:
+            return
+        _results[task_name] = data
     _ensure_store_dir()
     store_dir = get_store_dir()
     path = str(Path(store_dir) / f"{task_name}.json")
+    metrics.incr("storage.disk_writes")
     with open(path, "w") as f:
         json.dump(data, f)
 
 
 def load(task_name):
-    store_dir = get_store_dir()
-    path = str(Path(store_dir) / f"{task_name}.json")
-    if not os.path.exists(path):
-        return None
-    with open(path) as f:
-        return json.load(f)
+    with _lock:
+        if task_name in _results:
+            return _results[task_name]
+    # Not preloaded, read from disk once
+    data = _read(task_name)
+    with _lock:
+        return _results.setdefault(task_name, data)
+
+
+def clear():
+    """Drop the in-memory result table"""
+    with _lock:
+        _results.clear()
@@ -0,0 +1,165 @@
+import json
+import logging
+import threading
+import time
+
+import metrics
+from log import logger, summarize_payload
+from transport import send_message
+
+RETRY_MIN = 1  # Seconds before sending a result again after a failed send
+RETRY_MAX = 60  # Longest wait between retries, doubling from RETRY_MIN
+
+
+class ResultStore:
+    """Newest result of each app, written by the task runners and read by the publisher"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.results = {}
+        self.changed = {}  # name -> monotonic time the result became available
+
+    def put(self, name, result, completed_at=None):
+        """Store a result, the publisher is woken up if it changed
+        Returns:
+            bool: Whether the result changed
+        """
+        with self.cond:
+            if name in self.results and self.results[name] == result:
+                return False
+            self.results[name] = result
+            self.changed[name] = completed_at or time.monotonic()
+            self.cond.notify()
+            return True
+
+    def mark_all_changed(self):
+        """Publish all results again (e.g. after the display was cleaned up)"""
+        with self.cond:
+            now = time.monotonic()
+            for name in self.results:
+                self.changed.setdefault(name, now)
+            self.cond.notify()
+
+    def wake(self):
+        """Return from wait_changes early"""
+        with self.cond:
+            self.cond.notify()
+
+    def wait_changes(self, timeout=None):
+        """Wait for changed results
+        Returns:
+            dict: name -> (result, completed_at)
+        """
+        with self.cond:
+            if not self.changed:
+                self.cond.wait(timeout)
+            changes = {
+                name: (self.results[name], completed_at)
+                for name, completed_at in self.changed.items()
+            }
+            self.changed.clear()
+            return changes
+
+
+class Publisher(threading.Thread):
+    """Sends the newest result of each app as soon as it changes, by priority.
+    A result that failed to send is sent again with backoff, until it is sent
+    or replaced by a newer one."""
+
+    def __init__(self, store, get_priorities, get_send_interval):
+        super().__init__(name="publisher", daemon=True)
+        self.store = store
+        self.get_priorities = get_priorities
+        self.get_send_interval = get_send_interval
+        self.stop_event = threading.Event()
+        self.paused = threading.Event()
+        self.retries = {}  # name -> (retry_at, delay, result, completed_at)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            timeout = 1
+            if self.retries:
+                next_retry = min(retry[0] for retry in self.retries.values())
+                timeout = max(0, min(timeout, next_retry - time.monotonic()))
+            changes = self.store.wait_changes(timeout=timeout)
+            if self.paused.is_set():
+                # Dropped, all results are published again on resume
+                self.retries.clear()
+                continue
+            now = time.monotonic()
+            for name, (retry_at, _, result, completed_at) in self.retries.items():
+                # A newer result replaces the one to retry
+                if retry_at <= now and name not in changes:
+                    changes[name] = (result, completed_at)
+            priorities = self.get_priorities()
+            for name in sorted(changes, key=lambda n: priorities.get(n, 999)):
+                result, completed_at = changes[name]
+                # Results of a shared result table are already encoded
+                if isinstance(result, str):
+                    payload = result
+                else:
+                    payload = json.dumps(result, ensure_ascii=False)
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        "sending %s: %s",
+                        name,
+                        summarize_payload(payload),
+                        extra={"rate_key": f"{name}.send"},
+                    )
+                try:
+                    send_message(name, payload)
+                except Exception as e:
+                    # Keep publishing the other apps, this one is retried later
+                    previous = self.retries.get(name)
+                    delay = min(RETRY_MAX, previous[1] * 2) if previous else RETRY_MIN
+                    self.retries[name] = (
+                        time.monotonic() + delay,
+                        delay,
+                        result,
+                        completed_at,
+                    )
+                    logger.error(
+                        "Failed to send %s, retrying in %ds: %s",
+                        name,
+                        delay,
+                        e,
+                        extra={"rate_key": f"{name}.send_error"},
+                    )
+                    metrics.incr("publisher.errors")
+                else:
+                    self.retries.pop(name, None)
+                    # Time from fetch completion to publish
+                    metrics.observe(
+                        f"{name}.publish_latency", time.monotonic() - completed_at
+                    )
+                time.sleep(self.get_send_interval())
+
+    def pause(self):
+        self.paused.set()
+
+    def resume(self):
+        self.paused.clear()
+
+    def stop(self):
+        self.stop_event.set()
+        self.store.wake()
+
+
+def ensure_running(publisher):
+    """Replace a publisher whose thread died (it is not replaced after stop())
+    Returns:
+        Publisher: The running publisher
+    """
+    if publisher.is_alive() or publisher.stop_event.is_set():
+        return publisher
+    logger.error("Publisher stopped unexpectedly, restarting")
+    metrics.incr("publisher.restarts")
+    replacement = Publisher(
+        publisher.store, publisher.get_priorities, publisher.get_send_interval
+    )
+    if publisher.paused.is_set():
+        replacement.pause()
+    # Results taken by the dead thread may not have been sent
+    publisher.store.mark_all_changed()
+    replacement.start()
+    return replacement
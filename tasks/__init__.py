@@ -4,6 +4,7 @@ from .task_gas_price import GasPriceTask
 from .task_github_contributions import GitHubContributionsTask
 from .task_github_followers import GithubFollowersTask
 from .task_minecraft_server_status import MinecraftServerStatusTask
+from .task_network_speed import NetworkSpeedTask
 from .task_spotify_current_playback import SpotifyCurrentPlaybackTask
 from .task_year_progress import YearProgressTask
 
@@ -16,6 +17,7 @@ def load_tasks():
         GitHubContributionsTask(),
         GithubFollowersTask(),
         MinecraftServerStatusTask(),
+        NetworkSpeedTask(),
         SpotifyCurrentPlaybackTask(),
         YearProgressTask(),
     ]
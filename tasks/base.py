@@ -1,28 +1,108 @@
 import abc
+import time
 
-from config import BEHAVIOR_ON_FAILURE, config_data
+import metrics
+from config import get_app_config, get_task_config
+from log import logger
 from storage import load, save
 
+# Learned interval: this share of the expected time between changes
+ADAPT_FRACTION = 0.5
+CHANGE_ALPHA = 0.3  # EWMA weight of the newest observed time between changes
+DEFAULT_MAX_INTERVAL_FACTOR = 8  # max_interval defaults to this many times interval
+
 
 class BaseTask(abc.ABC):
     """Base class for all tasks. All specific tasks should inherit this."""
 
     def __init__(
-        self, name: str, default_interval: int = 60, default_priority: int = 100
+        self,
+        name: str,
+        default_interval: int = 60,
+        default_priority: int = 100,
+        default_enabled: bool = True,
     ):
         self.name = name
+        self.default_interval = default_interval
+        self.default_priority = default_priority
+        self.default_enabled = default_enabled
 
         # Read interval and priority from config
-        task_config = config_data.get("tasks", {}).get(name, {})
-        self.enabled = task_config.get("enabled", True)
-        self.interval = task_config.get("interval", default_interval)
-        self.priority = task_config.get("priority", default_priority)
+        self.configure(get_task_config(name))
+
+    def configure(self, task_config):
+        """Apply configuration section of this task"""
+        self.task_config = task_config
+        self.enabled = task_config.get("enabled", self.default_enabled)
+        self.interval = task_config.get("interval", self.default_interval)
+        self.priority = task_config.get("priority", self.default_priority)
+        # Learned interval: polls follow how often the message actually changes
+        self.adaptive_interval = task_config.get("adaptive_interval", False)
+        self.min_interval = task_config.get("min_interval", self.interval)
+        self.max_interval = task_config.get(
+            "max_interval", self.interval * DEFAULT_MAX_INTERVAL_FACTOR
+        )
+        self.learned_interval = self.interval
+        self.change_interval = self.interval / ADAPT_FRACTION
+        self.last_change = None
+        self.last_run_time = None
+
+    def reconfigure(self, task_config):
+        """Apply a changed configuration section at runtime.
+        Subclasses holding clients or caches built from the config can override
+        to reset only what the change affects."""
+        self.configure(task_config)
 
     @abc.abstractmethod
     def fetch_data(self):
         """Fetch data. Must be implemented by subclasses."""
         pass
 
+    def get_next_run_time(self, last_run):
+        """Get the time (epoch seconds) this task is due again.
+        Subclasses can override to schedule themselves adaptively."""
+        if self.adaptive_interval:
+            return last_run + self.learned_interval
+        return last_run + self.interval
+
+    def learn_interval(self, changed, now=None):
+        """Adjust the interval to how often the message changes: about twice per
+        expected change, longer the longer nothing changed, within
+        min_interval / max_interval
+        Args:
+            changed (bool): Whether this run's message differs from the last one
+        Returns:
+            float: Seconds until the next run
+        """
+        now = time.time() if now is None else now
+        if self.last_change is None:
+            self.last_change = now
+        elif changed:
+            observed = now - self.last_change
+            self.change_interval = (
+                CHANGE_ALPHA * observed + (1 - CHANGE_ALPHA) * self.change_interval
+            )
+            self.last_change = now
+            if self.last_run_time is not None:
+                # The change went unseen for at most the time since the last run
+                metrics.observe(f"{self.name}.staleness", now - self.last_run_time)
+        expected = max(self.change_interval, now - self.last_change)
+        self.learned_interval = min(
+            self.max_interval, max(self.min_interval, ADAPT_FRACTION * expected)
+        )
+        # Polls a fixed interval would have made until the next run, minus this one
+        metrics.incr(
+            f"{self.name}.calls_saved", self.learned_interval / self.interval - 1
+        )
+        metrics.set_gauge(f"{self.name}.interval", self.learned_interval)
+        self.last_run_time = now
+        return self.learned_interval
+
+    def get_latest_message(self):
+        """Get an up-to-date message without fetching, used while the task is not due.
+        Returns None to use the stored result. Subclasses can override."""
+        return None
+
     def run(self):
         """Run task: fetch data -> process -> store -> return MQTT message"""
         if not self.enabled:
@@ -35,6 +115,9 @@ class BaseTask(abc.ABC):
             # Process data and generate MQTT message
             mqtt_message = self.create_mqtt_message(data)
 
+            if self.adaptive_interval:
+                self.learn_interval(mqtt_message != load(self.name))
+
             # Store data (for timeout fallback)
             save(self.name, mqtt_message)
 
@@ -42,19 +125,32 @@ class BaseTask(abc.ABC):
             return mqtt_message
 
         except Exception as e:
-            print(f"Task {self.name} failed: {e}")
-            match BEHAVIOR_ON_FAILURE:
-                case 0:
-                    # Remove app, return empty message
-                    return {}
-                case 1:
-                    # Use last result
-                    return load(self.name)
-                case 2:
-                    # Show error message
-                    return self.get_error_message()
-                case _:
-                    raise e
+            logger.error(
+                "Task %s failed: %s",
+                self.name,
+                e,
+                extra={"rate_key": f"{self.name}.error"},
+            )
+            return self.get_fallback_message(e)
+
+    def get_fallback_message(self, error):
+        """Get message to show when the task failed, according to `behavior_on_failure`"""
+        match get_app_config()["behavior_on_failure"]:
+            case 0:
+                # Remove app, return empty message
+                return {}
+            case 1:
+                # Use last result
+                return self.load_last_result()
+            case 2:
+                # Show error message
+                return self.get_error_message()
+            case _:
+                raise error
+
+    def load_last_result(self):
+        """Load last successful MQTT message"""
+        return load(self.name)
 
     def get_error_message(self):
         """Get error message. Subclasses can override to customize error display."""
@@ -68,3 +164,51 @@ class BaseTask(abc.ABC):
     def create_mqtt_message(self, data):
         """Create MQTT message from data. Must be implemented by subclasses."""
         pass
+
+
+class ClockTask(BaseTask):
+    """Base class for tasks computed only from the clock (no I/O).
+    They run inline exactly when their output changes,
+    without worker threads or persistence."""
+
+    def __init__(
+        self,
+        name: str,
+        default_interval: int = 60,
+        default_priority: int = 100,
+        default_enabled: bool = True,
+    ):
+        super().__init__(name, default_interval, default_priority, default_enabled)
+        self.last_message = None
+
+    @abc.abstractmethod
+    def get_next_change_time(self, now):
+        """Get the next time (epoch seconds, after `now`) the rendered output changes.
+        Must be implemented by subclasses."""
+        pass
+
+    def get_next_run_time(self, last_run):
+        return self.get_next_change_time(last_run)
+
+    def get_latest_message(self):
+        return self.last_message
+
+    def run(self):
+        """Run task: compute -> return MQTT message (kept in memory only)"""
+        if not self.enabled:
+            return {}
+
+        try:
+            self.last_message = self.create_mqtt_message(self.fetch_data())
+            return self.last_message
+        except Exception as e:
+            logger.error(
+                "Task %s failed: %s",
+                self.name,
+                e,
+                extra={"rate_key": f"{self.name}.error"},
+            )
+            return self.get_fallback_message(e)
+
+    def load_last_result(self):
+        return self.last_message
@@ -1,4 +1,3 @@
-from config import config_data
 from helpers import requests_get
 
 from .base import BaseTask
@@ -29,7 +28,7 @@ class AirQualityTask(BaseTask):
 
     def fetch_data(self):
         """Fetch air quality data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         api_key = task_config.get("api_key")
         area = task_config.get("area", "北京")
 
@@ -85,7 +84,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = AirQualityTask()
 
@@ -94,9 +94,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -1,4 +1,3 @@
-from config import config_data
 from helpers import format_number, requests_get
 
 from .base import BaseTask
@@ -20,7 +19,7 @@ class BilibiliFollowersTask(BaseTask):
 
     def fetch_data(self):
         """Fetch Bilibili followers data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         uid = task_config.get("uid")
 
         if not uid:
@@ -63,12 +62,14 @@ class BilibiliFollowersTask(BaseTask):
             "color": "#666666",
         }
 
+
 if __name__ == "__main__":
     # uv run -m tasks.task_bilibili_followers
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = BilibiliFollowersTask()
 
@@ -77,9 +78,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -87,4 +92,4 @@ if __name__ == "__main__":
     msg = json.dumps(msg)
     print(msg)
 
-    send_message(task.name, msg)
\ No newline at end of file
+    send_message(task.name, msg)
@@ -1,4 +1,3 @@
-from config import config_data
 from helpers import requests_get
 
 from .base import BaseTask
@@ -20,7 +19,7 @@ class GasPriceTask(BaseTask):
 
     def fetch_data(self):
         """Fetch gas price data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         api_key = task_config.get("api_key")
         province = task_config.get("province", "北京")
         self.display_type = task_config.get("display_type", "92")
@@ -76,12 +75,14 @@ class GasPriceTask(BaseTask):
             "color": "#666666",
         }
 
+
 if __name__ == "__main__":
     # uv run -m tasks.task_gas_price
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = GasPriceTask()
 
@@ -90,9 +91,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -100,4 +105,4 @@ if __name__ == "__main__":
     msg = json.dumps(msg)
     print(msg)
 
-    send_message(task.name, msg)
\ No newline at end of file
+    send_message(task.name, msg)
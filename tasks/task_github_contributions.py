@@ -4,8 +4,7 @@ from datetime import datetime, timedelta
 
 from bs4 import BeautifulSoup
 
-from config import config_data
-from helpers import color_to_packed_rgb, requests_get
+from helpers import color_to_packed_rgb, optimize_draw_commands, requests_get
 
 from .base import BaseTask
 
@@ -127,7 +126,7 @@ class GitHubContributionsTask(BaseTask):
 
     def fetch_data(self):
         """Fetch GitHub contributions data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         token = task_config.get("token")
         username = task_config.get("username")
 
@@ -152,28 +151,30 @@ class GitHubContributionsTask(BaseTask):
         contributions.sort(key=lambda x: x["date"])
         return contributions
 
-    def create_mqtt_message(self, contributions):
-        """Create MQTT message from GitHub contributions data"""
-        if not contributions:
-            raise Exception("No contributions data received")
-
+    def render_pixels(self, contributions):
+        """Render the heatmap to packed pixels, row by row"""
         # Get configuration for rainbow months
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         use_rainbow_months = task_config.get("rainbow_months", True)
         split_by_month = task_config.get("split_by_month", False)
 
-        # Generate matrix from contributions
-        packed_rgbs = generate_packed_pixels(
+        return generate_packed_pixels(
             contributions,
             cols=32,
             use_rainbow_months=use_rainbow_months,
             split_by_month=split_by_month,
         )
 
+    def create_mqtt_message(self, contributions):
+        """Create MQTT message from GitHub contributions data"""
+        if not contributions:
+            raise Exception("No contributions data received")
+
+        packed_rgbs = self.render_pixels(contributions)
+
+        # Fills and lines are much smaller than 256 raw pixels
         return {
-            "draw": [
-                {"db": [0, 0, 32, 8, packed_rgbs]},
-            ],
+            "draw": optimize_draw_commands(0, 0, 32, 8, packed_rgbs),
         }
 
     def get_error_message(self):
@@ -190,7 +191,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = GitHubContributionsTask()
 
@@ -199,13 +201,26 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
+    raw_size = None
     try:
-        msg = task.run()
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
+        # Same frame as one bitmap, as sent before draw commands were optimized
+        raw = {"draw": [{"db": [0, 0, 32, 8, task.render_pixels(data)]}]}
+        raw_size = len(json.dumps(raw))
     except Exception as e:
         print(f"Error: {e}")
         msg = task.get_error_message()
 
     msg = json.dumps(msg)
     print(msg)
+    if raw_size is None:
+        print("Payload size:", len(msg))
+    else:
+        print(f"Payload size: {len(msg)} (raw db: {raw_size})")
 
     send_message(task.name, msg)
@@ -1,4 +1,3 @@
-from config import config_data
 from helpers import fetch_image_and_convert_to_base64, format_number, requests_get
 
 from .base import BaseTask
@@ -21,7 +20,7 @@ class GithubFollowersTask(BaseTask):
 
     def fetch_data(self):
         """Fetch GitHub followers data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         token = task_config.get("token")
         username = task_config.get("username")
         self.draw_avatar = task_config.get("draw_avatar", False)
@@ -91,7 +90,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = GithubFollowersTask()
 
@@ -100,9 +100,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -1,6 +1,9 @@
 from mcstatus import BedrockServer, JavaServer
 
-from config import config_data
+import deadline
+import fixtures
+from dns_cache import resolve_host, resolve_minecraft_srv, split_host_port
+from governor import host_slot
 
 from .base import BaseTask
 
@@ -16,6 +19,7 @@ ERROR_ICON = OFFLINE_ICON
 
 APP_NAME = "minecraft_server_status"
 DEFAULT_INTERVAL = 300
+TIMEOUT = 3  # Connection timeout (seconds), limited by the task time budget
 
 
 class MinecraftServerStatusTask(BaseTask):
@@ -26,22 +30,38 @@ class MinecraftServerStatusTask(BaseTask):
 
     def fetch_data(self):
         """Fetch Minecraft server data"""
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         server_addr = task_config.get("server_addr")
         java_edition = task_config.get("java_edition", True)
 
         if not server_addr:
             raise Exception("Minecraft server address not configured")
-        try:
+
+        def get_players():
+            # Resolve through the shared DNS cache, so a status check is a single ping
             if java_edition:
-                server = JavaServer.lookup(server_addr)
+                host, port = resolve_minecraft_srv(server_addr, JavaServer.DEFAULT_PORT)
+                address, server_class = host, JavaServer
             else:
-                server = BedrockServer.lookup(server_addr)
-            status = server.status()
-            online = status.players.online or 0
-            maximum = status.players.max or 0
+                host, port = split_host_port(server_addr, BedrockServer.DEFAULT_PORT)
+                address, server_class = resolve_host(host)[0], BedrockServer
+            with host_slot(host):
+                # Only the time budget left after waiting for the slot
+                server = server_class(
+                    address, port, timeout=deadline.remaining(TIMEOUT)
+                )
+                status = server.status()
+            return {
+                "online": status.players.online or 0,
+                "max": status.players.max or 0,
+            }
 
-            return {"online": True, "players": {"online": online, "max": maximum}}
+        try:
+            players = fixtures.call(f"mcstatus {server_addr}", get_players)
+            return {"online": True, "players": players}
+        except deadline.DeadlineExceeded:
+            # Out of time is not the same as offline
+            raise
         except Exception:
             return {"online": False}
 
@@ -94,7 +114,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = MinecraftServerStatusTask()
 
@@ -103,9 +124,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -0,0 +1,192 @@
+import threading
+import time
+
+import psutil
+
+import deadline
+from helpers import format_bytes
+
+from .base import BaseTask
+
+DOWNLOAD_ICON = "60550"
+UPLOAD_ICON = "60553"
+
+ERROR_ICON = DOWNLOAD_ICON
+
+APP_NAME = "network_speed"
+DEFAULT_INTERVAL = 10
+SAMPLE_INTERVAL = 1  # Seconds between two counter samples
+DEFAULT_EWMA_ALPHA = 0.5  # Weight of the newest sample, 1 = no smoothing
+
+
+class NetworkSpeedSampler(threading.Thread):
+    """Long-lived thread sampling interface counters into smoothed (EWMA) speeds"""
+
+    def __init__(self, interfaces, alpha, interval=SAMPLE_INTERVAL):
+        super().__init__(name="network-speed-sampler", daemon=True)
+        self.interfaces = list(interfaces)
+        self.alpha = alpha
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.smoothed = {}  # interface -> (rx_speed, tx_speed)
+        self.prev = None  # (time, counters) of the last sample
+        self.ready = threading.Event()  # Set once there is a speed
+        self.stop_event = threading.Event()
+
+    def get_counters(self):
+        counters = psutil.net_io_counters(pernic=True)
+        if not self.interfaces:
+            # All interfaces except loopback
+            return {
+                name: c for name, c in counters.items() if not name.startswith("lo")
+            }
+        return {name: counters[name] for name in self.interfaces if name in counters}
+
+    def run(self):
+        self.sample(time.monotonic(), self.get_counters())
+        while not self.stop_event.wait(self.interval):
+            self.sample(time.monotonic(), self.get_counters())
+
+    def sample(self, now, counters):
+        """Update the speeds from the interface counters at time `now`"""
+        with self.lock:
+            if self.prev is not None:
+                prev_time, prev = self.prev
+                elapsed = now - prev_time
+                for name, counter in counters.items():
+                    if name not in prev or elapsed <= 0:
+                        continue
+                    # Counters can be reset (e.g. interface restarted)
+                    rx = max(0, counter.bytes_recv - prev[name].bytes_recv) / elapsed
+                    tx = max(0, counter.bytes_sent - prev[name].bytes_sent) / elapsed
+                    if name in self.smoothed:
+                        last_rx, last_tx = self.smoothed[name]
+                        rx = self.alpha * rx + (1 - self.alpha) * last_rx
+                        tx = self.alpha * tx + (1 - self.alpha) * last_tx
+                    self.smoothed[name] = (rx, tx)
+            self.prev = (now, counters)
+        if self.smoothed:
+            self.ready.set()
+
+    def get_speed(self):
+        """Get smoothed (download, upload) speed in bytes per second, summed over interfaces
+        Returns None if there is no sample yet."""
+        with self.lock:
+            if not self.smoothed:
+                return None
+            rx = sum(speed[0] for speed in self.smoothed.values())
+            tx = sum(speed[1] for speed in self.smoothed.values())
+            return rx, tx
+
+    def stop(self):
+        self.stop_event.set()
+
+
+class NetworkSpeedTask(BaseTask):
+    """Network download and upload speed"""
+
+    def __init__(self):
+        self.sampler = None
+        super().__init__(
+            APP_NAME, default_interval=DEFAULT_INTERVAL, default_enabled=False
+        )
+
+    def reconfigure(self, task_config):
+        super().reconfigure(task_config)
+        if not self.enabled:
+            self.close()
+        elif self.sampler is not None:
+            # Apply changed settings now, the next run needs a speed
+            self.get_sampler()
+
+    def get_sampler(self):
+        """Get the sampler thread, started on the first run (task instances that
+        never run, e.g. for cleanup, start no thread) and restarted when its
+        settings change"""
+        task_config = self.task_config
+        interfaces = task_config.get("interfaces", [])
+        alpha = task_config.get("ewma_alpha", DEFAULT_EWMA_ALPHA)
+
+        sampler = self.sampler
+        if (
+            sampler is None
+            or sampler.interfaces != interfaces
+            or sampler.alpha != alpha
+        ):
+            if sampler is not None:
+                sampler.stop()
+            sampler = NetworkSpeedSampler(interfaces, alpha)
+            sampler.start()
+            self.sampler = sampler
+        return sampler
+
+    def close(self):
+        """Stop the sampler thread"""
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+    def fetch_data(self):
+        """Get network speed from the sampler (no I/O)"""
+        sampler = self.get_sampler()
+        # Only a just (re)started sampler has no speed yet: wait for its first one
+        if not sampler.ready.wait(deadline.remaining(SAMPLE_INTERVAL * 2)):
+            raise Exception("No network speed sample yet")
+        speed = sampler.get_speed()
+        return {"download": speed[0], "upload": speed[1]}
+
+    def create_mqtt_message(self, data):
+        """Create MQTT message from network speed data"""
+        if not data:
+            raise Exception("Missing network speed data")
+
+        # Two pages: download and upload
+        return [
+            {
+                "icon": DOWNLOAD_ICON,
+                "textCase": 2,
+                "text": format_bytes(data["download"]),
+            },
+            {"icon": UPLOAD_ICON, "textCase": 2, "text": format_bytes(data["upload"])},
+        ]
+
+    def get_error_message(self):
+        return {
+            "icon": ERROR_ICON,
+            "textCase": 2,
+            "text": "Error",
+            "color": "#666666",
+        }
+
+
+if __name__ == "__main__":
+    # uv run -m tasks.task_network_speed
+    import json
+    import sys
+
+    import profiling
+    from transport import send_message
+
+    task = NetworkSpeedTask()
+
+    if len(sys.argv) > 1 and sys.argv[1] == "del":
+        print("Deleting app...")
+        send_message(task.name, "{}")
+        exit()
+
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
+    try:
+        task.get_sampler().ready.wait()
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
+    except Exception as e:
+        print("Error:", e)
+        msg = task.get_error_message()
+
+    msg = json.dumps(msg)
+    print(msg)
+
+    send_message(task.name, msg)
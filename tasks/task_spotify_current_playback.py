@@ -1,11 +1,25 @@
+import threading
+import time
 from pathlib import Path
 
+import requests
 import spotipy
 from spotipy.cache_handler import CacheFileHandler
 from spotipy.oauth2 import SpotifyOAuth
 
-from config import config_data, get_app_config
-from helpers import cjk_to_initials, fetch_image_and_convert_to_base64
+import deadline
+import fixtures
+import metrics
+from circuit_breaker import guard
+from config import get_app_config
+from governor import get_governor, host_slot
+from helpers import (
+    REQUEST_TIMEOUT,
+    cjk_to_initials,
+    fetch_image_and_convert_to_base64,
+    smallest_image_url,
+)
+from log import logger
 
 from .base import BaseTask
 
@@ -23,8 +37,93 @@ SPOTIFY_SCOPES = [
     "user-read-playback-state",
 ]
 
+SPOTIFY_API_HOST = "api.spotify.com"
+
+# Changing these requires a new client
+AUTH_CONFIG_KEYS = ["client_id", "client_secret", "redirect_uri", "auth_cache_file"]
+
 APP_NAME = "spotify_current_playback"
 DEFAULT_INTERVAL = 10
+DEFAULT_PLAYING_MAX_INTERVAL = 60  # Max seconds between polls while playing
+DEFAULT_IDLE_MAX_INTERVAL = 300  # Max seconds between polls while idle / paused
+MIN_INTERVAL = 1
+TRACK_END_MARGIN = 1  # Poll this many seconds after the predicted end of track
+TOKEN_REFRESH_MARGIN = 300  # Refresh access token this many seconds before it expires
+TOKEN_REFRESH_RETRY = 30
+DEFAULT_PREFETCH_ALBUM_ART = 3  # Upcoming tracks whose album art is prefetched
+PREFETCH_PRIORITY = 1000  # Behind every task run on the governor
+ALBUM_ART_SIZE = (8, 8)
+
+
+class BudgetSession(requests.Session):
+    """Session of the Spotify client: each request waits at most for the time
+    budget of the calling thread (REQUEST_TIMEOUT without one). Spotipy's own
+    timeout is an attribute of the shared client, and the retries it mounts
+    (also sleeping out 429 Retry-After) would run past the budget, so a plain
+    session without retries is used."""
+
+    def request(self, method, url, **kwargs):
+        kwargs["timeout"] = deadline.remaining(REQUEST_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+
+class InMemoryCacheFileHandler(CacheFileHandler):
+    """Token cache kept in memory, the file is read once and written only when the token changes"""
+
+    def __init__(self, cache_path):
+        super().__init__(cache_path=cache_path)
+        self.lock = threading.Lock()
+        self.token_info = None
+        self.loaded = False
+
+    def get_cached_token(self):
+        with self.lock:
+            if not self.loaded:
+                self.token_info = super().get_cached_token()
+                self.loaded = True
+            return self.token_info
+
+    def save_token_to_cache(self, token_info):
+        with self.lock:
+            if token_info == self.token_info:
+                return
+            self.token_info = token_info
+            self.loaded = True
+            super().save_token_to_cache(token_info)
+
+
+class TokenRefresher(threading.Thread):
+    """Background thread renewing the access token before it expires,
+    so that polling never waits for a token refresh"""
+
+    def __init__(self, auth_manager, margin=TOKEN_REFRESH_MARGIN):
+        super().__init__(name="spotify-token-refresher", daemon=True)
+        self.auth_manager = auth_manager
+        self.margin = margin
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            token_info = self.auth_manager.cache_handler.get_cached_token()
+            if not token_info:
+                # Not authorized yet, see `spotify_auth.py`
+                self.stop_event.wait(TOKEN_REFRESH_RETRY)
+                continue
+
+            delay = token_info["expires_at"] - time.time() - self.margin
+            if delay > 0:
+                self.stop_event.wait(delay)
+                continue
+
+            try:
+                self.auth_manager.refresh_access_token(token_info["refresh_token"])
+                metrics.incr(f"{APP_NAME}.token_refreshes")
+            except Exception as e:
+                logger.warning("Spotify token refresh failed: %s", e)
+                self.stop_event.wait(TOKEN_REFRESH_RETRY)
+
+    def stop(self):
+        self.stop_event.set()
 
 
 class SpotifyCurrentPlaybackTask(BaseTask):
@@ -32,42 +131,184 @@ class SpotifyCurrentPlaybackTask(BaseTask):
 
     def __init__(self):
         super().__init__(APP_NAME, default_interval=DEFAULT_INTERVAL)
+        self.next_interval = self.interval
+        self.idle_polls = 0
+        self.last_track_id = None
+        self.predicted_track_end = None
+        self.sp = None
+        self.token_refresher = None
+        self.client_lock = threading.Lock()
+        self.fetched_at = time.monotonic()
+        self.snapshot = None
+        self.render_memo = None
+        self.prefetched_for = None  # Track id the upcoming album art was prefetched at
+
+    def reconfigure(self, task_config):
+        auth_changed = any(
+            task_config.get(key) != self.task_config.get(key)
+            for key in AUTH_CONFIG_KEYS
+        )
+        super().reconfigure(task_config)
+        if auth_changed:
+            # Client is re-created on next run
+            self.close()
+
+    def get_next_run_time(self, last_run):
+        return last_run + self.next_interval
+
+    def schedule_next_poll(self, data, now=None):
+        """Decide when to poll next from the playback state
+        Args:
+            data (dict): Response of the currently-playing endpoint (None if nothing is active)
+            now (float): Time of the response, defaults to current time
+        Returns:
+            float: Seconds until next poll
+        """
+        now = time.time() if now is None else now
+        task_config = self.task_config
+        playing_max_interval = task_config.get(
+            "playing_max_interval", DEFAULT_PLAYING_MAX_INTERVAL
+        )
+        idle_max_interval = task_config.get(
+            "idle_max_interval", DEFAULT_IDLE_MAX_INTERVAL
+        )
 
-    def fetch_data(self):
-        """Fetch Spotify current playback data"""
+        item = (data or {}).get("item") or {}
+        is_playing = bool(data and data.get("is_playing") and item)
+
+        # Track change latency: how long after the predicted end we noticed it
+        track_id = item.get("id") if is_playing else None
+        if track_id != self.last_track_id:
+            if self.last_track_id and self.predicted_track_end is not None:
+                latency = max(0, now - self.predicted_track_end)
+                metrics.observe(f"{self.name}.track_change_latency", latency)
+            self.last_track_id = track_id
+
+        if is_playing:
+            self.idle_polls = 0
+            remaining_ms = item.get("duration_ms", 0) - data.get("progress_ms", 0)
+            remaining = max(0, remaining_ms / 1000)
+            self.predicted_track_end = now + remaining
+            # Poll right after the track ends, but not less often than the cap
+            # so that skips and pauses are still noticed
+            interval = min(remaining + TRACK_END_MARGIN, playing_max_interval)
+        else:
+            # Back off exponentially while nothing is playing
+            self.predicted_track_end = None
+            interval = min(self.interval * 2**self.idle_polls, idle_max_interval)
+            self.idle_polls += 1
+
+        self.next_interval = max(MIN_INTERVAL, interval)
+        return self.next_interval
+
+    def get_client(self):
+        """Get the Spotify client, created once per task instance"""
+        with self.client_lock:
+            if self.sp is None:
+                self.sp = self.create_client()
+            return self.sp
+
+    def create_client(self):
+        """Create Spotify client and start background token refresh"""
         app_config = get_app_config()
         store_dir = app_config["store_dir"]
 
-        task_config = config_data.get("tasks", {}).get(APP_NAME, {})
+        task_config = self.task_config
         client_id = task_config.get("client_id")
         client_secret = task_config.get("client_secret")
         redirect_uri = task_config.get("redirect_uri", "http://127.0.0.1:1234")
         auth_cache_file = task_config.get("auth_cache_file", "spotify_cache.json")
-        cache_path = str(Path(__file__).parent.parent / store_dir / auth_cache_file)
-        self.show_artist = task_config.get("show_artist", True)
-        self.track_name_first = task_config.get("track_name_first", True)
-        self.cjk_to_initials = task_config.get("cjk_to_initials", True)
-        self.draw_album_art = task_config.get("draw_album_art", False)
 
         if not auth_cache_file:
             raise Exception("Spotify auth_cache_file not configured")
 
-        self.sp = spotipy.Spotify(
-            auth_manager=SpotifyOAuth(
-                client_id=client_id,
-                client_secret=client_secret,
-                redirect_uri=redirect_uri,
-                scope=SPOTIFY_SCOPES,
-                open_browser=False,
-                cache_handler=CacheFileHandler(cache_path=cache_path),
-            )
+        cache_path = str(Path(__file__).parent.parent / store_dir / auth_cache_file)
+        auth_manager = SpotifyOAuth(
+            client_id=client_id,
+            client_secret=client_secret,
+            redirect_uri=redirect_uri,
+            scope=SPOTIFY_SCOPES,
+            open_browser=False,
+            cache_handler=InMemoryCacheFileHandler(cache_path=cache_path),
         )
+        self.token_refresher = TokenRefresher(auth_manager)
+        self.token_refresher.start()
+        return spotipy.Spotify(
+            auth_manager=auth_manager, requests_session=BudgetSession()
+        )
+
+    def close(self):
+        """Stop background token refresh and drop the client"""
+        with self.client_lock:
+            if self.token_refresher is not None:
+                self.token_refresher.stop()
+                self.token_refresher = None
+            self.sp = None
+
+    def fetch_data(self):
+        """Fetch Spotify current playback data"""
+        task_config = self.task_config
+        self.show_artist = task_config.get("show_artist", True)
+        self.track_name_first = task_config.get("track_name_first", True)
+        self.cjk_to_initials = task_config.get("cjk_to_initials", True)
+        self.draw_album_art = task_config.get("draw_album_art", False)
 
-        data = self.sp.current_playback()
+        def currently_playing():
+            return self.get_client().currently_playing()
+
+        # Device info is not displayed, so the lighter currently-playing
+        # endpoint is enough (instead of `current_playback`)
+        with host_slot(SPOTIFY_API_HOST), guard(SPOTIFY_API_HOST):
+            data = fixtures.call("spotify.currently_playing", currently_playing)
+        self.fetched_at = time.monotonic()
+        metrics.incr(f"{self.name}.api_calls")
+        self.schedule_next_poll(data)
+        if self.draw_album_art and data and data.get("item"):
+            self.prefetch_album_art(data["item"].get("id"))
         return data
 
+    def prefetch_album_art(self, track_id):
+        """Warm the image cache with the album art of the next tracks in the
+        playback queue, in the background at low priority. Runs once per track,
+        so the art is cached before the track change is polled.
+        Args:
+            track_id (str): Id of the track playing now
+        Returns:
+            Future: The prefetch job, or None if nothing was started
+        """
+        count = self.task_config.get("prefetch_album_art", DEFAULT_PREFETCH_ALBUM_ART)
+        if not count or track_id == self.prefetched_for:
+            return None
+        self.prefetched_for = track_id
+
+        def prefetch():
+            try:
+                with host_slot(SPOTIFY_API_HOST), guard(SPOTIFY_API_HOST):
+                    data = fixtures.call("spotify.queue", self.get_client().queue)
+                metrics.incr(f"{self.name}.api_calls")
+                for item in ((data or {}).get("queue") or [])[:count]:
+                    # Episodes have their own images instead of an album
+                    images = (item.get("album") or {}).get("images") or item.get(
+                        "images"
+                    )
+                    url = smallest_image_url(images, ALBUM_ART_SIZE)
+                    if url and fetch_image_and_convert_to_base64(
+                        url, ALBUM_ART_SIZE, image_format="JPG"
+                    ):
+                        metrics.incr(f"{self.name}.album_art_prefetched")
+            except Exception as e:
+                # Only a missed head start, the art is fetched when shown.
+                # Retried on the next poll
+                logger.warning("Error prefetching album art: %s", e)
+                self.prefetched_for = None
+
+        return get_governor().submit(prefetch, priority=PREFETCH_PRIORITY)
+
     def create_mqtt_message(self, data):
         """Create MQTT message from current playback data"""
+        # Forget the previous snapshot, so a failed update is never interpolated
+        self.snapshot = None
+
         # No playback
         if not data:
             return {}
@@ -80,6 +321,35 @@ class SpotifyCurrentPlaybackTask(BaseTask):
         if not item:
             return {}
 
+        track_display, icon = self.render_track(item)
+
+        self.snapshot = {
+            "track_id": item.get("id"),
+            "progress_ms": data.get("progress_ms", 0),
+            "duration_ms": item.get("duration_ms", 1),  # Avoid division by zero
+            "time": self.fetched_at,
+            "text": track_display,
+            "icon": icon,
+        }
+        return self.build_message(self.snapshot, self.fetched_at)
+
+    def render_track(self, item):
+        """Get display text and icon of a track, memoized by track id
+        Args:
+            item (dict): Track object
+        Returns:
+            tuple: (track_display, icon)
+        """
+        key = (
+            item.get("id"),
+            self.show_artist,
+            self.track_name_first,
+            self.cjk_to_initials,
+            self.draw_album_art,
+        )
+        if self.render_memo and self.render_memo[0] == key:
+            return self.render_memo[1], self.render_memo[2]
+
         # Text info
         track_name = item.get("name", "Unknown")
         if self.show_artist:
@@ -95,26 +365,33 @@ class SpotifyCurrentPlaybackTask(BaseTask):
         if self.cjk_to_initials:
             track_display = cjk_to_initials(track_display)
 
-        # Playback progress
-        progress_ms = data.get("progress_ms", 0)
-        duration_ms = item.get("duration_ms", 1)  # Avoid division by zero
-        progress_percent = int(round((progress_ms / duration_ms) * 100))
-
         # Use album art as icon if enabled
         icon = ICON
+        album_art = None
         if self.draw_album_art:
-            album_art_url = item.get("album", {}).get("images", [{}])[-1].get("url", "")
-            icon = (
-                fetch_image_and_convert_to_base64(
-                    album_art_url, (8, 8), image_format="JPG"
-                )
-                or ICON
+            album_art_url = smallest_image_url(
+                item.get("album", {}).get("images"), ALBUM_ART_SIZE
             )
+            album_art = fetch_image_and_convert_to_base64(
+                album_art_url, ALBUM_ART_SIZE, image_format="JPG"
+            )
+            icon = album_art or ICON
+
+        # Do not memoize a failed album art fetch, retry on next poll
+        if not self.draw_album_art or album_art:
+            self.render_memo = (key, track_display, icon)
+        return track_display, icon
+
+    def build_message(self, snapshot, now):
+        """Build message from playback snapshot, progress is interpolated to `now`"""
+        elapsed_ms = max(0, now - snapshot["time"]) * 1000
+        progress_ms = min(snapshot["progress_ms"] + elapsed_ms, snapshot["duration_ms"])
+        progress_percent = int(round((progress_ms / snapshot["duration_ms"]) * 100))
 
         return {
-            "icon": icon,
+            "icon": snapshot["icon"],
             "textCase": 2,
-            "text": track_display,
+            "text": snapshot["text"],
             "gradient": TEXT_GRADIENT,
             "scrollSpeed": SCROLL_SPEED,
             "progress": progress_percent,
@@ -122,6 +399,13 @@ class SpotifyCurrentPlaybackTask(BaseTask):
             "progressBC": PROGRESS_BG_COLOR,
         }
 
+    def get_latest_message(self):
+        """Republish the last track with progress computed locally, no API call"""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        return self.build_message(snapshot, time.monotonic())
+
     def get_error_message(self):
         return {
             "icon": ERROR_ICON,
@@ -136,7 +420,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = SpotifyCurrentPlaybackTask()
 
@@ -145,9 +430,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
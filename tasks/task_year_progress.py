@@ -1,6 +1,7 @@
-from datetime import datetime
+import math
+from datetime import datetime, timedelta
 
-from .base import BaseTask
+from .base import ClockTask
 
 ICON = "12111"
 PROGRESS_COLOR = "#ffffff"
@@ -9,23 +10,51 @@ PROGRESS_BG_COLOR = "#666666"
 ERROR_ICON = ICON
 
 APP_NAME = "year_progress"
-DEFAULT_INTERVAL = 1800
+DEFAULT_INTERVAL = 1800  # Not used, the task runs whenever the display changes
+# Run slightly after the change, avoid float rounding at the boundary
+CLOCK_EPSILON = 0.01
 
 
-class YearProgressTask(BaseTask):
+def get_year_bounds(year):
+    """Get start and end of year"""
+    return datetime(year, 1, 1), datetime(year, 12, 31, 23, 59, 59)
+
+
+class YearProgressTask(ClockTask):
     """Year progress"""
 
     def __init__(self):
         super().__init__(APP_NAME, default_interval=DEFAULT_INTERVAL)
 
+    def get_next_change_time(self, now):
+        """Next time the text ("xx.xx %") or the progress bar changes"""
+        now = datetime.fromtimestamp(now)
+        year_start, year_end = get_year_bounds(now.year)
+        if now >= year_end:
+            return datetime(now.year + 1, 1, 1).timestamp() + CLOCK_EPSILON
+
+        total_seconds = (year_end - year_start).total_seconds()
+        elapsed_seconds = (now - year_start).total_seconds()
+        percentage = (elapsed_seconds / total_seconds) * 100
+
+        # Text is rounded to 0.01 %, so it changes at every x.xx5 %.
+        # Progress bar is rounded to 1 %, so it changes at every x.5 %.
+        next_text_percentage = (math.floor(percentage * 100 - 0.5) + 1.5) / 100
+        next_bar_percentage = math.floor(percentage - 0.5) + 1.5
+        next_percentage = min(next_text_percentage, next_bar_percentage, 100)
+
+        next_time = year_start + timedelta(
+            seconds=total_seconds * next_percentage / 100
+        )
+        return next_time.timestamp() + CLOCK_EPSILON
+
     def fetch_data(self):
         """Calculate year progress data"""
         # Get current time
         now = datetime.now()
 
         # Calculate start and end of year
-        year_start = datetime(now.year, 1, 1)
-        year_end = datetime(now.year, 12, 31, 23, 59, 59)
+        year_start, year_end = get_year_bounds(now.year)
 
         # Calculate total and elapsed seconds
         total_seconds = (year_end - year_start).total_seconds()
@@ -81,7 +110,8 @@ if __name__ == "__main__":
     import json
     import sys
 
-    from mqtt_sender import send_message
+    import profiling
+    from transport import send_message
 
     task = YearProgressTask()
 
@@ -90,9 +120,13 @@ if __name__ == "__main__":
         send_message(task.name, "{}")
         exit()
 
+    if "--profile" in sys.argv:
+        profiling.enable(ratio=1)
+
     try:
-        data = task.fetch_data()
-        msg = task.create_mqtt_message(data)
+        with profiling.profiled(task.name):
+            data = task.fetch_data()
+            msg = task.create_mqtt_message(data)
     except Exception as e:
         print("Error:", e)
         msg = task.get_error_message()
@@ -0,0 +1,597 @@
+"""Shared by the tests and the benchmarks (which import it as tests.support):
+a temporary config, local stand-ins for the device, the MQTT broker and
+upstream servers, and the simulated workloads the measurements run on."""
+
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+import timeit
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlparse, urlsplit
+
+import cv2
+import numpy as np
+
+import config
+import main as runtime
+import profiling
+from demand import RotationTracker
+from governor import Governor
+from helpers import requests_get
+from tasks.task_spotify_current_playback import SpotifyCurrentPlaybackTask
+
+
+class ConfigTestCase(unittest.TestCase):
+    """Runs each test against a config.yaml of its own, in a temporary
+    directory (tmp_dir) that is removed after the test"""
+
+    config_text = ""  # Content of config.yaml at the start of each test
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp_dir = tmp.name
+        self.config_file = os.path.join(self.tmp_dir, "config.yaml")
+        self.write_config(self.config_text)
+        for name, value in (("CONFIG_FILE", self.config_file), ("_config_cache", None)):
+            patcher = mock.patch.object(config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def write_config(self, text):
+        """Replace config.yaml, seen by the next get_config()"""
+        with open(self.config_file, "w") as f:
+            f.write(text)
+        # Possibly the same size, make sure the change is seen
+        os.utime(self.config_file, ns=(time.time_ns(), time.time_ns()))
+
+
+# Device and broker stand-ins, they record what they receive
+# (with monotonic receive times)
+
+
+def _packet(kind_flags, body):
+    """MQTT packet: fixed header byte, remaining length, body"""
+    length = len(body)
+    encoded = bytearray()
+    while True:
+        byte = length & 0x7F
+        length >>= 7
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes([kind_flags]) + bytes(encoded) + body
+
+
+class MqttStandIn:
+    """Minimal MQTT 3.1.1 broker: accepts clients, records QoS 0 publishes and
+    delivers publish() calls to clients subscribed to the exact topic"""
+
+    def __init__(self):
+        self.server = socket.create_server(("127.0.0.1", 0))
+        self.port = self.server.getsockname()[1]
+        self.received = []  # (monotonic time, topic, payload)
+        self.connections = 0
+        self.cond = threading.Condition()
+        self.subscriptions = {}  # topic -> connections
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        try:
+            self.serve(conn)
+        except (OSError, IndexError):
+            # Client went away
+            pass
+        finally:
+            with self.cond:
+                for conns in self.subscriptions.values():
+                    conns.discard(conn)
+            conn.close()
+
+    def serve(self, conn):
+        stream = conn.makefile("rb")
+        while True:
+            header = stream.read(1)
+            if not header:
+                return
+            length, shift = 0, 0
+            while True:
+                byte = stream.read(1)[0]
+                length |= (byte & 0x7F) << shift
+                shift += 7
+                if byte < 0x80:
+                    break
+            body = stream.read(length)
+            kind = header[0] >> 4
+            if kind == 1:  # CONNECT -> CONNACK
+                conn.sendall(b"\x20\x02\x00\x00")
+            elif kind == 3:  # PUBLISH
+                topic_length = int.from_bytes(body[:2], "big")
+                topic = body[2 : 2 + topic_length].decode()
+                qos = (header[0] >> 1) & 3
+                payload = body[2 + topic_length + (2 if qos else 0) :]
+                self.received.append((time.monotonic(), topic, payload.decode()))
+            elif kind == 8:  # SUBSCRIBE -> SUBACK, granted QoS 0
+                topics = []
+                position = 2
+                while position < len(body):
+                    topic_length = int.from_bytes(body[position : position + 2], "big")
+                    position += 2
+                    topics.append(body[position : position + topic_length].decode())
+                    position += topic_length + 1
+                with self.cond:
+                    conn.sendall(_packet(0x90, body[:2] + b"\x00" * len(topics)))
+                    for topic in topics:
+                        self.subscriptions.setdefault(topic, set()).add(conn)
+                    self.cond.notify_all()
+            elif kind == 12:  # PINGREQ -> PINGRESP
+                conn.sendall(b"\xd0\x00")
+            elif kind == 14:  # DISCONNECT
+                return
+
+    def wait_subscribed(self, topics, timeout=5):
+        """Wait until every topic has a subscriber
+        Returns:
+            bool: Whether they all subscribed in time
+        """
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: all(self.subscriptions.get(topic) for topic in topics),
+                timeout,
+            )
+
+    def publish(self, topic, payload):
+        """Send a QoS 0 message to the subscribers of the topic"""
+        encoded = topic.encode()
+        packet = _packet(0x30, len(encoded).to_bytes(2, "big") + encoded + payload)
+        with self.cond:
+            for conn in self.subscriptions.get(topic, ()):
+                conn.sendall(packet)
+
+    def close(self):
+        self.server.close()
+
+
+class HttpStandIn:
+    """AWTRIX /api/custom endpoint with HTTP/1.1 keep-alive
+    Args:
+        delay (float): Seconds the device takes per request
+    """
+
+    def __init__(self, delay=0):
+        standin = self
+        self.received = []  # (monotonic time, app name, payload)
+        self.connections = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                standin.connections += 1
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                url = urlparse(self.path)
+                if delay:
+                    time.sleep(delay)
+                name = parse_qs(url.query).get("name", [""])[0]
+                standin.received.append((time.monotonic(), name, body.decode()))
+                status = 200 if url.path == "/api/custom" else 404
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.host = f"127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def wait_received(standin, count, timeout=10):
+    """Wait until the stand-in received `count` messages"""
+    end = time.monotonic() + timeout
+    while len(standin.received) < count and time.monotonic() < end:
+        time.sleep(0.001)
+    return len(standin.received) >= count
+
+
+# Upstream stand-ins
+
+
+def make_image(size, extension):
+    """Photo-like test image: gradients, shapes and noise"""
+    rng = np.random.default_rng(size)
+    y, x = np.mgrid[0:size, 0:size] / size
+    image = np.dstack([x * 255, y * 255, (1 - x) * 200]).astype(np.float32)
+    for _ in range(6):
+        center = tuple(int(v) for v in rng.integers(0, size, 2))
+        color = tuple(int(v) for v in rng.integers(0, 255, 3))
+        cv2.circle(image, center, int(rng.integers(size // 10, size // 3)), color, -1)
+    image += rng.normal(0, 12, image.shape)
+    image = cv2.GaussianBlur(np.clip(image, 0, 255).astype(np.uint8), (5, 5), 0)
+    return cv2.imencode(extension, image)[1].tobytes()
+
+
+class ImageServer:
+    """Serves /<name>, scaled to ?s=<size> like GitHub avatars when asked"""
+
+    def __init__(self, images):
+        self.images = images  # name -> (size, extension)
+        self.cache = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                name = parts.path.lstrip("/")
+                size, extension = server.images[name]
+                scaled = parse_qs(parts.query).get("s")
+                if scaled:
+                    size = min(size, int(scaled[0]))
+                key = (name, size)
+                if key not in server.cache:
+                    server.cache[key] = make_image(size, extension)
+                body = server.cache[key]
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+class UpstreamStandIn:
+    """Answers GET with {} after `delay` seconds and tracks concurrent requests"""
+
+    def __init__(self, delay=0.01):
+        upstream = self
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with upstream.lock:
+                    upstream.in_flight += 1
+                    upstream.max_in_flight = max(
+                        upstream.max_in_flight, upstream.in_flight
+                    )
+                time.sleep(delay)
+                with upstream.lock:
+                    upstream.in_flight -= 1
+                self.send_response(200)
+                self.send_header("Content-Length", "2")
+                self.end_headers()
+                self.wfile.write(b"{}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Draw frames
+
+FRAME_WIDTH, FRAME_HEIGHT = 32, 8
+
+
+def draw_size(commands):
+    """Bytes of a draw payload"""
+    return len(json.dumps({"draw": commands}, ensure_ascii=False))
+
+
+def raw_commands(pixels, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Frame as a single bitmap command"""
+    return [{"db": [0, 0, width, height, pixels]}]
+
+
+def contributions(days, active_ratio, seed):
+    """Random contribution calendar ending 2026-10-17"""
+    rng = random.Random(seed)
+    last_date = datetime(2026, 10, 17)
+    return [
+        {
+            "date": last_date - timedelta(days=i),
+            "level": rng.randint(1, 4) if rng.random() < active_ratio else 0,
+        }
+        for i in reversed(range(days))
+    ]
+
+
+# An hour of Spotify playback: back-to-back tracks, then nothing playing
+
+HOUR = 3600
+FIXED_POLL_INTERVAL = 10
+TRACK_DURATIONS = [200, 185, 240, 213, 178, 305, 196, 222, 251, 190, 230, 199, 281]
+PLAYING_UNTIL = 2700  # Then nothing is playing until the end of the hour
+
+
+def build_timeline():
+    """Build (start, end, track_id, duration) for back-to-back tracks"""
+    timeline = []
+    start = 0
+    i = 0
+    while start < PLAYING_UNTIL:
+        duration = TRACK_DURATIONS[i % len(TRACK_DURATIONS)]
+        end = min(start + duration, PLAYING_UNTIL)
+        timeline.append((start, end, f"track{i}", duration))
+        start = end
+        i += 1
+    return timeline
+
+
+def playback_at(timeline, t):
+    """Simulated response of the currently-playing endpoint at time t"""
+    for start, end, track_id, duration in timeline:
+        if start <= t < end:
+            return {
+                "is_playing": True,
+                "progress_ms": int((t - start) * 1000),
+                "item": {
+                    "id": track_id,
+                    "name": track_id,
+                    "duration_ms": duration * 1000,
+                },
+            }
+    return None
+
+
+def measure_polls(poll_times, timeline):
+    """Get API calls per hour and mean track-change latency for poll times"""
+    latencies = []
+    for _, end, _, _ in timeline[:-1]:
+        first_poll = next((t for t in poll_times if t >= end), None)
+        if first_poll is not None:
+            latencies.append(first_poll - end)
+    return len(poll_times), sum(latencies) / len(latencies)
+
+
+def fixed_polls():
+    return list(range(0, HOUR, FIXED_POLL_INTERVAL))
+
+
+def adaptive_polls(timeline):
+    """Poll times of the Spotify task's own schedule"""
+    task = SpotifyCurrentPlaybackTask()
+    polls = []
+    t = 0.0
+    while t < HOUR:
+        polls.append(t)
+        t += task.schedule_next_poll(playback_at(timeline, t), now=t)
+    return polls
+
+
+# An hour of a device rotating through its apps
+
+STATS_PREFIX = "awtrix"
+# Device rotation: app -> seconds on screen
+ROTATION = [
+    ("Time", 15),
+    ("Date", 10),
+    ("weather", 10),
+    ("github", 10),
+    ("bilibili", 10),
+    ("Temp", 10),
+]
+# Task -> fixed interval, "hidden" has content but is hidden on the device
+ROTATION_TASKS = {"weather": 30, "github": 60, "bilibili": 20, "hidden": 30}
+DEMAND_LEAD = 5
+ROTATION_START = 1_000_000
+
+
+class ScriptedStats:
+    """Replays the device's stats messages in place of the MQTT broker"""
+
+    def __init__(self, send_loop):
+        self.messages = []
+        if send_loop:
+            loop = {app: i for i, (app, _) in enumerate(ROTATION)}
+            self.messages.append(
+                (ROTATION_START, f"{STATS_PREFIX}/stats/loop", json.dumps(loop))
+            )
+        t = ROTATION_START
+        while t < ROTATION_START + HOUR:
+            for app, dwell in ROTATION:
+                self.messages.append((t, f"{STATS_PREFIX}/stats/currentApp", app))
+                t += dwell
+
+    def turns(self):
+        """Times each app's turn on screen starts"""
+        return {
+            t: payload
+            for t, topic, payload in self.messages
+            if topic.endswith("/currentApp")
+        }
+
+    def deliver(self, now, tracker):
+        while self.messages and self.messages[0][0] <= now:
+            t, topic, payload = self.messages.pop(0)
+            tracker.handle(topic, payload.encode(), now=t)
+
+
+def simulate_rotation(tracker, stats):
+    """Run all tasks for an hour
+    Returns:
+        tuple: (upstream calls per task, worst data age when shown per task)
+    """
+    turns = stats.turns()
+    last_run = {}
+    calls = dict.fromkeys(ROTATION_TASKS, 0)
+    worst_age = dict.fromkeys(ROTATION_TASKS, 0)
+    for now in range(ROTATION_START, ROTATION_START + HOUR):
+        if tracker is not None:
+            stats.deliver(now, tracker)
+        for name, interval in ROTATION_TASKS.items():
+            last = last_run.get(name)
+            due = 0 if last is None else last + interval
+            if tracker is not None and last is not None:
+                due = tracker.adjust_due_time(name, due, DEMAND_LEAD, now=now)
+            if now >= due:
+                last_run[name] = now
+                calls[name] += 1
+        shown = turns.get(now)
+        # Skip the first rotations, the tracker is still learning
+        if shown in ROTATION_TASKS and now >= ROTATION_START + 200:
+            worst_age[shown] = max(worst_age[shown], now - last_run[shown])
+    return calls, worst_age
+
+
+def compare_refreshes(send_loop):
+    """Simulate fixed intervals and demand-driven refreshes
+    Returns:
+        tuple: (calls, worst age) of both, see simulate_rotation
+    """
+    fixed = simulate_rotation(None, ScriptedStats(send_loop))
+    demand = simulate_rotation(RotationTracker(), ScriptedStats(send_loop))
+    return fixed, demand
+
+
+# One cycle of main.run_and_publish: tasks sleep instead of fetching
+
+PUBLISH_DELAYS = {"fast": 0.05, "slow": 0.5}  # Run time of the tasks (s)
+
+
+def _sleeping_run(task):
+    time.sleep(PUBLISH_DELAYS[task.name])
+    return task.name, {"text": task.name}
+
+
+def publish_cycle(names, cached):
+    """Run one cycle of tasks, in priority order, with no sending delay
+    Args:
+        names (list): Tasks, highest priority first
+        cached (list): Tasks with a result from an earlier cycle (not run)
+    Returns:
+        tuple: (sent [(name, seconds after the start)], results)
+    """
+    sent = []
+    start = time.monotonic()
+
+    def send_result(task_name, result, send_interval):
+        sent.append((task_name, time.monotonic() - start))
+
+    tasks = [
+        SimpleNamespace(name=name, get_next_run_time=lambda last_run: 0)
+        for name in names
+    ]
+    results = {name: {"text": "old"} for name in cached}
+    tasks_to_run = [task for task in tasks if task.name not in cached]
+    with (
+        ThreadPoolExecutor() as executor,
+        mock.patch.multiple(
+            runtime,
+            send_result=send_result,
+            submit_task=lambda task, due_time=0: executor.submit(_sleeping_run, task),
+            save_last_run=lambda last_run: None,
+            get_app_config=lambda: {"send_interval": 0},
+        ),
+    ):
+        start = time.monotonic()
+        runtime.run_and_publish(
+            tasks_to_run, results, {}, 0, runtime.get_priority_index(tasks)
+        )
+    return sent, results
+
+
+# Profiling hooks
+
+
+def profiling_overhead(calls, targets, ratio):
+    """Seconds per profiling.start call of an unprofiled task run"""
+    profiling._targets, profiling._ratio = targets, ratio
+    try:
+        return timeit.timeit(lambda: profiling.start("weather"), number=calls) / calls
+    finally:
+        profiling._targets, profiling._ratio = None, None
+
+
+# Many short tasks through the governor
+
+
+def run_governor_workload(tasks, max_workers):
+    """Run `tasks` tasks of mixed priority and deadline, one GET each to a local
+    upstream
+    Returns:
+        dict: elapsed (s), max_threads of the governor, max_in_flight requests,
+            steady (completions per 100 ms, without ramp-up and tail)
+    """
+    upstream = UpstreamStandIn()
+    governor = Governor(max_workers)
+    completed = []
+    max_threads = [0]
+    done = threading.Event()
+
+    def count_threads():
+        while not done.wait(0.005):
+            # Workers + watchdog
+            threads = governor.workers + (governor.watchdog is not None)
+            max_threads[0] = max(max_threads[0], threads)
+
+    def task():
+        requests_get(upstream.url)
+        completed.append(time.monotonic())
+
+    monitor = threading.Thread(target=count_threads)
+    monitor.start()
+    start = time.monotonic()
+    try:
+        futures = [
+            governor.submit(task, priority=i % 3, deadline=i, timeout=5)
+            for i in range(tasks)
+        ]
+        for future in futures:
+            future.result()
+        elapsed = time.monotonic() - start
+    finally:
+        done.set()
+        monitor.join()
+        upstream.close()
+
+    bins = [0] * (int(elapsed / 0.1) + 1)
+    for t in completed:
+        bins[int((t - start) / 0.1)] += 1
+    return {
+        "completed": len(completed),
+        "elapsed": elapsed,
+        "max_threads": max_threads[0],
+        "max_in_flight": upstream.max_in_flight,
+        "steady": bins[1:-1],
+    }
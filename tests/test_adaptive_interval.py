@@ -0,0 +1,54 @@
+import unittest
+
+from tasks.base import BaseTask
+
+
+class StubTask(BaseTask):
+    def fetch_data(self):
+        pass
+
+    def create_mqtt_message(self, data):
+        pass
+
+
+def make_task():
+    task = StubTask("stub_adaptive")
+    task.configure(
+        {
+            "interval": 1200,
+            "adaptive_interval": True,
+            "min_interval": 600,
+            "max_interval": 21600,
+        }
+    )
+    return task
+
+
+class TestAdaptiveInterval(unittest.TestCase):
+    def test_backs_off_while_stable(self):
+        task = make_task()
+        t = 0
+        intervals = []
+        for _ in range(20):
+            intervals.append(task.learn_interval(False, now=t))
+            t += intervals[-1]
+        self.assertEqual(intervals[0], 1200)
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[-1], 21600)
+        self.assertEqual(task.get_next_run_time(t), t + 21600)
+
+    def test_polls_more_often_while_volatile(self):
+        task = make_task()
+        t = 0
+        for _ in range(20):
+            t += task.learn_interval(True, now=t)
+        self.assertEqual(task.learned_interval, 600)
+
+    def test_fixed_interval_by_default(self):
+        task = StubTask("stub_fixed")
+        task.configure({"interval": 1200})
+        self.assertEqual(task.get_next_run_time(0), 1200)
+
+
+if __name__ == "__main__":
+    unittest.main()
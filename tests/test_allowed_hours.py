@@ -0,0 +1,37 @@
+import unittest
+from datetime import datetime
+
+from main import get_next_window_change
+
+ALLOWED_HOURS = [[0, 1], [8, 24]]
+
+
+class TestNextWindowChange(unittest.TestCase):
+    def test_window_closes(self):
+        self.assertEqual(
+            get_next_window_change(datetime(2026, 1, 1, 0, 30), ALLOWED_HOURS),
+            datetime(2026, 1, 1, 1),
+        )
+        # [8, 24] and [0, 1] are one window across midnight
+        self.assertEqual(
+            get_next_window_change(datetime(2026, 1, 1, 12), ALLOWED_HOURS),
+            datetime(2026, 1, 2, 1),
+        )
+
+    def test_window_opens(self):
+        self.assertEqual(
+            get_next_window_change(datetime(2026, 1, 1, 3, 15), ALLOWED_HOURS),
+            datetime(2026, 1, 1, 8),
+        )
+        self.assertEqual(
+            get_next_window_change(datetime(2026, 1, 1, 21), [[6, 20]]),
+            datetime(2026, 1, 2, 6),
+        )
+
+    def test_never_changes(self):
+        self.assertIsNone(get_next_window_change(datetime(2026, 1, 1, 3), [[0, 24]]))
+        self.assertIsNone(get_next_window_change(datetime(2026, 1, 1, 3), []))
+
+
+if __name__ == "__main__":
+    unittest.main()
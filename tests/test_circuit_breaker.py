@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+
+import deadline
+import metrics
+from circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    guard,
+)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+        breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_probe(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=60)
+        with mock.patch("time.monotonic", return_value=100):
+            breaker.record_failure()
+        with mock.patch("time.monotonic", return_value=161):
+            # Only one probe at a time
+            self.assertTrue(breaker.allow())
+            self.assertEqual(breaker.state, HALF_OPEN)
+            self.assertFalse(breaker.allow())
+            # Failed probe re-opens
+            breaker.record_failure()
+            self.assertEqual(breaker.state, OPEN)
+            self.assertFalse(breaker.allow())
+        with mock.patch("time.monotonic", return_value=222):
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_guard_fails_fast_when_open(self):
+        metrics.reset()
+        for _ in range(3):
+            with self.assertRaises(ConnectionError):
+                with guard("down.example.com"):
+                    raise ConnectionError("timeout")
+
+        called = mock.Mock()
+        with self.assertRaises(CircuitOpenError):
+            with guard("down.example.com"):
+                called()
+        called.assert_not_called()
+
+        counters = metrics.snapshot()["counters"]
+        self.assertEqual(counters["breaker.down.example.com.open"], 1)
+        self.assertEqual(counters["breaker.down.example.com.rejected"], 1)
+
+    def test_budget_timeouts_are_not_failures(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=60)
+        with (
+            mock.patch("circuit_breaker.get_breaker", return_value=breaker),
+            mock.patch("time.monotonic", return_value=100),
+        ):
+            with deadline.within(5):
+                # A timeout shortened to what was left of the budget
+                with mock.patch("time.monotonic", return_value=105):
+                    with self.assertRaises(TimeoutError):
+                        with guard("slow.example.com"):
+                            raise TimeoutError("read timed out")
+                self.assertEqual(breaker.state, CLOSED)
+                # Within the budget it is the host's failure
+                with self.assertRaises(TimeoutError):
+                    with guard("slow.example.com"):
+                        raise TimeoutError("read timed out")
+        self.assertEqual(breaker.state, OPEN)
+
+    def test_interrupted_probe_is_released(self):
+        breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=60)
+        with mock.patch("time.monotonic", return_value=100):
+            breaker.record_failure()
+        with (
+            mock.patch("circuit_breaker.get_breaker", return_value=breaker),
+            mock.patch("time.monotonic", return_value=161),
+        ):
+            with self.assertRaises(KeyboardInterrupt):
+                with guard("flaky.example.com"):
+                    raise KeyboardInterrupt
+            self.assertEqual(breaker.state, HALF_OPEN)
+            # The next call may probe
+            with guard("flaky.example.com"):
+                pass
+        self.assertEqual(breaker.state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
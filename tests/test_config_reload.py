@@ -0,0 +1,55 @@
+import unittest
+from unittest import mock
+
+from main import apply_config
+from tasks import load_tasks
+
+
+def config_with(tasks):
+    return {"tasks": tasks}
+
+
+class TestIncrementalConfig(unittest.TestCase):
+    def setUp(self):
+        self.tasks = load_tasks()
+        self.by_name = {task.name: task for task in self.tasks}
+        apply_config(self.tasks, config_with({}))
+
+    def test_only_changed_sections_reconfigured(self):
+        changed = apply_config(
+            self.tasks, config_with({"air_quality": {"interval": 60}})
+        )
+        self.assertEqual(changed, ["air_quality"])
+        self.assertEqual(self.by_name["air_quality"].interval, 60)
+
+        # Same config again, nothing to do
+        self.assertEqual(
+            apply_config(self.tasks, config_with({"air_quality": {"interval": 60}})),
+            [],
+        )
+
+    def test_priority_change_reorders_tasks(self):
+        apply_config(self.tasks, config_with({"gas_price": {"priority": -1}}))
+        self.assertEqual(self.tasks[0].name, "gas_price")
+
+    def test_spotify_client_kept_unless_auth_changes(self):
+        spotify = self.by_name["spotify_current_playback"]
+        spotify.sp = client = mock.Mock()
+
+        apply_config(
+            self.tasks,
+            config_with({"spotify_current_playback": {"show_artist": False}}),
+        )
+        self.assertIs(spotify.sp, client)
+
+        apply_config(
+            self.tasks,
+            config_with(
+                {"spotify_current_playback": {"show_artist": False, "client_id": "x"}}
+            ),
+        )
+        self.assertIsNone(spotify.sp)
+
+
+if __name__ == "__main__":
+    unittest.main()
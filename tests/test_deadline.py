@@ -0,0 +1,102 @@
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import deadline
+import dns_cache
+import helpers
+import main
+from support import ConfigTestCase
+from tasks.task_minecraft_server_status import MinecraftServerStatusTask
+
+TASK_TIMEOUT = 0.5
+
+
+class TestDeadline(unittest.TestCase):
+    def test_remaining_without_budget(self):
+        self.assertEqual(deadline.remaining(3), 3)
+        self.assertFalse(deadline.expired())
+
+    def test_nested_budget_only_shortens(self):
+        with deadline.within(1):
+            self.assertLessEqual(deadline.remaining(3), 1)
+            self.assertEqual(deadline.remaining(0.1), 0.1)
+            with deadline.within(10):
+                self.assertLessEqual(deadline.remaining(3), 1)
+            with deadline.within(0.2):
+                self.assertLessEqual(deadline.remaining(3), 0.2)
+            self.assertGreater(deadline.remaining(3), 0.2)
+        self.assertEqual(deadline.remaining(3), 3)
+
+    def test_spent_budget_raises(self):
+        with deadline.within(0.01):
+            time.sleep(0.02)
+            self.assertTrue(deadline.expired())
+            with self.assertRaises(deadline.DeadlineExceeded):
+                deadline.remaining(3)
+
+    def test_budget_per_thread(self):
+        seen = []
+        with deadline.within(0.01):
+            time.sleep(0.02)
+            thread = threading.Thread(target=lambda: seen.append(deadline.remaining(3)))
+            thread.start()
+            thread.join()
+        self.assertEqual(seen, [3])
+
+
+class TestDeadlinePropagation(ConfigTestCase):
+    config_text = f"app:\n  task_timeout: {TASK_TIMEOUT}\n"
+
+    def test_task_run_bounds_requests(self):
+        def run():
+            helpers.requests_get("http://example.com/")
+            return "done"
+
+        task = SimpleNamespace(name="budget_test", priority=0, run=run)
+        response = mock.Mock(status_code=200)
+        with mock.patch("fixtures.request", return_value=response) as request:
+            self.assertEqual(main.submit_task(task).result(5), ("budget_test", "done"))
+        self.assertLessEqual(request.call_args.kwargs["timeout"], TASK_TIMEOUT)
+
+    def test_dns_lookup_bounded(self):
+        dns_cache.clear()
+        self.addCleanup(dns_cache.clear)
+        answer = mock.MagicMock()
+        answer.__iter__.return_value = [SimpleNamespace(to_text=lambda: "192.0.2.1")]
+        answer.rrset.ttl = 60
+        with (
+            mock.patch("dns_cache._hosts_entries", return_value={}),
+            mock.patch("dns.resolver.resolve", return_value=answer) as resolve,
+        ):
+            with deadline.within(1):
+                dns_cache.resolve_host("budget.example")
+        self.assertLessEqual(resolve.call_args.kwargs["lifetime"], 1)
+
+    def test_minecraft_status(self):
+        task = MinecraftServerStatusTask()
+        task.task_config = {"server_addr": "mc.example:25565"}
+        with mock.patch("tasks.task_minecraft_server_status.JavaServer") as server:
+            server.return_value.status.return_value.players = SimpleNamespace(
+                online=1, max=20
+            )
+            with deadline.within(1):
+                data = task.fetch_data()
+            self.assertEqual(data["players"], {"online": 1, "max": 20})
+            self.assertLessEqual(server.call_args.kwargs["timeout"], 1)
+
+            # Unreachable server
+            server.return_value.status.side_effect = OSError("refused")
+            self.assertEqual(task.fetch_data(), {"online": False})
+
+            # Out of time is not reported as offline
+            with deadline.within(0.01):
+                time.sleep(0.02)
+                with self.assertRaises(deadline.DeadlineExceeded):
+                    task.fetch_data()
+
+
+if __name__ == "__main__":
+    unittest.main()
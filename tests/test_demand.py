@@ -0,0 +1,124 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+from demand import DeviceStatsListener, RotationTracker
+from support import (
+    DEMAND_LEAD,
+    ROTATION,
+    ROTATION_START,
+    ROTATION_TASKS,
+    STATS_PREFIX,
+    MqttStandIn,
+    compare_refreshes,
+)
+
+
+class TestDemandDriven(unittest.TestCase):
+    def check(self, send_loop):
+        (fixed, _), (demand, demand_age) = compare_refreshes(send_loop)
+        self.assertLess(sum(demand.values()), sum(fixed.values()) / 2)
+        for name in ("weather", "github", "bilibili"):
+            self.assertLessEqual(demand[name], fixed[name])
+            # Never shown staler than the fixed schedule allows
+            self.assertLessEqual(demand_age[name], ROTATION_TASKS[name])
+        # Hidden app is no longer polled once the rotation is known
+        self.assertLess(demand["hidden"], fixed["hidden"] / 10)
+
+    def test_with_loop_topic(self):
+        self.check(send_loop=True)
+
+    def test_learned_rotation(self):
+        self.check(send_loop=False)
+
+    def test_next_show_time(self):
+        tracker = RotationTracker()
+        t = ROTATION_START
+        for _ in range(2):
+            for app, dwell in ROTATION:
+                tracker.handle(f"{STATS_PREFIX}/stats/currentApp", app, now=t)
+                t += dwell
+        # Two rotations shown, "Temp" is on screen since t - 10
+        self.assertEqual(tracker.current, "Temp")
+        self.assertEqual(tracker.next_show_time("Time", now=t - 5), t)
+        self.assertEqual(tracker.next_show_time("weather", now=t - 5), t + 25)
+        self.assertEqual(tracker.cycle_length(), 65)
+        self.assertTrue(tracker.is_hidden("hidden"))
+        # Apps without content keep their own schedule
+        self.assertEqual(
+            tracker.adjust_due_time("hidden", t, DEMAND_LEAD, has_content=False, now=t),
+            t,
+        )
+
+    def test_multi_page_apps(self):
+        # An app sending a list of pages is shown as <app>0, <app>1, ...
+        tracker = RotationTracker()
+        t = ROTATION_START
+        for _ in range(2):
+            for app in ("Time", "network_speed0", "network_speed1", "Date"):
+                tracker.handle(f"{STATS_PREFIX}/stats/currentApp", app, now=t)
+                t += 10
+        self.assertFalse(tracker.is_hidden("network_speed"))
+        self.assertTrue(tracker.is_hidden("network"))
+        self.assertEqual(tracker.next_show_time("network_speed", now=t - 5), t + 10)
+        self.assertLess(
+            tracker.adjust_due_time("network_speed", t, DEMAND_LEAD, now=t),
+            float("inf"),
+        )
+
+    def test_falls_back_without_stats(self):
+        tracker = RotationTracker()
+        self.assertEqual(
+            tracker.adjust_due_time("weather", 123, DEMAND_LEAD, now=100), 123
+        )
+
+
+class TestDeviceStatsListener(unittest.TestCase):
+    def setUp(self):
+        self.broker = MqttStandIn()
+        self.addCleanup(self.broker.close)
+
+    def listen(self, **mqtt_config):
+        mqtt_config = {
+            "host": "127.0.0.1",
+            "port": self.broker.port,
+            "topic_prefix": "awtrix_1a2b3c/custom/",
+            "username": "",
+            "password": "",
+            "device_prefix": "",
+            **mqtt_config,
+        }
+        tracker = RotationTracker()
+        listener = DeviceStatsListener(tracker)
+        with mock.patch("demand.get_mqtt_config", return_value=mqtt_config):
+            listener.start()
+        self.addCleanup(listener.stop)
+        return tracker
+
+    def wait_for(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate():
+            if time.monotonic() > deadline:
+                self.fail("timed out")
+            time.sleep(0.01)
+
+    def test_follows_device_stats(self):
+        tracker = self.listen()
+        topics = ["awtrix_1a2b3c/stats/currentApp", "awtrix_1a2b3c/stats/loop"]
+        self.assertTrue(self.broker.wait_subscribed(topics))
+        loop = {"Time": 0, "network_speed0": 1, "network_speed1": 2}
+        self.broker.publish(topics[1], json.dumps(loop).encode())
+        self.broker.publish(topics[0], b"network_speed1")
+        self.wait_for(lambda: tracker.current == "network_speed1")
+        self.assertEqual(tracker.loop, list(loop))
+        self.assertFalse(tracker.is_hidden("network_speed"))
+        self.assertTrue(tracker.is_hidden("weather"))
+
+    def test_device_prefix(self):
+        self.listen(device_prefix="clock/")
+        self.assertTrue(self.broker.wait_subscribed(["clock/stats/currentApp"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
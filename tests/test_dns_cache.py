@@ -0,0 +1,145 @@
+import os
+import socket
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import dns.exception
+import dns.resolver
+
+import dns_cache
+import metrics
+
+
+def answer(records, ttl):
+    """Stand-in for a dnspython answer"""
+    answer = mock.MagicMock()
+    answer.__iter__.return_value = records
+    answer.__getitem__.side_effect = records.__getitem__
+    answer.rrset.ttl = ttl
+    return answer
+
+
+def a_record(ip):
+    return SimpleNamespace(to_text=lambda: ip)
+
+
+class TestDnsCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tempdir.cleanup)
+        self.hosts_file = os.path.join(self.tempdir.name, "hosts")
+        with open(self.hosts_file, "w") as f:
+            f.write("127.0.0.1 localhost\n")
+        patcher = mock.patch("dns_cache.HOSTS_FILE", self.hosts_file)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        dns_cache.clear()
+        self.addCleanup(dns_cache.clear)
+        metrics.reset()
+
+    def test_ttl_expiry(self):
+        resolve = mock.Mock(
+            side_effect=[
+                answer([a_record("192.0.2.1")], 120),
+                answer([a_record("192.0.2.2")], 120),
+            ]
+        )
+        with mock.patch("dns.resolver.resolve", resolve):
+            with mock.patch("time.monotonic", return_value=1000):
+                self.assertEqual(dns_cache.resolve_host("example.com"), ["192.0.2.1"])
+            with mock.patch("time.monotonic", return_value=1119):
+                self.assertEqual(dns_cache.resolve_host("example.com"), ["192.0.2.1"])
+            with mock.patch("time.monotonic", return_value=1121):
+                self.assertEqual(dns_cache.resolve_host("example.com"), ["192.0.2.2"])
+        self.assertEqual(resolve.call_count, 2)
+
+    def test_min_ttl(self):
+        resolve = mock.Mock(return_value=answer([a_record("192.0.2.1")], 1))
+        with mock.patch("dns.resolver.resolve", resolve):
+            for now in (1000, 1000 + dns_cache.MIN_TTL - 1):
+                with mock.patch("time.monotonic", return_value=now):
+                    dns_cache.resolve_host("example.com")
+        self.assertEqual(resolve.call_count, 1)
+
+    def test_stale_on_failure(self):
+        resolve = mock.Mock(
+            side_effect=[answer([a_record("192.0.2.1")], 60), dns.exception.Timeout()]
+        )
+        with mock.patch("dns.resolver.resolve", resolve):
+            with mock.patch("time.monotonic", return_value=1000):
+                dns_cache.resolve_host("example.com")
+            with mock.patch("time.monotonic", return_value=2000):
+                self.assertEqual(dns_cache.resolve_host("example.com"), ["192.0.2.1"])
+        self.assertEqual(metrics.snapshot()["counters"]["dns.stale"], 1)
+
+        # Too old to serve
+        resolve = mock.Mock(side_effect=dns.exception.Timeout())
+        with mock.patch("dns.resolver.resolve", resolve):
+            with mock.patch("time.monotonic", return_value=1060 + dns_cache.MAX_STALE):
+                with self.assertRaises(dns.exception.Timeout):
+                    dns_cache.resolve_host("example.com")
+
+    def test_hosts_file_before_dns(self):
+        with open(self.hosts_file, "a") as f:
+            f.write("192.168.1.10 nas.lan  NAS  # local override\n")
+        resolve = mock.Mock(return_value=answer([a_record("203.0.113.1")], 60))
+        with mock.patch("dns.resolver.resolve", resolve):
+            self.assertEqual(dns_cache.resolve_host("nas.lan"), ["192.168.1.10"])
+            self.assertEqual(dns_cache.resolve_host("nas"), ["192.168.1.10"])
+        resolve.assert_not_called()
+
+    def test_system_resolver_only_for_unknown_names(self):
+        infos = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("192.168.1.20", 0))]
+        system = mock.Mock(return_value=infos)
+        with mock.patch("dns_cache._original_getaddrinfo", system):
+            with mock.patch(
+                "dns.resolver.resolve", side_effect=dns.resolver.NXDOMAIN()
+            ):
+                self.assertEqual(
+                    dns_cache.resolve_host("printer.local"), ["192.168.1.20"]
+                )
+            # A failing DNS server is not papered over by a second slow lookup
+            with mock.patch(
+                "dns.resolver.resolve", side_effect=dns.exception.Timeout()
+            ):
+                with self.assertRaises(dns.exception.Timeout):
+                    dns_cache.resolve_host("example.com")
+        system.assert_called_once()
+
+    def test_minecraft_srv(self):
+        srv = SimpleNamespace(target="mc-1.example.com.", port=25570)
+        resolve = mock.Mock(return_value=answer([srv], 600))
+        with mock.patch("dns.resolver.resolve", resolve):
+            self.assertEqual(
+                dns_cache.resolve_minecraft_srv("example.com", 25565),
+                ("mc-1.example.com", 25570),
+            )
+            # Cached
+            dns_cache.resolve_minecraft_srv("Example.com", 25565)
+        self.assertEqual(resolve.call_count, 1)
+        self.assertEqual(resolve.call_args.args[0], "_minecraft._tcp.example.com")
+
+        # Explicit port or IP address: no lookup
+        with mock.patch("dns.resolver.resolve") as resolve:
+            self.assertEqual(
+                dns_cache.resolve_minecraft_srv("example.com:1234", 25565),
+                ("example.com", 1234),
+            )
+            self.assertEqual(
+                dns_cache.resolve_minecraft_srv("192.0.2.1", 25565),
+                ("192.0.2.1", 25565),
+            )
+        resolve.assert_not_called()
+
+    def test_minecraft_without_srv(self):
+        with mock.patch("dns.resolver.resolve", side_effect=dns.resolver.NXDOMAIN()):
+            self.assertEqual(
+                dns_cache.resolve_minecraft_srv("mc.example.com", 25565),
+                ("mc.example.com", 25565),
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import random
+import unittest
+
+from helpers import optimize_draw_commands
+from support import FRAME_HEIGHT, FRAME_WIDTH, contributions, draw_size, raw_commands
+from tasks.task_github_contributions import generate_packed_pixels
+
+
+def render(commands, width=FRAME_WIDTH, height=FRAME_HEIGHT):
+    """Render AWTRIX draw commands to packed pixels, row by row"""
+    canvas = [None] * (width * height)
+
+    def color(value):
+        return int(value.lstrip("#"), 16)
+
+    def put(x, y, value):
+        if 0 <= x < width and 0 <= y < height:
+            canvas[y * width + x] = value
+
+    for command in commands:
+        ((name, args),) = command.items()
+        if name == "dp":
+            x, y, c = args
+            put(x, y, color(c))
+        elif name == "dl":
+            x0, y0, x1, y1, c = args
+            # Only horizontal / vertical lines are emitted
+            for y in range(min(y0, y1), max(y0, y1) + 1):
+                for x in range(min(x0, x1), max(x0, x1) + 1):
+                    put(x, y, color(c))
+        elif name == "df":
+            x0, y0, w, h, c = args
+            for y in range(y0, y0 + h):
+                for x in range(x0, x0 + w):
+                    put(x, y, color(c))
+        elif name == "db":
+            x0, y0, w, h, bitmap = args
+            for i, value in enumerate(bitmap):
+                put(x0 + i % w, y0 + i // w, value)
+        else:
+            raise ValueError(f"Unknown draw command {name}")
+    return canvas
+
+
+class TestDrawOptimizer(unittest.TestCase):
+    def assertRoundTrip(self, pixels):
+        commands = optimize_draw_commands(0, 0, FRAME_WIDTH, FRAME_HEIGHT, pixels)
+        self.assertEqual(render(commands), pixels)
+        self.assertLessEqual(draw_size(commands), draw_size(raw_commands(pixels)))
+        return commands
+
+    def test_contributions_heatmap(self):
+        for ratio in (0.05, 0.3, 0.8):
+            pixels = generate_packed_pixels(contributions(365, ratio, seed=1))
+            commands = self.assertRoundTrip(pixels)
+            if ratio < 0.1:
+                self.assertLess(
+                    draw_size(commands), draw_size(raw_commands(pixels)) / 2
+                )
+
+    def test_split_by_month_heatmap(self):
+        pixels = generate_packed_pixels(
+            contributions(365, 0.2, seed=2), split_by_month=True
+        )
+        self.assertRoundTrip(pixels)
+
+    def test_solid_and_empty(self):
+        commands = self.assertRoundTrip([0] * (FRAME_WIDTH * FRAME_HEIGHT))
+        self.assertEqual(
+            commands, [{"df": [0, 0, FRAME_WIDTH, FRAME_HEIGHT, "#000000"]}]
+        )
+        self.assertRoundTrip(generate_packed_pixels([]))
+
+    def test_noise_falls_back_to_bitmap(self):
+        rng = random.Random(3)
+        pixels = [rng.randrange(1 << 24) for _ in range(FRAME_WIDTH * FRAME_HEIGHT)]
+        commands = self.assertRoundTrip(pixels)
+        self.assertEqual(commands[0], {"db": [0, 0, FRAME_WIDTH, FRAME_HEIGHT, pixels]})
+
+    def test_offset_frame(self):
+        pixels = [0xFF0000 if i % 5 == 0 else 0 for i in range(8 * 8)]
+        commands = optimize_draw_commands(4, 0, 8, 8, pixels)
+        canvas = render(commands)
+        for i, value in enumerate(pixels):
+            self.assertEqual(canvas[(i // 8) * FRAME_WIDTH + 4 + i % 8], value)
+
+
+if __name__ == "__main__":
+    unittest.main()
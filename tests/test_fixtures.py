@@ -0,0 +1,120 @@
+import base64
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+import deadline
+import fixtures
+from helpers import download_image, requests_get
+from support import ConfigTestCase, HttpStandIn, ImageServer
+
+
+class TestFixtures(ConfigTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fixtures_file = os.path.join(self.tmp_dir, "fixtures.json")
+        self.set_latency_scale(0)
+        self.addCleanup(fixtures.set_mode, None)
+
+    def set_latency_scale(self, scale):
+        self.write_config(
+            f"app:\n  fixtures_file: {json.dumps(self.fixtures_file)}\n"
+            f"  fixtures_latency_scale: {scale}\n"
+        )
+
+    def test_http_record_and_replay_offline(self):
+        device = HttpStandIn()
+        url = f"http://{device.host}/api/custom"
+        fixtures.set_mode(fixtures.RECORD)
+        # POST to the stand-in (only endpoint it has), through the same layer
+        recorded = fixtures.request("POST", url, params={"name": "a", "key": "secret"})
+        self.assertEqual(recorded.status_code, 200)
+        device.close()
+
+        with open(self.fixtures_file) as f:
+            archive = f.read()
+        self.assertNotIn("secret", archive)
+
+        fixtures.set_mode(fixtures.REPLAY)
+        fixtures._archive = None
+        replayed = fixtures.request("POST", url, params={"key": "other", "name": "a"})
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed.headers, recorded.headers)
+        with self.assertRaises(fixtures.FixtureMissing):
+            fixtures.request("POST", url, params={"name": "b"})
+
+    def test_replayed_body_and_errors(self):
+        fixtures.set_mode(fixtures.RECORD)
+        with mock.patch.object(fixtures.requests, "request") as request:
+            response = fixtures.requests.Response()
+            response.status_code = 200
+            response.reason = "OK"
+            response.url = "https://api.example.com/users/a"
+            response._content = b'{"followers": 42}'
+            response.headers["Content-Type"] = "application/json"
+            request.return_value = response
+            requests_get("https://api.example.com/users/a")
+            request.side_effect = fixtures.requests.ConnectionError("down")
+            with self.assertRaises(fixtures.requests.ConnectionError):
+                requests_get("https://api.example.com/users/a")
+
+        fixtures.set_mode(fixtures.REPLAY)
+        fixtures._archive = None
+        response = requests_get("https://api.example.com/users/a")
+        self.assertEqual(response.json(), {"followers": 42})
+        self.assertEqual(
+            list(response.iter_content(4)), [b'{"fo', b"llow", b'ers"', b": 42", b"}"]
+        )
+        with self.assertRaises(fixtures.ReplayedError):
+            requests_get("https://api.example.com/users/a")
+        # Recorded responses are served in turn
+        self.assertEqual(
+            requests_get("https://api.example.com/users/a").status_code, 200
+        )
+
+    def test_record_keeps_image_size_cap(self):
+        server = ImageServer({"big.jpg": (640, ".jpg"), "icon.jpg": (16, ".jpg")})
+        self.addCleanup(server.server.shutdown)
+        fixtures.set_mode(fixtures.RECORD)
+        with self.assertRaises(ValueError):
+            download_image(f"{server.base}/big.jpg", max_bytes=1000)
+        icon = download_image(f"{server.base}/icon.jpg", max_bytes=1000)
+
+        with open(self.fixtures_file) as f:
+            entries = json.load(f)["entries"]
+        bodies = [
+            base64.b64decode(entry["response"]["body"])
+            for key in entries
+            for entry in entries[key]
+        ]
+        # Only as much of the large image as it takes to reject it
+        self.assertEqual(sorted(map(len, bodies)), [len(icon), 1001])
+
+        fixtures.set_mode(fixtures.REPLAY)
+        fixtures._archive = None
+        with self.assertRaises(ValueError):
+            download_image(f"{server.base}/big.jpg", max_bytes=1000)
+        self.assertEqual(download_image(f"{server.base}/icon.jpg"), icon)
+
+    def test_call_replays_latency_within_deadline(self):
+        fixtures.set_mode(fixtures.RECORD)
+        result = fixtures.call(
+            "mcstatus example.org", lambda: time.sleep(0.05) or {"online": 3}
+        )
+        self.assertEqual(result, {"online": 3})
+
+        fixtures.set_mode(fixtures.REPLAY)
+        fixtures._archive = None
+        self.set_latency_scale(1)
+        start = time.monotonic()
+        self.assertEqual(fixtures.call("mcstatus example.org", None), {"online": 3})
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        with deadline.within(0.01):
+            with self.assertRaises(deadline.DeadlineExceeded):
+                fixtures.call("mcstatus example.org", None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+from helpers import format_bytes
+
+
+class TestFormatBytes(unittest.TestCase):
+    def test_bytes(self):
+        self.assertEqual(format_bytes(0), "0 B")
+        self.assertEqual(format_bytes(9), "9 B")
+        self.assertEqual(format_bytes(10), "10 B")
+        self.assertEqual(format_bytes(999), "999 B")
+
+    def test_kilobytes(self):
+        self.assertEqual(format_bytes(1000), "1.0 KB")
+        self.assertEqual(format_bytes(1023), "1.0 KB")
+        self.assertEqual(format_bytes(1024), "1.0 KB")
+        self.assertEqual(format_bytes(1025), "1.0 KB")
+        self.assertEqual(format_bytes(1500), "1.5 KB")
+
+    def test_larger_units(self):
+        self.assertEqual(format_bytes(1 << 20), "1.0 MB")
+        self.assertEqual(format_bytes(1 << 29), "512 MB")
+        self.assertEqual(format_bytes(1 << 31), "2.0 GB")
+
+    def test_float_speed(self):
+        self.assertEqual(format_bytes(2048.7), "2.0 KB")
+
+
+if __name__ == "__main__":
+    unittest.main()
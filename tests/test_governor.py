@@ -0,0 +1,95 @@
+import statistics
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from unittest import mock
+
+import deadline
+import helpers
+from governor import Governor, host_slot
+from support import ConfigTestCase, run_governor_workload
+
+TASKS = 1000
+MAX_WORKERS = 16
+HOST_CONCURRENCY = 4
+
+
+class TestGovernor(ConfigTestCase):
+    config_text = f"app:\n  host_concurrency: {HOST_CONCURRENCY}\n"
+
+    def test_scaling_1000_tasks(self):
+        stats = run_governor_workload(TASKS, MAX_WORKERS)
+        self.assertEqual(stats["completed"], TASKS)
+        self.assertLessEqual(stats["max_threads"], MAX_WORKERS + 1)
+        self.assertLessEqual(stats["max_in_flight"], HOST_CONCURRENCY)
+        steady = stats["steady"]
+        self.assertGreaterEqual(min(steady), statistics.median(steady) / 2)
+
+    def test_priority_then_deadline(self):
+        governor = Governor(1)
+        release = threading.Event()
+        order = []
+        governor.submit(release.wait)
+        futures = [
+            governor.submit(lambda name=name: order.append(name), priority, deadline)
+            for name, priority, deadline in (
+                ("low", 3, 0),
+                ("high late", 1, 20),
+                ("high early", 1, 10),
+                ("normal", 2, 0),
+            )
+        ]
+        release.set()
+        for future in futures:
+            future.result(1)
+        self.assertEqual(order, ["high early", "high late", "normal", "low"])
+
+    def test_timeout_resolves_with_fallback(self):
+        governor = Governor(2)
+        start = time.monotonic()
+        future = governor.submit(
+            lambda: time.sleep(0.5) or "fresh", timeout=0.05, on_timeout=lambda: "old"
+        )
+        self.assertEqual(future.result(1), "old")
+        self.assertLess(time.monotonic() - start, 0.3)
+        self.assertEqual(governor.submit(lambda: "fresh", timeout=1).result(1), "fresh")
+
+    def test_full_host_does_not_park_workers(self):
+        self.write_config("app:\n  host_limits:\n    busy.example: 1\n")
+        governor = Governor(2)
+
+        def use_host(release=None):
+            with host_slot("busy.example"):
+                if release:
+                    release.wait(5)
+
+        # Learn the host of the "busy" jobs
+        governor.submit(use_host, key="busy").result(1)
+        release = threading.Event()
+        holding = governor.submit(lambda: use_host(release), key="busy")
+        waiting = governor.submit(use_host, key="busy")
+        # The second worker runs this instead of blocking on the busy host
+        self.assertEqual(governor.submit(lambda: "done").result(1), "done")
+        self.assertFalse(waiting.done())
+        release.set()
+        holding.result(1)
+        waiting.result(1)
+
+    def test_request_timeout_after_slot_wait(self):
+        @contextmanager
+        def slow_slot(host):
+            time.sleep(0.3)
+            yield
+
+        response = mock.Mock(status_code=200)
+        with mock.patch("helpers.host_slot", slow_slot):
+            with mock.patch("fixtures.request", return_value=response) as request:
+                with deadline.within(1):
+                    helpers.requests_get("http://example.com/")
+        # The wait for the slot came out of the budget
+        self.assertLessEqual(request.call_args.kwargs["timeout"], 0.7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import base64
+import unittest
+from unittest import mock
+
+import cv2
+import numpy as np
+
+import helpers
+from support import ImageServer, make_image
+
+SPOTIFY_IMAGES = [
+    {"url": "https://i.scdn.co/image/640", "width": 640, "height": 640},
+    {"url": "https://i.scdn.co/image/300", "width": 300, "height": 300},
+    {"url": "https://i.scdn.co/image/64", "width": 64, "height": 64},
+]
+
+
+class TestIconPipeline(unittest.TestCase):
+    def test_smallest_source(self):
+        self.assertEqual(
+            helpers.smallest_image_url(SPOTIFY_IMAGES, (8, 8)),
+            "https://i.scdn.co/image/64",
+        )
+        self.assertEqual(
+            helpers.smallest_image_url(SPOTIFY_IMAGES, (100, 100)),
+            "https://i.scdn.co/image/300",
+        )
+        # Nothing covers the target, take the largest
+        self.assertEqual(
+            helpers.smallest_image_url(SPOTIFY_IMAGES, (1000, 1000)),
+            "https://i.scdn.co/image/640",
+        )
+        self.assertEqual(helpers.smallest_image_url(None, (8, 8)), "")
+
+        self.assertEqual(
+            helpers.sized_image_url(
+                "https://avatars.githubusercontent.com/u/1?v=4&s=460", (8, 8)
+            ),
+            "https://avatars.githubusercontent.com/u/1?v=4&s=32",
+        )
+        self.assertEqual(
+            helpers.sized_image_url("https://i.scdn.co/image/64", (8, 8)),
+            "https://i.scdn.co/image/64",
+        )
+
+    def test_reduced_decode(self):
+        with mock.patch.object(cv2, "imdecode", wraps=cv2.imdecode) as imdecode:
+            image = helpers.decode_image(make_image(640, ".jpg"), (8, 8))
+        self.assertEqual(image.shape, (8, 8, 3))
+        # 1/8 of 640 still covers 8x8, decoded once
+        self.assertEqual(imdecode.call_args[0][1], cv2.IMREAD_REDUCED_COLOR_8)
+        self.assertEqual(imdecode.call_count, 1)
+
+        # 1/8 and 1/4 of 16 are too small
+        with mock.patch.object(cv2, "imdecode", wraps=cv2.imdecode) as imdecode:
+            image = helpers.decode_image(make_image(16, ".jpg"), (8, 8))
+        self.assertEqual(image.shape, (8, 8, 3))
+        self.assertEqual(imdecode.call_args[0][1], cv2.IMREAD_REDUCED_COLOR_2)
+
+        # Not JPEG: a reduced decode would still decode everything, done once
+        with mock.patch.object(cv2, "imdecode", wraps=cv2.imdecode) as imdecode:
+            image = helpers.decode_image(make_image(640, ".png"), (8, 8))
+        self.assertEqual(image.shape, (8, 8, 3))
+        self.assertEqual(imdecode.call_args[0][1], cv2.IMREAD_COLOR)
+        self.assertEqual(imdecode.call_count, 1)
+
+    def test_download_is_capped(self):
+        server = ImageServer({"big.jpg": (640, ".jpg")})
+        self.addCleanup(server.server.shutdown)
+        url = f"{server.base}/big.jpg"
+        self.assertGreater(len(helpers.download_image(url)), 10000)
+        with self.assertRaises(ValueError):
+            helpers.download_image(url, max_bytes=10000)
+        packed = helpers.fetch_image_and_convert_to_packed_rgb(url, (8, 8))
+        self.assertEqual(len(packed), 64)
+        self.assertTrue(all(0 <= value <= 0xFFFFFF for value in packed))
+
+    def test_smallest_encoding_within_error(self):
+        image = helpers.decode_image(make_image(640, ".jpg"), (8, 8))
+        candidates = helpers.icon_candidates(image)
+        self.assertEqual({c["format"] for c in candidates}, {"jpg", "png", "draw"})
+
+        icon = helpers.encode_icon(image, max_error=6)
+        self.assertEqual(icon["format"], "jpg")
+        self.assertLessEqual(icon["error"], 6)
+        for candidate in candidates:
+            if candidate["format"] == "jpg" and candidate["error"] <= 6:
+                self.assertLessEqual(icon["size"], candidate["size"])
+        # Smaller than the plain encoding
+        self.assertLess(icon["size"], candidates[0]["size"])
+        decoded = cv2.imdecode(
+            np.frombuffer(base64.b64decode(icon["payload"]), np.uint8),
+            cv2.IMREAD_COLOR,
+        )
+        self.assertEqual(decoded.shape, (8, 8, 3))
+
+        # Nothing is accurate enough, take the most accurate
+        icon = helpers.encode_icon(image, max_error=0)
+        self.assertEqual(
+            icon["error"],
+            min(c["error"] for c in candidates if c["format"] == "jpg"),
+        )
+
+        # Only the accepted encodings are built
+        with (
+            mock.patch.object(
+                helpers, "optimize_draw_commands", wraps=helpers.optimize_draw_commands
+            ) as draw,
+            mock.patch.object(
+                helpers, "quantize_colors", wraps=helpers.quantize_colors
+            ) as quantize,
+        ):
+            helpers.encode_icon(image, max_error=6)
+        draw.assert_not_called()
+        quantize.assert_not_called()
+
+        # Lossless PNG wins where the consumer accepts it
+        icon = helpers.encode_icon(image, max_error=0, formats=("jpg", "png"))
+        self.assertEqual((icon["name"], icon["error"]), ("png", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
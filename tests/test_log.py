@@ -0,0 +1,81 @@
+import logging
+import queue
+import unittest
+from unittest import mock
+
+import log
+import main
+
+
+def make_record(msg, rate_key=None):
+    record = logging.LogRecord("awtrix", logging.INFO, __file__, 1, msg, (), None)
+    if rate_key is not None:
+        record.rate_key = rate_key
+    return record
+
+
+class TestLog(unittest.TestCase):
+    def test_summarize_payload(self):
+        self.assertEqual(log.summarize_payload("short", limit=10), "short")
+        payload = '{"draw": [' + "1, " * 500 + "1]}"
+        summary = log.summarize_payload(payload, limit=10)
+        self.assertTrue(summary.startswith(payload[:10] + "... "))
+        self.assertIn(f"({len(payload)} chars, sha1 ", summary)
+        # Same payload, same hash
+        self.assertEqual(summary, log.summarize_payload(payload, limit=10))
+        self.assertNotIn(payload[:10], log.summarize_payload(payload, limit=0))
+        self.assertEqual(log.summarize_payload(payload, limit=-1), payload)
+
+    def test_rate_limit_per_key(self):
+        rate_filter = log.RateLimitFilter(limit=2)
+        with mock.patch("time.monotonic", return_value=0):
+            passed = [rate_filter.filter(make_record("a", "a.send")) for _ in range(5)]
+            self.assertTrue(rate_filter.filter(make_record("b", "b.send")))
+            # Not limited without a key
+            self.assertTrue(all(rate_filter.filter(make_record("x")) for _ in range(5)))
+        self.assertEqual(passed, [True, True, False, False, False])
+
+        with mock.patch("time.monotonic", return_value=log.RATE_WINDOW):
+            record = make_record("a", "a.send")
+            self.assertTrue(rate_filter.filter(record))
+        self.assertEqual(record.msg, "a (3 similar suppressed)")
+
+    def test_full_queue_drops(self):
+        handler = log.DroppingQueueHandler(queue.Queue(1))
+        handler.emit(make_record("first"))
+        handler.emit(make_record("second"))
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "first")
+        self.assertTrue(handler.queue.empty())
+
+    def test_unknown_level_keeps_current(self):
+        self.addCleanup(log.logger.setLevel, log.logger.level)
+        if log._listener is None:
+            self.addCleanup(log.shutdown)
+        app_config = {
+            "log_level": "debug",
+            "log_payload_limit": 120,
+            "log_rate_limit": 10,
+        }
+        log.configure(app_config)
+        self.assertEqual(log.logger.level, logging.DEBUG)
+        # A typo in a reloaded config does not raise
+        with mock.patch.object(log.logger, "warning") as warning:
+            log.configure(dict(app_config, log_level="INFOO"))
+        self.assertEqual(log.logger.level, logging.DEBUG)
+        warning.assert_called_once()
+
+    def test_no_summary_below_info(self):
+        level = log.logger.level
+        self.addCleanup(log.logger.setLevel, level)
+        log.logger.setLevel(logging.WARNING)
+        with (
+            mock.patch("log.summarize_payload") as summarize,
+            mock.patch("main.send_message") as send,
+        ):
+            main.send_result("app", {"text": "hi"}, 0)
+        summarize.assert_not_called()
+        send.assert_called_once_with("app", '{"text": "hi"}')
+
+
+if __name__ == "__main__":
+    unittest.main()
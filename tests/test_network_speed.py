@@ -0,0 +1,96 @@
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from tasks.task_network_speed import NetworkSpeedSampler, NetworkSpeedTask
+
+Counter = namedtuple("Counter", ["bytes_recv", "bytes_sent"])
+
+
+class TestNetworkSpeedSampler(unittest.TestCase):
+    def test_ewma(self):
+        sampler = NetworkSpeedSampler([], alpha=0.5)
+        sampler.sample(0, {"eth0": Counter(0, 0)})
+        self.assertIsNone(sampler.get_speed())
+        self.assertFalse(sampler.ready.is_set())
+        sampler.sample(1, {"eth0": Counter(1000, 100)})
+        self.assertEqual(sampler.get_speed(), (1000, 100))
+        self.assertTrue(sampler.ready.is_set())
+        # 2 s at 3000 B/s down, nothing up
+        sampler.sample(3, {"eth0": Counter(7000, 100)})
+        self.assertEqual(sampler.get_speed(), (2000, 50))
+
+    def test_counter_reset(self):
+        sampler = NetworkSpeedSampler([], alpha=1)
+        sampler.sample(0, {"eth0": Counter(50_000, 9000)})
+        sampler.sample(1, {"eth0": Counter(200, 100)})
+        self.assertEqual(sampler.get_speed(), (0, 0))
+        sampler.sample(2, {"eth0": Counter(1200, 600)})
+        self.assertEqual(sampler.get_speed(), (1000, 500))
+
+    def test_sums_interfaces(self):
+        sampler = NetworkSpeedSampler([], alpha=1)
+        sampler.sample(0, {"eth0": Counter(0, 0), "wlan0": Counter(0, 0)})
+        # An interface that just appeared has no speed yet
+        sampler.sample(
+            1,
+            {"eth0": Counter(100, 10), "wlan0": Counter(20, 2), "usb0": Counter(9, 9)},
+        )
+        self.assertEqual(sampler.get_speed(), (120, 12))
+
+    def test_interface_filter(self):
+        counters = {
+            "lo": Counter(1, 1),
+            "eth0": Counter(2, 2),
+            "wlan0": Counter(3, 3),
+        }
+        with mock.patch("psutil.net_io_counters", return_value=counters):
+            # Everything but loopback by default
+            self.assertEqual(
+                set(NetworkSpeedSampler([], 1).get_counters()), {"eth0", "wlan0"}
+            )
+            # Configured interfaces that do not exist are skipped
+            self.assertEqual(
+                set(NetworkSpeedSampler(["wlan0", "tun0"], 1).get_counters()),
+                {"wlan0"},
+            )
+
+
+class TestNetworkSpeedTask(unittest.TestCase):
+    def test_sampler_starts_on_first_run(self):
+        with mock.patch("tasks.base.get_task_config", return_value={"enabled": True}):
+            task = NetworkSpeedTask()
+        self.addCleanup(task.close)
+        # Created (e.g. by cleanup) without running: no thread
+        self.assertIsNone(task.sampler)
+
+        self.assertEqual(set(task.fetch_data()), {"download", "upload"})
+        sampler = task.sampler
+        self.assertTrue(sampler.is_alive())
+        task.fetch_data()
+        self.assertIs(task.sampler, sampler)
+
+        # Changed settings restart it
+        task.reconfigure({"enabled": True, "ewma_alpha": 1})
+        self.assertIsNot(task.sampler, sampler)
+        self.assertEqual(task.sampler.alpha, 1)
+        sampler.join(5)
+        self.assertFalse(sampler.is_alive())
+
+    def test_sampler_stops_when_disabled(self):
+        with mock.patch("tasks.base.get_task_config", return_value={"enabled": True}):
+            task = NetworkSpeedTask()
+        task.fetch_data()
+        sampler = task.sampler
+        task.reconfigure({"enabled": False})
+        self.assertIsNone(task.sampler)
+        sampler.join(5)
+        self.assertFalse(sampler.is_alive())
+
+        # Enabled again: still nothing until it runs
+        task.reconfigure({"enabled": True})
+        self.assertIsNone(task.sampler)
+
+
+if __name__ == "__main__":
+    unittest.main()
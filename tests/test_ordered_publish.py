@@ -0,0 +1,25 @@
+import unittest
+
+from support import PUBLISH_DELAYS, publish_cycle
+
+
+class TestOrderedPublish(unittest.TestCase):
+    def test_first_publish_at_fastest_high_priority_latency(self):
+        sent, results = publish_cycle(
+            ["clock", "fast", "slow", "cached"], ["clock", "cached"]
+        )
+        self.assertEqual(
+            [name for name, _ in sent], ["clock", "fast", "slow", "cached"]
+        )
+        sent_at = dict(sent)
+        self.assertLess(sent_at["fast"], PUBLISH_DELAYS["slow"] / 2)
+        self.assertGreaterEqual(sent_at["cached"], PUBLISH_DELAYS["slow"])
+        self.assertEqual(results["slow"], {"text": "slow"})
+
+    def test_lower_priority_waits_for_higher(self):
+        sent, _ = publish_cycle(["slow", "fast"], [])
+        self.assertEqual([name for name, _ in sent], ["slow", "fast"])
+
+
+if __name__ == "__main__":
+    unittest.main()
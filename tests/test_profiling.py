@@ -0,0 +1,98 @@
+import json
+import os
+import pstats
+import threading
+import unittest
+from unittest import mock
+
+import profiling
+from support import ConfigTestCase, profiling_overhead
+
+
+def workload():
+    return [json.dumps({"i": i, "text": "x" * 50}) for i in range(2000)]
+
+
+class TestProfiling(ConfigTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store_dir = os.path.join(self.tmp_dir, "data")
+        self.write_config(f"app:\n  store_dir: {json.dumps(self.store_dir)}\n")
+        for name in ("_targets", "_ratio"):
+            patcher = mock.patch.object(profiling, name, None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def profiles(self):
+        profiles_dir = os.path.join(self.store_dir, "profiles")
+        if not os.path.isdir(profiles_dir):
+            return []
+        return sorted(os.listdir(profiles_dir))
+
+    def test_writes_pstats_and_allocations(self):
+        profiling.enable(ratio=1)
+        with profiling.profiled("weather"):
+            workload()
+        alloc_file, pstats_file = self.profiles()
+        self.assertTrue(pstats_file.startswith("weather-"))
+        self.assertTrue(pstats_file.endswith(".pstats"))
+        stats = pstats.Stats(os.path.join(self.store_dir, "profiles", pstats_file))
+        self.assertTrue(any(func[2] == "workload" for func in stats.stats))
+        with open(os.path.join(self.store_dir, "profiles", alloc_file)) as f:
+            report = f.read()
+        self.assertIn("test_profiling.py", report)
+
+    def test_targets_and_sampling(self):
+        profiling.enable(["cycle"], ratio=1)
+        with profiling.profiled("weather"):
+            workload()
+        profiling.enable(ratio=0)
+        with profiling.profiled("cycle"):
+            workload()
+        self.assertEqual(self.profiles(), [])
+
+    def run_task(self, name):
+        """Run a profiled task on a worker thread"""
+
+        def run():
+            with profiling.profiled(name):
+                workload()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+    def load_stats(self, prefix):
+        (pstats_file,) = [
+            name
+            for name in self.profiles()
+            if name.startswith(prefix) and name.endswith(".pstats")
+        ]
+        return pstats.Stats(os.path.join(self.store_dir, "profiles", pstats_file))
+
+    def test_cycle_includes_worker_threads(self):
+        profiling.enable(["cycle"], ratio=1)
+        cycle = profiling.start("cycle")
+        self.run_task("weather")
+        cycle.stop()
+        # Only the cycle is a target
+        self.assertEqual(len(self.profiles()), 2)
+        stats = self.load_stats("cycle-")
+        self.assertTrue(any(func[2] == "workload" for func in stats.stats))
+
+    def test_task_profiles_during_cycle(self):
+        profiling.enable(ratio=1)
+        cycle = profiling.start("cycle")
+        self.run_task("weather")
+        cycle.stop()
+        stats = self.load_stats("weather-")
+        self.assertTrue(any(func[2] == "workload" for func in stats.stats))
+        self.assertEqual(len(self.profiles()), 4)
+
+    def test_unsampled_overhead(self):
+        per_call = profiling_overhead(1000, set(), 0)
+        self.assertLess(per_call, 0.001)
+
+
+if __name__ == "__main__":
+    unittest.main()
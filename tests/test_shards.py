@@ -0,0 +1,103 @@
+import multiprocessing
+import time
+import unittest
+from unittest import mock
+
+import governor
+from demand import QueuedStatsListener, RotationTracker, StatsFanout
+from shards import SharedResultTable, shard_of
+
+NAMES = ["air_quality", "github_contributions", "spotify_current_playback"]
+
+
+def write_results(table_spec, name, results):
+    table = SharedResultTable(*table_spec)
+    try:
+        for result in results:
+            table.put(name, result)
+    finally:
+        table.close()
+
+
+class TestSharedResultTable(unittest.TestCase):
+    def setUp(self):
+        self.context = multiprocessing.get_context("spawn")
+        self.table = SharedResultTable.create(NAMES, 256, self.context)
+        self.addCleanup(self.table.close)
+
+    def test_shard_of_is_stable(self):
+        self.assertEqual(shard_of("air_quality", 4), shard_of("air_quality", 4))
+        shards = {shard_of(f"task{i}", 4) for i in range(100)}
+        self.assertEqual(shards, {0, 1, 2, 3})
+
+    def test_changes_only(self):
+        self.assertTrue(self.table.put("air_quality", {"text": "42"}))
+        self.assertFalse(self.table.put("air_quality", {"text": "42"}))
+        changes = self.table.wait_changes(timeout=0)
+        self.assertEqual(list(changes), ["air_quality"])
+        self.assertEqual(changes["air_quality"][0], '{"text": "42"}')
+        self.assertEqual(self.table.wait_changes(timeout=0), {})
+
+        # Too large for a slot
+        self.assertFalse(self.table.put("air_quality", {"text": "x" * 300}))
+
+        self.table.mark_all_changed()
+        self.assertEqual(list(self.table.wait_changes(timeout=0)), ["air_quality"])
+
+    def test_results_from_worker_process(self):
+        results = [{"text": str(i)} for i in range(20)] + [{}]
+        worker = self.context.Process(
+            target=write_results,
+            args=(self.table.spec(), "github_contributions", results),
+        )
+        worker.start()
+        worker.join(30)
+        self.assertEqual(worker.exitcode, 0)
+        # Only the newest result of each app is read
+        changes = self.table.wait_changes(timeout=1)
+        self.assertEqual(changes["github_contributions"][0], "{}")
+        self.assertNotIn("air_quality", changes)
+
+
+class TestShardWorkers(unittest.TestCase):
+    def test_limits_split_between_shards(self):
+        app_config = {
+            "max_workers": 8,
+            "host_concurrency": 2,
+            "host_limits": {"api.github.com": 5},
+        }
+        self.addCleanup(governor.set_shards, 1)
+        with mock.patch("governor.get_app_config", return_value=app_config):
+            governor.set_shards(4)
+            self.assertEqual(governor.get_host_limit("api.github.com").limit, 1)
+            self.assertEqual(governor.get_host_limit("api.spotify.com").limit, 1)
+            governor.set_shards(2)
+            self.assertEqual(governor.get_host_limit("api.github.com").limit, 2)
+            governor.set_shards(1)
+            self.assertEqual(governor.get_host_limit("api.github.com").limit, 5)
+            self.assertEqual(governor._share(app_config["max_workers"]), 8)
+
+    def test_stats_forwarded_to_workers(self):
+        context = multiprocessing.get_context("spawn")
+        queues = [context.Queue(10) for _ in range(2)]
+        trackers = [RotationTracker() for _ in queues]
+        for tracker, stats_queue in zip(trackers, queues):
+            listener = QueuedStatsListener(tracker, stats_queue)
+            listener.start()
+            self.addCleanup(listener.stop)
+
+        # Handles messages like the tracker of a DeviceStatsListener
+        fanout = StatsFanout(queues)
+        fanout.handle("awtrix/stats/loop", b'{"Time": 0, "weather": 1}', now=100)
+        fanout.handle("awtrix/stats/currentApp", b"weather", now=101)
+        deadline = time.monotonic() + 5
+        while any(tracker.current != "weather" for tracker in trackers):
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        for tracker in trackers:
+            self.assertEqual(tracker.loop, ["Time", "weather"])
+            self.assertEqual(tracker.current_since, 101)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+import json
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from support import ConfigTestCase
+from tasks.task_spotify_current_playback import (
+    BudgetSession,
+    InMemoryCacheFileHandler,
+    SpotifyCurrentPlaybackTask,
+    TokenRefresher,
+)
+
+AUTH_CONFIG = {
+    "client_id": "id",
+    "client_secret": "secret",
+    "auth_cache_file": "spotify_cache.json",
+}
+
+
+def make_token(expires_in, access_token="access"):
+    return {
+        "access_token": access_token,
+        "refresh_token": "refresh",
+        "expires_at": int(time.time()) + expires_in,
+    }
+
+
+class TestSpotifyClient(ConfigTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store_dir = os.path.join(self.tmp_dir, "data")
+        os.makedirs(self.store_dir)
+        self.write_config(f"app:\n  store_dir: {json.dumps(self.store_dir)}\n")
+        self.cache_path = os.path.join(self.store_dir, "spotify_cache.json")
+
+    def make_task(self):
+        task = SpotifyCurrentPlaybackTask()
+        task.task_config = dict(task.task_config, **AUTH_CONFIG)
+        self.addCleanup(task.close)
+        return task
+
+    def test_client_created_once(self):
+        task = self.make_task()
+        with mock.patch.object(TokenRefresher, "run"):
+            client = task.get_client()
+            self.assertIs(task.get_client(), client)
+        self.assertIsInstance(client._session, BudgetSession)
+        auth_manager = client.auth_manager
+        self.assertIsInstance(auth_manager.cache_handler, InMemoryCacheFileHandler)
+        self.assertEqual(auth_manager.cache_handler.cache_path, self.cache_path)
+        self.assertIs(task.token_refresher.auth_manager, auth_manager)
+
+    def test_client_shared_by_concurrent_runs(self):
+        task = self.make_task()
+        created = []
+
+        def create_client():
+            time.sleep(0.05)
+            created.append(object())
+            return created[-1]
+
+        task.create_client = create_client
+        clients = []
+        threads = [
+            threading.Thread(target=lambda: clients.append(task.get_client()))
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(created), 1)
+        self.assertEqual(clients, created * 4)
+
+    def test_reconfigure_keeps_client_unless_auth_changes(self):
+        task = self.make_task()
+        with mock.patch.object(TokenRefresher, "run"):
+            client = task.get_client()
+            refresher = task.token_refresher
+
+            task.reconfigure(dict(task.task_config, show_artist=True))
+            self.assertIs(task.get_client(), client)
+            self.assertFalse(refresher.stop_event.is_set())
+
+            task.reconfigure(dict(task.task_config, client_id="other"))
+            self.assertTrue(refresher.stop_event.is_set())
+            self.assertIsNone(task.sp)
+            self.assertIsNot(task.get_client(), client)
+            self.assertEqual(task.sp.auth_manager.client_id, "other")
+
+    def test_token_cache_in_memory(self):
+        token = make_token(3600)
+        with open(self.cache_path, "w") as f:
+            json.dump(token, f)
+        handler = InMemoryCacheFileHandler(self.cache_path)
+
+        with mock.patch("builtins.open", wraps=open) as opened:
+            self.assertEqual(handler.get_cached_token(), token)
+            self.assertEqual(handler.get_cached_token(), token)
+            # Unchanged token, not written back
+            handler.save_token_to_cache(dict(token))
+        self.assertEqual(opened.call_count, 1)
+
+        refreshed = make_token(3600, access_token="new")
+        handler.save_token_to_cache(refreshed)
+        self.assertEqual(handler.get_cached_token(), refreshed)
+        with open(self.cache_path) as f:
+            self.assertEqual(json.load(f), refreshed)
+
+
+class TestTokenRefresher(unittest.TestCase):
+    def make_auth_manager(self, token):
+        auth_manager = mock.Mock()
+        auth_manager.cache_handler.get_cached_token.side_effect = lambda: token
+        return auth_manager
+
+    def test_refreshes_before_expiry(self):
+        token = make_token(60)
+        auth_manager = self.make_auth_manager(token)
+        refreshed = threading.Event()
+
+        def refresh_access_token(refresh_token):
+            token.update(make_token(3600, access_token="new"))
+            refreshed.set()
+
+        auth_manager.refresh_access_token.side_effect = refresh_access_token
+        refresher = TokenRefresher(auth_manager, margin=300)
+        refresher.start()
+        self.assertTrue(refreshed.wait(5))
+        refresher.stop()
+        refresher.join(5)
+        self.assertFalse(refresher.is_alive())
+        # The new token is valid for longer than the margin, no second refresh
+        auth_manager.refresh_access_token.assert_called_once_with("refresh")
+
+    def test_waits_while_token_valid(self):
+        auth_manager = self.make_auth_manager(make_token(3600))
+        refresher = TokenRefresher(auth_manager, margin=300)
+        refresher.start()
+        time.sleep(0.1)
+        refresher.stop()
+        refresher.join(5)
+        self.assertFalse(refresher.is_alive())
+        auth_manager.refresh_access_token.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import unittest
+from unittest import mock
+
+import deadline
+from governor import Governor
+from helpers import REQUEST_TIMEOUT
+from support import (
+    adaptive_polls,
+    build_timeline,
+    fixed_polls,
+    measure_polls,
+    playback_at,
+)
+from tasks.task_spotify_current_playback import (
+    BudgetSession,
+    SpotifyCurrentPlaybackTask,
+)
+
+
+class TestSpotifyAdaptivePolling(unittest.TestCase):
+    def test_adaptive_polling_vs_fixed_interval(self):
+        timeline = build_timeline()
+        fixed_calls, fixed_latency = measure_polls(fixed_polls(), timeline)
+        adaptive_calls, adaptive_latency = measure_polls(
+            adaptive_polls(timeline), timeline
+        )
+        self.assertLess(adaptive_calls, fixed_calls / 2)
+        self.assertLess(adaptive_latency, fixed_latency)
+
+    def test_idle_backoff(self):
+        task = SpotifyCurrentPlaybackTask()
+        intervals = [task.schedule_next_poll(None, now=0) for _ in range(8)]
+        self.assertEqual(intervals[:3], [10, 20, 40])
+        self.assertEqual(intervals[-1], 300)
+
+        # Playback resumes, back to polling by the track
+        data = playback_at(build_timeline(), 0)
+        self.assertEqual(task.schedule_next_poll(data, now=0), 60)
+        self.assertEqual(task.idle_polls, 0)
+
+    def test_poll_after_track_end(self):
+        task = SpotifyCurrentPlaybackTask()
+        data = {
+            "is_playing": True,
+            "progress_ms": 195000,
+            "item": {"id": "a", "duration_ms": 200000},
+        }
+        self.assertEqual(task.schedule_next_poll(data, now=0), 6)
+
+    def test_progress_interpolation_and_render_memo(self):
+        task = SpotifyCurrentPlaybackTask()
+        task.show_artist = False
+        task.track_name_first = True
+        task.cjk_to_initials = True
+        task.draw_album_art = False
+        task.fetched_at = 100.0
+        data = {
+            "is_playing": True,
+            "progress_ms": 50000,
+            "item": {"id": "a", "name": "中文", "duration_ms": 200000},
+        }
+
+        with mock.patch(
+            "tasks.task_spotify_current_playback.cjk_to_initials",
+            side_effect=lambda text: "ZW",
+        ) as convert:
+            message = task.create_mqtt_message(data)
+            task.create_mqtt_message(data)
+        self.assertEqual(convert.call_count, 1)
+        self.assertEqual(message["text"], "ZW")
+        self.assertEqual(message["progress"], 25)
+
+        with mock.patch("time.monotonic", return_value=150.0):
+            self.assertEqual(task.get_latest_message()["progress"], 50)
+        with mock.patch("time.monotonic", return_value=1000.0):
+            self.assertEqual(task.get_latest_message()["progress"], 100)
+
+        # Nothing playing, fall back to stored result
+        task.create_mqtt_message(None)
+        self.assertIsNone(task.get_latest_message())
+
+    def test_album_art_prefetch(self):
+        def track(track_id):
+            return {
+                "id": track_id,
+                "album": {
+                    "images": [
+                        {"url": f"{track_id}-640", "width": 640, "height": 640},
+                        {"url": f"{track_id}-64", "width": 64, "height": 64},
+                    ]
+                },
+            }
+
+        task = SpotifyCurrentPlaybackTask()
+        task.task_config = dict(task.task_config, prefetch_album_art=2)
+        client = mock.Mock()
+        client.queue.return_value = {"queue": [track("b"), track("c"), track("d")]}
+        task.get_client = mock.Mock(return_value=client)
+
+        with (
+            mock.patch(
+                "tasks.task_spotify_current_playback.get_governor",
+                return_value=Governor(1),
+            ),
+            mock.patch(
+                "tasks.task_spotify_current_playback.fetch_image_and_convert_to_base64",
+                return_value="base64",
+            ) as fetch,
+        ):
+            task.prefetch_album_art("a").result(5)
+            # Once per track
+            self.assertIsNone(task.prefetch_album_art("a"))
+
+        self.assertEqual(client.queue.call_count, 1)
+        # Shared with the poll, the prefetch thread leaves its settings alone
+        self.assertNotIn("requests_timeout", vars(client))
+        self.assertEqual(
+            [call.args[0] for call in fetch.call_args_list], ["b-64", "c-64"]
+        )
+
+    def test_requests_bounded_by_time_budget(self):
+        session = BudgetSession()
+        # No retry adapters: a retry or Retry-After sleep could outlast the budget
+        for adapter in session.adapters.values():
+            self.assertEqual(adapter.max_retries.total, 0)
+        with mock.patch("requests.Session.request") as request:
+            session.request("GET", "https://api.spotify.com/v1/me", timeout=5)
+            self.assertEqual(request.call_args.kwargs["timeout"], REQUEST_TIMEOUT)
+            with deadline.within(2):
+                session.request("GET", "https://api.spotify.com/v1/me", timeout=5)
+            self.assertLessEqual(request.call_args.kwargs["timeout"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import builtins
+import json
+import os
+import unittest
+from unittest import mock
+
+import config
+import storage
+from support import ConfigTestCase
+
+
+class TestResultTable(ConfigTestCase):
+    def setUp(self):
+        super().setUp()
+        self.store_dir = os.path.join(self.tmp_dir, "data")
+        os.makedirs(self.store_dir)
+        self.write_config(f"app:\n  store_dir: {json.dumps(self.store_dir)}\n")
+        with open(os.path.join(self.store_dir, "a.json"), "w") as f:
+            json.dump({"text": "1"}, f)
+
+        self.addCleanup(storage.clear)
+        storage.clear()
+
+    def count_opens(self, func):
+        """Run func and return how many files it opened"""
+        with mock.patch.object(builtins, "open", wraps=builtins.open) as opened:
+            func()
+        return opened.call_count
+
+    def test_steady_state_cycle_reads_no_files(self):
+        storage.preload(["a", "b"])
+
+        def cycle():
+            for _ in range(3):
+                config.get_config()
+                config.get_app_config()
+                self.assertEqual(storage.load("a"), {"text": "1"})
+                self.assertIsNone(storage.load("b"))
+                # Unchanged result, nothing written
+                storage.save("a", {"text": "1"})
+
+        self.assertEqual(self.count_opens(cycle), 0)
+
+    def test_write_through_on_change(self):
+        storage.preload(["a"])
+        opens = self.count_opens(lambda: storage.save("a", {"text": "2"}))
+        self.assertEqual(opens, 1)
+        self.assertEqual(storage.load("a"), {"text": "2"})
+        with open(os.path.join(self.store_dir, "a.json")) as f:
+            self.assertEqual(json.load(f), {"text": "2"})
+
+    def test_config_reloaded_when_changed(self):
+        self.assertNotIn("tasks", config.get_config())
+        with open(self.config_file, "a") as f:
+            f.write("tasks:\n  a:\n    interval: 5\n")
+        self.assertEqual(config.get_config()["tasks"]["a"]["interval"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
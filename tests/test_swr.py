@@ -0,0 +1,122 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+import swr
+from swr import Publisher, ResultStore
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+    def setUp(self):
+        self.sent = []
+        self.sent_event = threading.Event()
+
+        def send_message(name, payload):
+            self.sent.append((name, payload))
+            self.sent_event.set()
+
+        patcher = mock.patch.object(swr, "send_message", send_message)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.store = ResultStore()
+        self.publisher = Publisher(
+            self.store,
+            get_priorities=lambda: {"fast": 1, "slow": 2},
+            get_send_interval=lambda: 0,
+        )
+        self.publisher.start()
+        self.addCleanup(self.publisher.stop)
+
+    def wait_sent(self):
+        self.assertTrue(self.sent_event.wait(1))
+        self.sent_event.clear()
+
+    def test_fast_result_not_delayed_by_slow_fetch(self):
+        slow_done = threading.Event()
+
+        def slow_fetch():
+            slow_done.wait(1)
+            self.store.put("slow", {"text": "slow"})
+
+        threading.Thread(target=slow_fetch).start()
+        start = time.monotonic()
+        self.store.put("fast", {"text": "fast"})
+        self.wait_sent()
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(self.sent, [("fast", '{"text": "fast"}')])
+
+        slow_done.set()
+        self.wait_sent()
+        self.assertEqual(self.sent[-1][0], "slow")
+
+    def test_unchanged_result_not_sent_again(self):
+        self.assertTrue(self.store.put("fast", {"text": "1"}))
+        self.wait_sent()
+        self.assertFalse(self.store.put("fast", {"text": "1"}))
+        self.store.mark_all_changed()
+        self.wait_sent()
+        self.assertEqual(len(self.sent), 2)
+
+    def test_failed_send_does_not_stop_publishing(self):
+        def send_message(name, payload):
+            if name == "fast":
+                raise ConnectionRefusedError("broker down")
+            self.sent.append((name, payload))
+            self.sent_event.set()
+
+        with mock.patch.object(swr, "send_message", send_message):
+            self.store.put("fast", {"text": "fast"})
+            self.store.put("slow", {"text": "slow"})
+            self.wait_sent()
+            self.assertEqual(self.sent, [("slow", '{"text": "slow"}')])
+            self.assertTrue(self.publisher.is_alive())
+
+            self.store.put("slow", {"text": "again"})
+            self.wait_sent()
+            self.assertEqual(self.sent[-1], ("slow", '{"text": "again"}'))
+
+    def test_failed_send_is_retried(self):
+        failures = [ConnectionRefusedError("broker down")] * 2
+
+        def send_message(name, payload):
+            if failures:
+                raise failures.pop()
+            self.sent.append((name, payload))
+            self.sent_event.set()
+
+        with (
+            mock.patch.object(swr, "send_message", send_message),
+            mock.patch.object(swr, "RETRY_MIN", 0.05),
+        ):
+            start = time.monotonic()
+            self.store.put("slow", {"text": "slow"})
+            # Sent without a new result, after backing off 0.05 s then 0.1 s
+            self.wait_sent()
+            self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        self.assertEqual(self.sent, [("slow", '{"text": "slow"}')])
+
+    def test_dead_publisher_is_replaced(self):
+        self.assertIs(swr.ensure_running(self.publisher), self.publisher)
+        self.store.put("fast", {"text": "1"})
+        self.wait_sent()
+
+        dead = Publisher(
+            self.store, self.publisher.get_priorities, lambda: 0
+        )  # Never started
+        dead.pause()
+        replacement = swr.ensure_running(dead)
+        self.addCleanup(replacement.stop)
+        self.assertIsNot(replacement, dead)
+        self.assertTrue(replacement.is_alive())
+        self.assertTrue(replacement.paused.is_set())
+
+        # Stopped on purpose, not replaced
+        self.publisher.stop()
+        self.publisher.join(2)
+        self.assertIs(swr.ensure_running(self.publisher), self.publisher)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+import paho.mqtt.client as mqtt
+
+import config
+import transport
+from support import ConfigTestCase, HttpStandIn, MqttStandIn, wait_received
+from transport import HttpTransport, MqttTransport, create_transport
+
+
+class TestTransports(ConfigTestCase):
+    def test_http_keep_alive(self):
+        device = HttpStandIn()
+        self.addCleanup(device.close)
+        transport = HttpTransport("test", device.host)
+        for i in range(20):
+            transport.send(f"app{i}", json.dumps({"text": str(i)}))
+        transport.close()
+        self.assertEqual(len(device.received), 20)
+        self.assertEqual(device.received[3][1:], ("app3", '{"text": "3"}'))
+        self.assertEqual(device.connections, 1)
+
+    def test_http_newer_payload_replaces_queued(self):
+        device = HttpStandIn(delay=0.2)
+        self.addCleanup(device.close)
+        transport = HttpTransport("test", device.host)
+        transport.send("busy", "{}")
+        # First request is in flight, the next ones queue up
+        while not transport.busy:
+            time.sleep(0.001)
+        for i in range(5):
+            transport.send("clock", json.dumps({"text": str(i)}))
+        transport.close()
+        self.assertEqual(
+            [(name, payload) for _, name, payload in device.received],
+            [("busy", "{}"), ("clock", '{"text": "4"}')],
+        )
+
+    def test_mqtt_persistent_connection(self):
+        broker = MqttStandIn()
+        self.addCleanup(broker.close)
+        transport = MqttTransport("test", "127.0.0.1", broker.port, "awtrix/custom/")
+        transport.send("clock", "{}")
+        transport.send("weather", "")
+        self.assertTrue(wait_received(broker, 2))
+        transport.close()
+        self.assertEqual(
+            [(topic, payload) for _, topic, payload in broker.received],
+            [("awtrix/custom/clock", "{}"), ("awtrix/custom/weather", "")],
+        )
+        self.assertEqual(broker.connections, 1)
+
+    def test_mqtt_failed_publish_raises(self):
+        mqtt_transport = MqttTransport("test", "127.0.0.1", 1883, "awtrix/custom/")
+        mqtt_transport.client = mock.Mock()
+        mqtt_transport.client.publish.return_value = mock.Mock(rc=mqtt.MQTT_ERR_NO_CONN)
+        with self.assertRaises(ConnectionError):
+            mqtt_transport.send("clock", "{}")
+
+    def test_failing_device_does_not_block_others(self):
+        failing, working = mock.Mock(), mock.Mock()
+        failing.send.side_effect = ConnectionError("broker down")
+        with mock.patch.object(
+            transport, "get_transports", return_value=[failing, working]
+        ):
+            with self.assertRaises(ConnectionError):
+                transport.send_message("clock", "{}")
+        working.send.assert_called_once_with("clock", "{}")
+
+    def test_devices_config(self):
+        self.write_config(
+            "mqtt:\n  host: broker\n  username: user\n  password: pass\n"
+            "devices:\n  - name: desk\n    transport: http\n"
+            "    host: 192.168.1.50\n  - name: hall\n"
+        )
+        desk, hall = config.get_devices_config()
+        self.assertEqual((desk["host"], desk["username"]), ("192.168.1.50", ""))
+        self.assertEqual(hall["transport"], "mqtt")
+        self.assertEqual((hall["host"], hall["username"]), ("broker", "user"))
+        transport = create_transport(desk)
+        self.assertIsInstance(transport, HttpTransport)
+        transport.close()
+        with self.assertRaises(ValueError):
+            create_transport(dict(desk, transport="smoke"))
+
+
+if __name__ == "__main__":
+    unittest.main()
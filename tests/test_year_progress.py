@@ -0,0 +1,46 @@
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import tasks.task_year_progress as year_progress
+from tasks.task_year_progress import YearProgressTask
+
+
+def render_at(task, timestamp):
+    with mock.patch.object(year_progress, "datetime", wraps=datetime) as dt:
+        dt.now.return_value = datetime.fromtimestamp(timestamp)
+        return task.create_mqtt_message(task.fetch_data())
+
+
+class TestYearProgressSchedule(unittest.TestCase):
+    def test_runs_exactly_when_display_changes(self):
+        task = YearProgressTask()
+        now = datetime(2026, 10, 19, 12, 0).timestamp()
+        for _ in range(5):
+            next_change = task.get_next_change_time(now)
+            self.assertGreater(next_change, now)
+            # Nothing changes until the scheduled time, then it does
+            self.assertEqual(render_at(task, now), render_at(task, next_change - 0.02))
+            self.assertNotEqual(render_at(task, now), render_at(task, next_change))
+            now = next_change
+
+    def test_progress_bar_step(self):
+        task = YearProgressTask()
+        # Just before 49.5 %, the bar (not only the text) changes next
+        year_start, year_end = year_progress.get_year_bounds(2026)
+        total = (year_end - year_start).total_seconds()
+        now = year_start.timestamp() + total * 0.494999
+        next_change = task.get_next_change_time(now)
+        self.assertEqual(render_at(task, now)["progress"], 49)
+        self.assertEqual(render_at(task, next_change)["progress"], 50)
+
+    def test_end_of_year(self):
+        task = YearProgressTask()
+        now = datetime(2026, 12, 31, 23, 59, 59, 500000).timestamp()
+        next_change = task.get_next_change_time(now)
+        self.assertEqual(datetime.fromtimestamp(next_change).year, 2027)
+        self.assertEqual(render_at(task, next_change)["text"], "0.00 %")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+import abc
+import atexit
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from config import get_devices_config
+from log import logger
+
+HTTP_TIMEOUT = 5
+CLOSE_TIMEOUT = 5  # Seconds to wait for queued messages on exit
+PUBLISHED = object()
+
+
+class Transport(abc.ABC):
+    """Sends app payloads to one AWTRIX device"""
+
+    def __init__(self, name):
+        self.name = name
+
+    @abc.abstractmethod
+    def send(self, app_name, payload):
+        """Send the payload of a custom app (empty payload removes the app)
+        Raises:
+            ConnectionError: If the payload could not be handed to the device
+        """
+        pass
+
+    def close(self):
+        """Deliver what is still queued and release the connection"""
+        pass
+
+
+class MqttTransport(Transport):
+    """Publishes to <topic_prefix>/<app> over one persistent broker connection"""
+
+    def __init__(self, name, host, port, topic_prefix, username="", password=""):
+        super().__init__(name)
+        self.host = host
+        self.port = port
+        self.topic_prefix = topic_prefix.rstrip("/")
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.client = None
+        # mid -> monotonic time of the publish call (or PUBLISHED if the
+        # callback came first), guarded by an RLock as paho may call
+        # on_publish from inside publish()
+        self.published = {}
+        self.publish_lock = threading.RLock()
+        self.last_info = None
+
+    def get_client(self):
+        with self.lock:
+            if self.client is None:
+                client = mqtt.Client()
+                if self.username and self.password:
+                    client.username_pw_set(self.username, self.password)
+                client.on_publish = self.on_publish
+                client.connect(self.host, self.port, 60)
+                # Network loop thread, also reconnects after a connection loss
+                client.loop_start()
+                self.client = client
+            return self.client
+
+    def on_publish(self, client, userdata, mid):
+        with self.publish_lock:
+            sent_at = self.published.pop(mid, None)
+            if sent_at is None:
+                self.published[mid] = PUBLISHED
+                return
+        self.observe_latency(sent_at)
+
+    def observe_latency(self, sent_at):
+        metrics.observe(
+            f"transport.{self.name}.publish_latency", time.monotonic() - sent_at
+        )
+
+    def send(self, app_name, payload):
+        topic = f"{self.topic_prefix}/{app_name.strip('/')}"
+        client = self.get_client()
+        with self.publish_lock:
+            sent_at = time.monotonic()
+            info = client.publish(topic, payload)
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                metrics.incr(f"transport.{self.name}.errors")
+                raise ConnectionError(
+                    f"Failed to send {app_name} to {self.name}: "
+                    f"{mqtt.error_string(info.rc)}"
+                )
+            self.last_info = info
+            if self.published.pop(info.mid, None) is not PUBLISHED:
+                self.published[info.mid] = sent_at
+                return
+        self.observe_latency(sent_at)
+
+    def close(self):
+        with self.lock:
+            client, self.client = self.client, None
+        if client is None:
+            return
+        if self.last_info is not None:
+            try:
+                self.last_info.wait_for_publish(CLOSE_TIMEOUT)
+            except RuntimeError:
+                # Connection is gone, nothing left to deliver
+                pass
+        client.disconnect()
+        client.loop_stop()
+
+
+class HttpTransport(Transport):
+    """Posts to the device's /api/custom?name=<app> endpoint.
+    Messages are queued per device and sent by one worker over a keep-alive
+    connection, callers do not wait for the device. A newer payload of an
+    app that is still queued replaces the old one."""
+
+    def __init__(self, name, host, username="", password=""):
+        super().__init__(name)
+        if "://" not in host:
+            host = f"http://{host}"
+        self.url = f"{host.rstrip('/')}/api/custom"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if username and password:
+            self.session.auth = (username, password)
+        self.cond = threading.Condition()
+        self.pending = {}  # app -> (payload, monotonic time queued), in send order
+        self.busy = False
+        self.closed = False
+        self.worker = threading.Thread(
+            target=self.run, name=f"http-{name}", daemon=True
+        )
+        self.worker.start()
+
+    def send(self, app_name, payload):
+        with self.cond:
+            queued_at = self.pending.get(app_name, (None, time.monotonic()))[1]
+            self.pending[app_name] = (payload, queued_at)
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closed:
+                    self.cond.wait()
+                if not self.pending:
+                    return
+                app_name = next(iter(self.pending))
+                payload, queued_at = self.pending.pop(app_name)
+                self.busy = True
+            try:
+                response = self.session.post(
+                    self.url,
+                    params={"name": app_name},
+                    data=payload.encode("utf-8"),
+                    headers={"Content-Type": "application/json"},
+                    timeout=HTTP_TIMEOUT,
+                )
+                response.raise_for_status()
+                metrics.observe(
+                    f"transport.{self.name}.publish_latency",
+                    time.monotonic() - queued_at,
+                )
+            except requests.RequestException as e:
+                logger.error(
+                    "Failed to send %s to %s: %s",
+                    app_name,
+                    self.name,
+                    e,
+                    extra={"rate_key": f"{app_name}.send_error"},
+                )
+                metrics.incr(f"transport.{self.name}.errors")
+            finally:
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until everything queued has been sent
+        Returns:
+            bool: Whether the queue was drained in time
+        """
+        with self.cond:
+            return self.cond.wait_for(
+                lambda: not self.pending and not self.busy, timeout
+            )
+
+    def close(self):
+        self.flush(CLOSE_TIMEOUT)
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.worker.join(CLOSE_TIMEOUT)
+        self.session.close()
+
+
+def create_transport(device):
+    """Create the transport of a device from its config (see get_devices_config)"""
+    if device["transport"] == "mqtt":
+        return MqttTransport(
+            device["name"],
+            device["host"],
+            device["port"],
+            device["topic_prefix"],
+            device["username"],
+            device["password"],
+        )
+    if device["transport"] == "http":
+        return HttpTransport(
+            device["name"], device["host"], device["username"], device["password"]
+        )
+    raise ValueError(f"Unknown transport {device['transport']} of {device['name']}")
+
+
+_lock = threading.Lock()
+_transports = []
+_devices = None
+
+
+def get_transports():
+    """Get the transports of all devices, rebuilt when the device config changes"""
+    global _transports, _devices
+    devices = get_devices_config()
+    with _lock:
+        if devices != _devices:
+            for transport in _transports:
+                transport.close()
+            _transports = [create_transport(device) for device in devices]
+            _devices = devices
+        return list(_transports)
+
+
+def send_message(app_name, payload):
+    """Send an app payload to all devices
+    Raises:
+        Exception: The first error of a device, after trying all of them
+    """
+    error = None
+    for transport in get_transports():
+        try:
+            transport.send(app_name, payload)
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+
+
+@atexit.register
+def close_transports():
+    """Deliver queued messages and close all connections"""
+    global _transports, _devices
+    with _lock:
+        for transport in _transports:
+            transport.close()
+        _transports = []
+        _devices = None